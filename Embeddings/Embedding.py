@@ -24,3 +24,8 @@ class Embeddings(ABC):
         """Return a dictionary containing the question and its embedding vector."""
         pass
 
+    @abstractmethod
+    def embedding_batch(self, questions: List[str]) -> List[Dict[str, any]]:
+        """Embed several inputs in one request, returning one dictionary per input in order."""
+        pass
+
@@ -0,0 +1,176 @@
+import json
+import math
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+ENCODER_NAME = "bm25-hash-v1"
+
+TAG_PATTERN = re.compile(r"</?\s*\w+(?:\s*[^>]*)?>")
+TITLE_MARKER_PATTERN = re.compile(r"\{\[.*?\]\}")
+LINK_PATTERN = re.compile(r"\bhttps?://\S+|localhost:\S+")
+TERM_PATTERN = re.compile(r"[a-z0-9]+(?:[-.][a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers
+him his how i if in into is it its itself just me more most my no nor not now of off on once only or other our
+ours out over own same she should so some such than that the their theirs them then there these they this those
+through to too under until up very was we were what when where which while who whom why will with would you your
+""".split())
+
+
+def sparse_terms(text: str) -> List[str]:
+    """Terms of a chunk or query with extraction tags, image links and stopwords removed."""
+    text = TITLE_MARKER_PATTERN.sub(" ", TAG_PATTERN.sub(" ", text))
+    text = LINK_PATTERN.sub(" ", text.lower())
+    return [term for term in TERM_PATTERN.findall(text) if term not in STOPWORDS and len(term) > 1]
+
+
+def term_index(term: str) -> int:
+    """Stable 31-bit sparse index for a term, the same in every process."""
+    return zlib.crc32(term.encode("utf-8")) & 0x7FFFFFFF
+
+
+class BM25SparseEncoder:
+    """
+    Local replacement for pinecone-sparse-english-v0. Terms are hashed to sparse indices and
+    weighted with BM25: document vectors carry the length-normalised term frequencies and
+    query vectors the IDF weights, so their dot product in the index is the BM25 score.
+
+    Corpus statistics (document count, average length, document frequencies) are fitted per
+    namespace at ingest time and saved to `{stats_dir}/{namespace}.json`. A namespace without
+    a stats file was ingested with the Pinecone model and must keep being queried with it.
+    """
+
+    def __init__(self, stats_dir: str = "Pinecone/sparse_stats", k1: float = 1.2, b: float = 0.75):
+        self.stats_dir = stats_dir
+        self.k1 = k1
+        self.b = b
+        self._loaded: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def stats_path(self, namespace: str) -> str:
+        return os.path.join(self.stats_dir, f"{namespace}.json")
+
+    def has_stats(self, namespace: str) -> bool:
+        return os.path.isfile(self.stats_path(namespace))
+
+    def fit(self, texts: Iterable[str]) -> Dict[str, Any]:
+        """Corpus statistics of a namespace's chunks."""
+        document_frequency: Counter = Counter()
+        documents = 0
+        total_length = 0
+        for text in texts:
+            terms = sparse_terms(text)
+            documents += 1
+            total_length += len(terms)
+            document_frequency.update({term_index(term) for term in terms})
+        return {
+            "encoder": ENCODER_NAME,
+            "k1": self.k1,
+            "b": self.b,
+            "documents": documents,
+            "average_length": total_length / documents if documents else 0.0,
+            "document_frequency": dict(document_frequency),
+        }
+
+    @staticmethod
+    def documents_changed(previous: Optional[Dict[str, Any]], stats: Dict[str, Any]) -> bool:
+        """
+        Whether stored document vectors encoded with `previous` differ from ones encoded
+        with `stats`. Document vectors depend only on k1, b and the average length; the
+        document frequencies are applied to queries, so they can change freely.
+        """
+        if previous is None:
+            return True
+        return any(previous.get(key) != stats.get(key) for key in ("encoder", "k1", "b", "average_length"))
+
+    def save(self, namespace: str, stats: Dict[str, Any]) -> None:
+        os.makedirs(self.stats_dir, exist_ok=True)
+        path = self.stats_path(namespace)
+        with open(path + ".tmp", "w") as json_file:
+            json.dump(stats, json_file)
+        os.replace(path + ".tmp", path)
+
+    def forget(self, namespace: str) -> None:
+        """Drops a namespace's stats so it is queried with the Pinecone model again."""
+        if self.has_stats(namespace):
+            os.remove(self.stats_path(namespace))
+        with self._lock:
+            self._loaded.pop(namespace, None)
+
+    def load(self, namespace: str) -> Optional[Dict[str, Any]]:
+        """Saved stats of a namespace, re-read only when the file changes."""
+        path = self.stats_path(namespace)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._loaded.get(namespace)
+            if cached and cached[0] == mtime:
+                return cached[1]
+        with open(path, "r") as json_file:
+            stats = json.load(json_file)
+        stats["document_frequency"] = {int(index): df for index, df in stats["document_frequency"].items()}
+        with self._lock:
+            self._loaded[namespace] = (mtime, stats)
+        return stats
+
+    def encode_documents(self, texts: List[str], stats: Dict[str, Any]) -> List[Dict[str, List]]:
+        """
+        Returns:
+            list: One {"indices", "values", "tokens"} dict per text, in the shape
+                PineconeDatabase.upsert takes.
+        """
+        average_length = stats["average_length"] or 1.0
+        vectors = []
+        for text in texts:
+            terms = sparse_terms(text)
+            norm = self.k1 * (1 - self.b + self.b * len(terms) / average_length)
+            counts = Counter(terms)
+            weights: Dict[int, float] = {}
+            for term, frequency in counts.items():
+                index = term_index(term)
+                weights[index] = weights.get(index, 0.0) + frequency * (self.k1 + 1) / (frequency + norm)
+            vectors.append({
+                "indices": list(weights),
+                "values": list(weights.values()),
+                "tokens": list(counts),
+            })
+        return vectors
+
+    def encode_query(self, namespace: str, text: str, weight: float = 0.5) -> Optional[Dict[str, List]]:
+        """
+        IDF-weighted query vector, normalised to sum to `weight` so the sparse score stays on
+        a scale comparable to the dense cosine score.
+
+        Returns:
+            dict: {"indices", "values", "tokens"}, or None when the namespace has no local stats.
+        """
+        stats = self.load(namespace)
+        if stats is None:
+            return None
+
+        documents = stats["documents"]
+        document_frequency = stats["document_frequency"]
+        weights: Dict[int, float] = {}
+        tokens = []
+        for term, frequency in Counter(sparse_terms(text)).items():
+            index = term_index(term)
+            df = document_frequency.get(index)
+            if not df:
+                continue  # No chunk in the namespace contains the term
+            weights[index] = weights.get(index, 0.0) + frequency * math.log(1 + (documents - df + 0.5) / (df + 0.5))
+            tokens.append(term)
+
+        total = sum(weights.values())
+        return {
+            "indices": list(weights),
+            "values": [value / total * weight for value in weights.values()] if total else [],
+            "tokens": tokens,
+        }
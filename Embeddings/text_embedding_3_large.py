@@ -46,6 +46,18 @@ class text_embedding_3_large_openAI(Embeddings):
         self.logger.debug(f"Received embedding: {embedding[:10]}...")  #Logs the first 10 values for brevity
         return {"Question": question, "Embedding": embedding}
 
+    def embedding_batch(self, questions: List[str]) -> List[Dict[str, Any]]:
+        self.logger.debug(f"Generating embeddings for a batch of {len(questions)} inputs")
+
+        response = client.embeddings.create(
+            input=questions,
+            model=self.get_model_name()
+        )
+
+        # The API returns one item per input, each tagged with its input index
+        embeddings = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        return [{"Question": question, "Embedding": embedding} for question, embedding in zip(questions, embeddings)]
+
     def format_representations(self) -> str:
         representation = f"Embeddings(model_name={self.get_model_name()}, dimensions={self.get_dimensions()})"
         self.logger.debug(f"Representation: {representation}")
@@ -0,0 +1,94 @@
+from collections import Counter
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, TypeVar
+
+try:
+    import tiktoken
+except ImportError:  # Fall back to a character estimate when tiktoken is not installed
+    tiktoken = None
+
+# text-embedding-3-large tokenizes with the cl100k_base vocabulary
+ENCODING_NAME = "cl100k_base"
+
+# OpenAI embedding endpoint limits
+MAX_INPUT_TOKENS = 8191
+MAX_BATCH_TOKENS = 300_000
+MAX_BATCH_INPUTS = 2048
+
+T = TypeVar("T")
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(ENCODING_NAME)
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=65536)
+def count_tokens(text: str) -> int:
+    """Token count of text under the embedding model's tokenizer, cached per distinct string."""
+    encoding = _get_encoding()
+    if encoding is None:
+        return max(1, len(text) // 4)  # Roughly 4 characters per token for English text
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int = MAX_INPUT_TOKENS) -> str:
+    """Cuts text down to at most max_tokens tokens, the embedding endpoint rejects longer inputs."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def pack_by_tokens(items: Iterable[T], text_of: Callable[[T], str] = str,
+                   max_batch_tokens: int = MAX_BATCH_TOKENS,
+                   max_batch_inputs: int = MAX_BATCH_INPUTS) -> Iterator[List[T]]:
+    """
+    Greedily packs items, in order, into the largest batches that stay under both the
+    per-request token limit and the per-request input count. Works on lazy iterables.
+
+    Items longer than MAX_INPUT_TOKENS are not cut (use truncate_to_tokens first); each is
+    sent in a batch of its own so the request it fails does not take other items with it.
+    """
+    batch: List[T] = []
+    batch_tokens = 0
+    for item in items:
+        tokens = count_tokens(text_of(item))
+        oversize = tokens > MAX_INPUT_TOKENS
+        if batch and (oversize or batch_tokens + tokens > max_batch_tokens or len(batch) >= max_batch_inputs):
+            yield batch
+            batch, batch_tokens = [], 0
+        if oversize:
+            yield [item]
+            continue
+        batch.append(item)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def token_histogram(texts: Iterable[str], bucket_size: int = 64) -> Dict[int, int]:
+    """Number of texts per token-count bucket, keyed by the bucket's lower bound."""
+    histogram = Counter(count_tokens(text) // bucket_size * bucket_size for text in texts)
+    return dict(sorted(histogram.items()))
+
+
+def format_token_histogram(texts: List[str], bucket_size: int = 64, width: int = 40) -> str:
+    counts = [count_tokens(text) for text in texts]
+    if not counts:
+        return "no chunks"
+    histogram = token_histogram(texts, bucket_size)
+    peak = max(histogram.values())
+    lines = [f"{len(counts)} chunks, {sum(counts)} tokens, min={min(counts)} max={max(counts)} "
+             f"mean={sum(counts) / len(counts):.0f}"]
+    for bucket, count in histogram.items():
+        bar = '#' * max(1, round(count / peak * width))
+        lines.append(f"{bucket:>6}-{bucket + bucket_size - 1:<6} {count:>5} {bar}")
+    return "\n".join(lines)
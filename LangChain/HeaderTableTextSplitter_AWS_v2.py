@@ -1,22 +1,50 @@
+import argparse
+import glob
+import os
 import re
+import time
 from langchain.text_splitter import TextSplitter
-from typing import List, Optional
+from typing import Iterable, Iterator, List, Optional
 import logging
 
+from Embeddings.tokenizer import count_tokens, format_token_histogram
+
+
+SPLIT_PATTERN = re.compile(r'(?=<HEADING[^>]*?>)|(?=<BOLD[^>]*?>)', flags=re.DOTALL)
+TAG_WITH_NUMBER_PATTERN = re.compile(r'<(BOLD|HEADING)[^>]*>\s*\d+\s*</\1>', flags=re.IGNORECASE)
+TABLE_START_PATTERN = re.compile(r'<TABLE EXTRACT \(TABLE NUMBER = \d+, PAGE NUMBER = \d+\)>')
+TABLE_END = "<TABLE EXTRACT />"
+
 
 class HeaderTableTextSplitter(TextSplitter):
+    """
+    Splits tagged extraction output before <HEADING>/<BOLD> tags. Sizes are measured in
+    characters by default; with token_budget set they are measured in embedding-model
+    tokens, token_budget becomes the hard cap per chunk and minimum_content_tokens the
+    length at which a chunk is emitted.
+    """
+
     def __init__(
         self,
         target_chunk_size: int = 1000,
         debug: bool = False,
         minimum_content_length: int = 300,
         max_chunk_size: Optional[int] = None,
+        token_budget: Optional[int] = None,
+        minimum_content_tokens: int = 75,
     ):
-        super().__init__(chunk_size=target_chunk_size)
-        self.target_chunk_size = target_chunk_size
+        self.token_budget = token_budget
+        if token_budget:
+            super().__init__(chunk_size=token_budget, chunk_overlap=0, length_function=count_tokens)
+            self.target_chunk_size = token_budget
+            self.minimum_content_length = minimum_content_tokens
+            self.max_chunk_size = token_budget
+        else:
+            super().__init__(chunk_size=target_chunk_size)
+            self.target_chunk_size = target_chunk_size
+            self.minimum_content_length = minimum_content_length
+            self.max_chunk_size = max_chunk_size if max_chunk_size else int(target_chunk_size * 1.5)
         self.debug = debug
-        self.minimum_content_length = minimum_content_length
-        self.max_chunk_size = max_chunk_size if max_chunk_size else int(target_chunk_size * 1.5)
         if self.debug:
             logging.basicConfig(level=logging.DEBUG, format="%(levelname)s: %(message)s")
 
@@ -29,70 +57,227 @@ class HeaderTableTextSplitter(TextSplitter):
         :return: True if it contains a tag with a number, False otherwise.
         """
         snippet = segment[:55]
-        pattern = r'<(BOLD|HEADING)[^>]*>\s*\d+\s*</\1>'
-        match = re.search(pattern, snippet, flags=re.IGNORECASE)
+        match = TAG_WITH_NUMBER_PATTERN.search(snippet)
         if self.debug:
             logging.debug(f"Checking for tag with number in snippet: {snippet}")
             logging.debug(f"Tag with number found: {bool(match)}")
         return bool(match)
 
-    def split_text(self, text: str) -> List[str]:
-        if self.debug:
-            logging.debug("Starting text splitting process.")
-
-        # Define regex pattern for splitting text before <HEADING> or <BOLD> tags
-        split_pattern = r'(?=<HEADING[^>]*?>)|(?=<BOLD[^>]*?>)'
-
+    def _split_segments(self, text: str) -> List[str]:
         # Split the text at positions before a <HEADING> or <BOLD> tag
-        segments = re.split(split_pattern, text, flags=re.DOTALL)
+        segments = SPLIT_PATTERN.split(text)
 
         # Filter out empty strings
-        segments = [seg.strip() for seg in segments if seg.strip()]
+        return [seg.strip() for seg in segments if seg.strip()]
 
-        if self.debug:
-            logging.debug(f"Total segments identified: {len(segments)}")
+    def _segment_units(self, segment: str) -> List[str]:
+        """
+        Breaks a segment into the smallest pieces it may be split at: single lines, except
+        that a whole <TABLE EXTRACT> ... <TABLE EXTRACT /> block is kept as one unit.
+        """
+        units: List[str] = []
+        table_lines: List[str] = []
+        for line in segment.split("\n"):
+            stripped_line = line.strip()
+            if table_lines:
+                table_lines.append(line)
+                if stripped_line == TABLE_END:
+                    units.append("\n".join(table_lines))
+                    table_lines = []
+            elif TABLE_START_PATTERN.match(stripped_line):
+                table_lines = [line]
+            else:
+                units.append(line)
+        if table_lines:
+            units.append("\n".join(table_lines))  # Unterminated table, keep it whole
+        return units
 
-        chunks: List[str] = []
+    def _split_table(self, table_block: str) -> List[str]:
+        """
+        Splits a table block that is over max_chunk_size into row groups. Every piece is a
+        complete <TABLE EXTRACT> block of its own: it repeats the TABLE NUMBER/PAGE NUMBER
+        tag, the header row and the table image line, so each piece can be retrieved alone.
+        """
+        lines = table_block.split("\n")
+        open_tag = lines[0]
+        has_close = lines[-1].strip() == TABLE_END
+        body = lines[1:-1] if has_close else lines[1:]
+        rows = [line for line in body if line.strip().startswith("[")]
+        trailer = [line for line in body if not line.strip().startswith("[")]
+        if len(rows) < 2:
+            return [table_block]
+
+        header, data_rows = rows[:1], rows[1:]
+        frame = [open_tag, *header]
+        closing = trailer + ([lines[-1]] if has_close else [])
+        overhead = sum(self._length_function(line) + 1 for line in frame + closing)
+
+        pieces: List[str] = []
+        group: List[str] = []
+        group_len = 0
+        for row in data_rows:
+            row_len = self._length_function(row) + 1
+            if group and overhead + group_len + row_len > self.max_chunk_size:
+                pieces.append("\n".join(frame + group + closing))
+                group, group_len = [], 0
+            group.append(row)
+            group_len += row_len
+        if group:
+            pieces.append("\n".join(frame + group + closing))
+        return pieces
+
+    def _fit_segment(self, segment: str) -> Iterator[str]:
+        """
+        Yields the segment unchanged when it fits in max_chunk_size, otherwise packs its
+        lines and table blocks into pieces no longer than max_chunk_size. Tables over the
+        limit are split into row groups; a single line over the limit is yielded on its own.
+        """
+        if self._length_function(segment) <= self.max_chunk_size:
+            yield segment
+            return
+
+        units: List[str] = []
+        for unit in self._segment_units(segment):
+            if TABLE_START_PATTERN.match(unit.strip()) and self._length_function(unit) > self.max_chunk_size:
+                units.extend(self._split_table(unit))
+            else:
+                units.append(unit)
+
+        piece: List[str] = []
+        piece_len = 0
+        for unit in units:
+            unit_len = self._length_function(unit)
+            if piece and piece_len + 1 + unit_len > self.max_chunk_size:
+                yield "\n".join(piece).strip()
+                piece, piece_len = [], 0
+            piece_len += unit_len + (1 if piece else 0)
+            piece.append(unit)
+        if piece:
+            yield "\n".join(piece).strip()
+
+    def _merge_segments(self, segments: Iterable[str]) -> Iterator[str]:
         current_chunk: List[str] = []
+        current_len = 0  # Size of "\n".join(current_chunk), kept up to date as pieces are added
+        total_chunks = 0
 
         for idx, segment in enumerate(segments):
             if self.debug:
                 snippet = (segment[:50] + '...') if len(segment) > 50 else segment
                 logging.debug(f"Processing segment {idx + 1}: {snippet}")
 
-            # Check if the segment starts with a tag containing a number
-            if self.is_tag_with_number(segment):
-                # Merge the segment with the previous chunk
-                if self.debug:
-                    logging.debug("Merging segment with previous chunk due to tag with number.")
-                current_chunk.append(segment)
-                continue
-
-            # Add the current segment to the chunk
-            current_chunk.append(segment)
-
-            # Check if the combined chunk meets the minimum content length
-            combined_chunk = "\n".join(current_chunk)
-            if len(combined_chunk) >= self.minimum_content_length:
-                # Emit the combined chunk
-                chunks.append(combined_chunk.strip())
-                if self.debug:
-                    logging.debug(f"Emitting chunk: {combined_chunk[:50]}...")
-                # Reset current_chunk
-                current_chunk = []
+            # A segment that starts with a tag containing a number is merged with what follows
+            merge_with_next = self.is_tag_with_number(segment)
+            if merge_with_next and self.debug:
+                logging.debug("Merging segment with previous chunk due to tag with number.")
+
+            for piece_idx, piece in enumerate(self._fit_segment(segment)):
+                if not piece:
+                    continue
+                piece_len = self._length_function(piece)
+
+                # Close the current chunk rather than grow it past max_chunk_size
+                if current_chunk and current_len + 1 + piece_len > self.max_chunk_size:
+                    total_chunks += 1
+                    if self.debug:
+                        logging.debug(f"Emitting chunk at max size: {current_len}")
+                    yield "\n".join(current_chunk)
+                    current_chunk, current_len = [], 0
+
+                current_len += piece_len + (1 if current_chunk else 0)
+                current_chunk.append(piece)
+
+                if merge_with_next and piece_idx == 0:
+                    continue
+
+                # Check if the combined chunk meets the minimum content length
+                if current_len >= self.minimum_content_length:
+                    total_chunks += 1
+                    if self.debug:
+                        logging.debug(f"Emitting chunk: {current_chunk[0][:50]}...")
+                    yield "\n".join(current_chunk)
+                    current_chunk, current_len = [], 0
 
         # Finalize any remaining content in the current chunk
         if current_chunk:
-            final_chunk = "\n".join(current_chunk).strip()
-            if final_chunk:
-                chunks.append(final_chunk)
-                if self.debug:
-                    logging.debug(f"Emitting final chunk: {final_chunk[:50]}...")
+            total_chunks += 1
+            if self.debug:
+                logging.debug(f"Emitting final chunk: {current_chunk[0][:50]}...")
+            yield "\n".join(current_chunk)
 
         if self.debug:
-            logging.debug(f"Total chunks created: {len(chunks)}")
+            logging.debug(f"Total chunks created: {total_chunks}")
+
+    def iter_chunks(self, text: str) -> Iterator[str]:
+        """
+        Splits text in a single pass, yielding chunks as they are completed.
+
+        :param text: The tagged text produced by the extraction step.
+        :return: Generator of chunks, none longer than max_chunk_size unless a single
+            table block or line is.
+        """
+        if self.debug:
+            logging.debug("Starting text splitting process.")
+
+        segments = self._split_segments(text)
+
+        if self.debug:
+            logging.debug(f"Total segments identified: {len(segments)}")
+
+        return self._merge_segments(segments)
+
+    def split_text(self, text: str) -> List[str]:
+        return list(self.iter_chunks(text))
+
+    def token_report(self, chunks: List[str], bucket_size: int = 64) -> str:
+        """Token histogram of a document's chunks under the embedding model's tokenizer."""
+        return format_token_histogram(chunks, bucket_size)
+
+    def split_pages(self, pages: Iterable[str]) -> Iterator[str]:
+        """
+        Splits page texts as they arrive, yielding each chunk as soon as it is complete.
+        The last segment of a page is held back, unstripped, because it can continue on the
+        next page; the page join keeps its whitespace, as in the joined text.
+
+        :param pages: Iterable of page texts in reading order, e.g. from a page stream.
+        :return: Generator of chunks, identical to split_text on the pages joined with "\n".
+        """
+        def stream_segments() -> Iterator[str]:
+            pending = None
+            for page in pages:
+                pending = page if pending is None else f"{pending}\n{page}"
+                pieces = SPLIT_PATTERN.split(pending)
+                pending = pieces.pop()
+                for piece in pieces:
+                    if piece.strip():
+                        yield piece.strip()
+            if pending is not None and pending.strip():
+                yield pending.strip()
+
+        return self._merge_segments(stream_segments())
+
+
+def benchmark(outputs_dir: str = '../PDF_Extraction/AWS_Textract/Outputs', repeat: int = 20) -> None:
+    """Times the splitter on the largest extracted text file and reports chunk size stats."""
+    files = glob.glob(os.path.join(outputs_dir, '*.txt'))
+    if not files:
+        print(f"No .txt files found in {outputs_dir}")
+        return
+    file_path = max(files, key=os.path.getsize)
+    with open(file_path, 'r', encoding='utf-8') as file:
+        text = file.read()
+
+    splitter = HeaderTableTextSplitter()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        chunks = splitter.split_text(text)
+    elapsed = (time.perf_counter() - start) / repeat
 
-        return chunks
+    lengths = [len(chunk) for chunk in chunks]
+    oversized = sum(1 for length in lengths if length > splitter.max_chunk_size)
+    print(f"{os.path.basename(file_path)}: {len(text)} chars -> {len(chunks)} chunks in {elapsed * 1000:.2f} ms")
+    print(f"chunk length min={min(lengths)} max={max(lengths)} mean={sum(lengths) / len(lengths):.0f} "
+          f"over max_chunk_size={oversized}")
+    print(splitter.token_report(chunks))
 
 
 def main():
@@ -120,4 +305,10 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Split extracted label and SDS text into chunks.")
+    parser.add_argument("--benchmark", action="store_true", help="Time the splitter on the largest Outputs/*.txt.")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark()
+    else:
+        main()
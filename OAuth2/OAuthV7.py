@@ -1,8 +1,7 @@
-from fastapi import FastAPI, Request, HTTPException, Depends, status
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi import FastAPI, Request, HTTPException, Depends, status, WebSocket, WebSocketDisconnect
+from fastapi.responses import RedirectResponse, JSONResponse, Response
 from fastapi.security import OAuth2PasswordBearer
 from msal import ConfidentialClientApplication
-import aiofiles
 import json
 import uvicorn
 import asyncio
@@ -13,6 +12,27 @@ from dotenv import load_dotenv
 import pathlib
 import logging
 import uuid
+import sys
+
+# Run from this directory (python OAuthV7.py, or uvicorn OAuthV7:app --port 1992), next to
+# token_store, signed_tokens, file_server and the certificates. The repository root is
+# put on the path for the shared OpenAI_API, VectorDatabase and Embeddings packages.
+REPO_DIR = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_DIR) not in sys.path:
+    sys.path.insert(0, str(REPO_DIR))
+
+from token_store import create_token_store, user_key
+from signed_tokens import RevocationList, TokenError, issue_token, verify_token
+from file_server import FileServer, SmallFileCache
+from OpenAI_API.summaries import SummaryStore
+from OpenAI_API.search import HybridSearch, InvalidCursor, server_timing
+from OpenAI_API.query_cache import NamespaceVersions
+from OpenAI_API.namespace_catalog import NamespaceCatalog
+from OpenAI_API.utils import pinecone_sparse_query
+from VectorDatabase.Pinecone import PineconeDatabase
+from Embeddings.text_embedding_3_large import text_embedding_3_large_openAI
+from Embeddings.sparse_encoder import BM25SparseEncoder
+from pinecone import Pinecone
 
 load_dotenv()
 CLIENT_ID = os.getenv("CLIENT_ID")
@@ -30,88 +50,110 @@ msal_app = ConfidentialClientApplication(
     authority=AUTHORITY
 )
 
-# Define an asyncio lock for file operations
-file_lock = asyncio.Lock()
-
 TOKEN_STORE_FILE = 'tokens_v7.json'
 
-async def read_token_store() -> Dict[str, Dict]:
-    """Read the token_store from the JSON file."""
-    async with file_lock:
-        try:
-            async with aiofiles.open(TOKEN_STORE_FILE, 'r') as f:
-                data = await f.read()
-                token_store = json.loads(data)
-                return token_store
-        except FileNotFoundError:
-            return {}
-        except json.JSONDecodeError:
-            return {}
-
-async def write_token_store(token_store: Dict[str, Dict]):
-    """Write the token_store to the JSON file."""
-    async with file_lock:
-        async with aiofiles.open(TOKEN_STORE_FILE, 'w') as f:
-            data = json.dumps(token_store)
-            await f.write(data)
+# Tokens live in memory; "json" rewrites TOKEN_STORE_FILE and is single-process only,
+# "sqlite" writes only changed rows and is shared by every worker on the machine
+token_store = create_token_store(
+    TOKEN_STORE_FILE,
+    backend=os.getenv("TOKEN_STORE_BACKEND", "json"),
+    flush_interval=float(os.getenv("TOKEN_STORE_FLUSH_INTERVAL", "1.0"))
+)
+
+# "opaque": random tokens looked up in the token store. "signed": HS256 tokens that every
+# worker sharing TOKEN_SIGNING_SECRET validates in CPU, with a revocation list for logout
+TOKEN_MODE = os.getenv("TOKEN_MODE", "opaque")
+TOKEN_SIGNING_SECRET = os.getenv("TOKEN_SIGNING_SECRET", "").encode("utf-8")
+if TOKEN_MODE == "signed" and len(TOKEN_SIGNING_SECRET) < 32:
+    raise RuntimeError("TOKEN_MODE=signed needs a TOKEN_SIGNING_SECRET of at least 32 bytes.")
+revocations = RevocationList('revoked_v7.json')
+# How often workers pick up logouts made on other workers (signed mode, or a shared token store)
+REVOCATION_RELOAD_INTERVAL = 5
 
 async def add_backend_token(user_info: Dict, expires_in: int) -> str:
     """Generate a backend token, store it with user info and expiration."""
+    if TOKEN_MODE == "signed":
+        token_stats["added"] += 1
+        return issue_token(user_info, expires_in, TOKEN_SIGNING_SECRET, user_key(user_info))
+
     token = str(uuid.uuid4())
     expiration_time = time.time() + expires_in
-    token_store = await read_token_store()
-    token_store[token] = {
+    await token_store.issue(token, {
         "expiration": expiration_time,
         "user": user_info
-    }
-    await write_token_store(token_store)
+    })
     logger.info(f"Backend Token added: {token[:10]}... Expires in: {expires_in} seconds")
-    await print_current_tokens()
+    token_stats["added"] += 1
     return token
 
+# Token activity since the last summary, logged as counts instead of one line per token
+token_stats = {"added": 0, "expired": 0, "logged_out": 0}
+TOKEN_STATS_INTERVAL = 60
+
 async def remove_expired_tokens():
     """Remove tokens that have expired."""
-    current_time = time.time()
-    token_store = await read_token_store()
-    expired_tokens = [token for token, info in token_store.items() if info["expiration"] < current_time]
-    for token in expired_tokens:
-        del token_store[token]
-        logger.info(f"Token expired and removed: {token[:10]}...")
-    if expired_tokens:
-        await write_token_store(token_store)
-        await print_current_tokens()
-
-async def print_current_tokens():
-    """Print the current token store."""
-    token_store = await read_token_store()
-    logger.info("Current Token Store:")
-    for token, info in token_store.items():
-        remaining = int(info["expiration"] - time.time())
-        if remaining > 0:
-            logger.info(f"Token: {token[:10]}..., Expires in: {remaining} seconds")
-        else:
-            logger.info(f"Token: {token[:10]}..., Expired")
+    token_stats["expired"] += len(token_store.remove_expired())
+
+def print_current_tokens():
+    """Log the size of the token store and what changed since the last summary."""
+    logger.info(f"Token store: {len(token_store)} active tokens for {token_store.user_count()} users; "
+                f"last {TOKEN_STATS_INTERVAL}s: {token_stats['added']} added, {token_stats['expired']} expired, "
+                f"{token_stats['logged_out']} logged out")
+    for key in token_stats:
+        token_stats[key] = 0
 
 async def token_cleanup_task():
-    """Background task to clean up expired tokens every 60 seconds."""
+    """Background task that removes tokens as they expire, driven by the expiry heap."""
+    last_summary = time.monotonic()
+    last_sync = time.monotonic()
     while True:
         await remove_expired_tokens()
-        await asyncio.sleep(60)  # Run cleanup every 60 seconds
+        if TOKEN_MODE == "signed":
+            await asyncio.to_thread(revocations.reload)
+            await asyncio.to_thread(revocations.purge)
+        elif token_store.shared and time.monotonic() - last_sync >= REVOCATION_RELOAD_INTERVAL:
+            try:
+                await token_store.sync()
+            except Exception as e:
+                logger.error(f"Token store sync failed, will retry: {e}")
+            last_sync = time.monotonic()
+        if time.monotonic() - last_summary >= TOKEN_STATS_INTERVAL:
+            if any(token_stats.values()):
+                print_current_tokens()
+            last_summary = time.monotonic()
+
+        # Sleep until the next token is due, checking at least once per summary interval
+        next_expiration = token_store.next_expiration()
+        delay = TOKEN_STATS_INTERVAL if next_expiration is None else next_expiration - time.time()
+        if TOKEN_MODE == "signed" or token_store.shared:
+            delay = min(delay, REVOCATION_RELOAD_INTERVAL)
+        await asyncio.sleep(min(max(delay, 0.1), TOKEN_STATS_INTERVAL))
+
+# Namespaces.json is the single namespace list, watched for changes pushed to /ws/namespaces
+namespace_catalog = NamespaceCatalog(
+    str(REPO_DIR / "PDF_Extraction" / "AWS_Textract" / "Inputs" / "Namespaces.json")
+)
 
 async def lifespan(app: FastAPI):
     """Lifespan event handler for startup and shutdown."""
-    # Startup: Start the token cleanup background task
+    # Startup: Load the token store and start the token cleanup and catalog watch tasks
+    await token_store.start()
     cleanup_task = asyncio.create_task(token_cleanup_task())
+    catalog_task = asyncio.create_task(namespace_catalog.watch())
     logger.info("Application startup: Token cleanup task started.")
 
     yield  # Control passes to the application
 
-    # Shutdown: Cancel the background task
-    cleanup_task.cancel()
-    try:
-        await cleanup_task
-    except asyncio.CancelledError:
-        logger.info("Application shutdown: Token cleanup task canceled.")
+    # Shutdown: Cancel the background tasks
+    for task in (cleanup_task, catalog_task):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    logger.info("Application shutdown: Background tasks canceled.")
+    # Write any token changes that have not been flushed yet
+    await token_store.stop()
 
 # Initialize FastAPI with lifespan
 app = FastAPI(lifespan=lifespan)
@@ -119,9 +161,33 @@ app = FastAPI(lifespan=lifespan)
 # Security scheme (OAuth2PasswordBearer is kept for dependency purposes)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
-async def get_current_token(authorization: Optional[str] = Depends(oauth2_scheme)):
-    """Dependency to get and validate the current access token from Authorization header."""
-    await remove_expired_tokens()  # Clean up before validation
+async def validate_backend_token(token: str) -> Dict:
+    """Returns the user a backend token was issued to, raising a 401 if it is not valid."""
+    if TOKEN_MODE == "signed":
+        try:
+            claims = verify_token(token, TOKEN_SIGNING_SECRET)
+        except TokenError as e:
+            logger.warning(f"Unauthorized access attempt. {e}.")
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token")
+        if revocations.is_revoked(claims):
+            logger.warning("Unauthorized access attempt. Token revoked.")
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token")
+        return claims["user"]
+
+    # In-memory lookup, falling back to the shared backend for tokens issued by another
+    # worker; expired tokens are rejected here and removed by the cleanup task
+    token_info = await token_store.fetch(token)
+    if not token_info:
+        if token_store.contains(token):
+            logger.warning("Unauthorized access attempt. Token expired.")
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
+        logger.warning("Unauthorized access attempt. Token not found.")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token")
+
+    return token_info["user"]
+
+async def get_current_session(authorization: Optional[str] = Depends(oauth2_scheme)):
+    """Dependency that validates the Authorization header and returns (token, user)."""
     if not authorization:
         logger.warning("Unauthorized access attempt. No access token provided.")
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token")
@@ -135,17 +201,11 @@ async def get_current_token(authorization: Optional[str] = Depends(oauth2_scheme
         logger.warning("Malformed authorization header.")
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Malformed authorization header")
 
-    token_store = await read_token_store()
-    token_info = token_store.get(token)
-    if not token_info:
-        logger.warning("Unauthorized access attempt. Token not found.")
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token")
-
-    if token_info["expiration"] < time.time():
-        logger.warning("Unauthorized access attempt. Token expired.")
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
+    return token, await validate_backend_token(token)
 
-    return token_info["user"]
+async def get_current_token(session = Depends(get_current_session)):
+    """Dependency to get and validate the current access token from Authorization header."""
+    return session[1]
 
 @app.get("/auth/login")
 async def login():
@@ -220,101 +280,179 @@ async def exchange_token(request: Request):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Token exchange failed: {error_description}")
 
 @app.get("/auth/logout")
-async def logout(token: str = Depends(get_current_token)):
+async def logout(session = Depends(get_current_session)):
     """
-    Logs out the user by removing the token from the store.
+    Logs out the user by removing the presented token from the store.
     """
-    token_store = await read_token_store()
-    # Find the token key associated with the user
-    token_to_remove = None
-    for stored_token, info in token_store.items():
-        if info["user"] == token:
-            token_to_remove = stored_token
-            break
-
-    if token_to_remove:
-        del token_store[token_to_remove]
-        await write_token_store(token_store)
+    token, _ = session
+    if TOKEN_MODE == "signed":
+        await asyncio.to_thread(revocations.revoke_token, verify_token(token, TOKEN_SIGNING_SECRET))
+        token_stats["logged_out"] += 1
+        logger.info("Token added to the revocation list.")
+    elif token_store.remove(token):
+        token_stats["logged_out"] += 1
         logger.info("Token removed from token store.")
     else:
         logger.info("No valid token found in token store.")
 
     return {"message": "Logged out successfully."}
 
+@app.get("/auth/logout_all")
+async def logout_all(session = Depends(get_current_session)):
+    """
+    Revokes every token of the user, signing them out of all sessions.
+    """
+    token, user = session
+    if TOKEN_MODE == "signed":
+        # Signed tokens cannot be enumerated, revoke everything issued to the user until now
+        claims = verify_token(token, TOKEN_SIGNING_SECRET)
+        await asyncio.to_thread(revocations.revoke_user, claims["sub"])
+        logger.info(f"Revoked all tokens of user {user.get('name', 'Unknown')}.")
+        return {"message": "Logged out of all sessions."}
+
+    # Tokens of this user issued by other workers are known once the shared store is reloaded
+    await token_store.sync()
+    removed = token_store.remove_user(user)
+    token_stats["logged_out"] += len(removed)
+    logger.info(f"Removed {len(removed)} tokens of user {user.get('name', 'Unknown')}.")
+    return {"message": "Logged out of all sessions.", "sessions": len(removed)}
+
 @app.get("/namespaces")
-async def get_namespaces(user: Dict = Depends(get_current_token)):
+async def get_namespaces(request: Request, user: Dict = Depends(get_current_token)):
     """
-    Protected endpoint that lists namespaces from namespaces.txt.
+    Protected endpoint that lists namespaces from the namespace catalog. The response carries
+    an ETag, and a request with a matching If-None-Match gets a 304.
     """
     logger.info(f"User {user.get('name', 'Unknown')} accessing /namespaces endpoint.")
+    etag, namespaces = namespace_catalog.snapshot()
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse({"namespaces": [namespace["NamespaceName"] for namespace in namespaces]}, headers=headers)
+
+@app.websocket("/ws/namespaces")
+async def namespaces_websocket(websocket: WebSocket, token: str):
+    """
+    Sends the namespace list on connect and again whenever it changes. Browsers cannot set an
+    Authorization header on websockets, so the backend token is passed as ?token=.
+    """
+    try:
+        user = await validate_backend_token(token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    logger.info(f"User {user.get('name', 'Unknown')} subscribed to namespace changes.")
+
+    updates = namespace_catalog.subscribe()
+
+    async def send_updates():
+        etag, namespaces = namespace_catalog.snapshot()
+        while True:
+            await websocket.send_json({"etag": etag, "namespaces": [namespace["NamespaceName"] for namespace in namespaces]})
+            etag, namespaces = await updates.get()
+
+    sender = asyncio.create_task(send_updates())
     try:
-        # Use absolute path for namespaces.txt
-        namespaces_path = pathlib.Path(__file__).parent / "namespaces.txt"
-        async with aiofiles.open(namespaces_path, "r") as file:
-            contents = await file.read()
-            namespaces = [line.strip() for line in contents.splitlines()]
-        return {"namespaces": namespaces}
-    except FileNotFoundError:
-        logger.error("namespaces.txt file not found.")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="namespaces.txt file not found")
+        # Nothing is expected from the client, receiving only notices when it disconnects
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        namespace_catalog.unsubscribe(updates)
+
+# Summaries precomputed by the ingestion pipeline
+summary_store = SummaryStore(str(REPO_DIR / "Pinecone" / "summaries"))
 
 @app.get("/summary")
-async def get_summary(namespace: str, user: Dict = Depends(get_current_token)):
+async def get_summary(namespace: str, request: Request, user: Dict = Depends(get_current_token)):
     """
-    Protected endpoint that returns a summary for the given namespace.
-    Currently, it returns the namespace repeated 50 times.
+    Protected endpoint that returns the summary of a namespace and of each of its sections.
+    Summaries are generated at ingestion, so this only reads them; the content hash is the ETag.
     """
     logger.info(f"User {user.get('name', 'Unknown')} accessing /summary endpoint for namespace: {namespace}")
-    # Simulate a delay for future database calls
-    await asyncio.sleep(0)  # No actual delay, but keeps the function async
-    summary = namespace * 50
-    return {"namespace": namespace, "summary": summary}
+    record = summary_store.get(namespace)
+    if record is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No summary for this namespace")
+
+    headers = {"ETag": f'"{record["content_hash"]}"', "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse({
+        "namespace": namespace,
+        "summary": record["summary"],
+        "sections": [{"heading": section["heading"], "summary": section["summary"]} for section in record["sections"]],
+        "generated_at": record["generated_at"],
+    }, headers=headers)
+
+# Hybrid search over the same index, encoders and reranker the assistant's tools use
+pinecone_client = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+
+def pinecone_sparse(query: str) -> Dict:
+    return pinecone_sparse_query(pinecone_client, query, stopwords_file=str(REPO_DIR / "english.txt"))
+
+hybrid_search = HybridSearch(
+    PineconeDatabase(),
+    text_embedding_3_large_openAI(),
+    pinecone_sparse,
+    sparse_encoder=BM25SparseEncoder(str(REPO_DIR / "Pinecone" / "sparse_stats")),
+    versions=NamespaceVersions(str(REPO_DIR / "Pinecone" / "pinecone.json"))
+)
+SEARCH_MAX_LIMIT = 50
 
 @app.get("/search")
-async def search_namespace(namespace: str, query: str, user: Dict = Depends(get_current_token)):
+async def search_namespace(namespace: str, query: str, request: Request, cursor: Optional[str] = None,
+                           limit: int = 10, user: Dict = Depends(get_current_token)):
     """
     Protected endpoint that searches within a namespace using the given query.
-    Currently, it returns the query concatenated with the namespace repeated 50 times.
+
+    Returns one page of hits, each with its rank, scores, 1-based pages and a preview, plus
+    "next_cursor" (pass it back as ?cursor= for the next page, null on the last page) and
+    "total". Server-Timing reports milliseconds per stage.
     """
     logger.info(f"User {user.get('name', 'Unknown')} accessing /search endpoint for namespace: {namespace} with query: {query}")
-    # Simulate a delay for future database calls
-    await asyncio.sleep(0)  # No actual delay, but keeps the function async
-    search_result = query + (namespace * 50)
-    return {"namespace": namespace, "query": query, "result": search_result}
+    # Unknown namespaces are rejected before any embedding or Pinecone call
+    if namespace not in namespace_catalog.names():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown namespace")
+    started = time.perf_counter()
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    try:
+        # Embedding, Pinecone and reranking are blocking calls, keep them off the event loop
+        hits, next_cursor, total, timings = await asyncio.to_thread(hybrid_search.search, namespace, query, cursor, limit)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    timings["total"] = (time.perf_counter() - started) * 1000
+
+    headers = {
+        "Server-Timing": server_timing(timings),
+        "X-Search-Cache": "hit" if timings["cached"] else "miss",
+        "Cache-Control": "private, no-store",
+    }
+    return JSONResponse({"hits": hits, "next_cursor": next_cursor, "total": total}, headers=headers)
+
+# Authenticated file delivery, streamed directly with validators, ranges and a small-file LRU
+BASE_DIR = pathlib.Path(__file__).parent
+image_files = FileServer(BASE_DIR / "images", "private, max-age=3600", SmallFileCache())
+# Highlighted PDFs and Excel outputs are regenerated in place, so clients always revalidate
+generated_files = FileServer(REPO_DIR / "PDF_Extraction" / "AWS_Textract" / "GET", "private, no-cache")
 
 @app.get("/images/{filename}")
-async def get_image(filename: str, user: Dict = Depends(get_current_token)):
+async def get_image(filename: str, request: Request, user: Dict = Depends(get_current_token)):
     """
     Protected endpoint that returns an image file.
     """
     logger.info(f"User {user.get('name', 'Unknown')} accessing /images endpoint for filename: {filename}")
+    return await image_files.respond(request, filename)
 
-    # Define the images directory
-    images_dir = pathlib.Path(__file__).parent / "images"
-
-    # Construct the full path
-    image_path = images_dir / filename
-
-    # Verify that the file exists and is within the images directory
-    try:
-        # Resolve the path to prevent directory traversal attacks
-        image_path = image_path.resolve()
-        if not str(image_path).startswith(str(images_dir.resolve())):
-            logger.error("Invalid file path detected.")
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid file path")
-
-        if not image_path.exists() or not image_path.is_file():
-            logger.error(f"Image file not found: {image_path}")
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
-
-        return RedirectResponse(url=f"/static/images/{filename}")
-    except Exception as e:
-        logger.error(f"Error serving image: {e}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error")
-
-# Serve static images
-from fastapi.staticfiles import StaticFiles
-app.mount("/static/images", StaticFiles(directory="images"), name="static-images")
+@app.get("/files/{filename}")
+async def get_file(filename: str, request: Request, user: Dict = Depends(get_current_token)):
+    """
+    Protected endpoint that returns a generated file, such as a highlighted PDF or an Excel export.
+    """
+    logger.info(f"User {user.get('name', 'Unknown')} accessing /files endpoint for filename: {filename}")
+    return await generated_files.respond(request, filename)
 
 if __name__ == "__main__":
     # For testing, run without SSL
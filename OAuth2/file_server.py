@@ -0,0 +1,184 @@
+import logging
+import mimetypes
+import os
+import pathlib
+import re
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import aiofiles
+from fastapi import HTTPException, Request, status
+from fastapi.responses import Response, StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class SmallFileCache:
+    """LRU of the contents of small files, keyed by path and invalidated by mtime and size."""
+
+    def __init__(self, max_file_size: int = 256 * 1024, max_total_size: int = 32 * 1024 * 1024):
+        self.max_file_size = max_file_size
+        self.max_total_size = max_total_size
+        self.total_size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[Tuple[int, int], bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str, version: Tuple[int, int]) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, path: str, version: Tuple[int, int], data: bytes) -> None:
+        if len(data) > self.max_file_size:
+            return
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self.total_size -= len(old[1])
+            self._entries[path] = (version, data)
+            self.total_size += len(data)
+            while self.total_size > self.max_total_size:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.total_size -= len(evicted)
+
+
+class FileServer:
+    """
+    Serves files from a fixed directory straight from the endpoint that authenticated the
+    request: no redirect to a second URL and no separate file server.
+
+    Responses carry an ETag (mtime and size) and Last-Modified so clients revalidate with a
+    304, and single HTTP ranges are honoured so PDF viewers can fetch the pages they show
+    without downloading the whole file. Large files are streamed in chunks, small ones
+    (cropped table PNGs and the like) are kept in an in-memory LRU.
+    """
+
+    def __init__(self, directory: pathlib.Path, cache_control: str, cache: Optional[SmallFileCache] = None):
+        self.directory = directory.resolve()
+        self.cache_control = cache_control
+        self.cache = cache
+
+    def resolve(self, filename: str) -> pathlib.Path:
+        """Path of a file inside the directory, rejecting anything that escapes it."""
+        path = (self.directory / filename).resolve()
+        if not path.is_relative_to(self.directory):
+            logger.error("Invalid file path detected.")
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid file path")
+        if not path.is_file():
+            logger.error(f"File not found: {path}")
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+        return path
+
+    @staticmethod
+    def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    @staticmethod
+    def _byte_range(request: Request, etag: str, last_modified: str, size: int) -> Optional[Tuple[int, int]]:
+        """
+        The requested (start, end) inclusive range, or None to send the whole file.
+
+        Raises:
+            HTTPException: 416 if the range lies outside the file.
+        """
+        range_header = request.headers.get("range")
+        if not range_header:
+            return None
+        # A range against an older version of the file gets the whole new file instead
+        if_range = request.headers.get("if-range")
+        if if_range and if_range not in (etag, last_modified):
+            return None
+        match = _RANGE_PATTERN.match(range_header.strip())
+        if not match or match.groups() == ("", ""):
+            # Multiple or malformed ranges, fall back to the full body
+            return None
+
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+        if start > end or start >= size:
+            raise HTTPException(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                detail="Requested range not satisfiable",
+                headers={"Content-Range": f"bytes */{size}"},
+            )
+        return start, end
+
+    @staticmethod
+    async def _stream(path: pathlib.Path, start: int, length: int) -> AsyncIterator[bytes]:
+        async with aiofiles.open(path, "rb") as f:
+            await f.seek(start)
+            while length > 0:
+                chunk = await f.read(min(CHUNK_SIZE, length))
+                if not chunk:
+                    break
+                length -= len(chunk)
+                yield chunk
+
+    async def respond(self, request: Request, filename: str) -> Response:
+        path = self.resolve(filename)
+        stat = os.stat(path)
+        size = stat.st_size
+        etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+        last_modified = formatdate(stat.st_mtime, usegmt=True)
+        headers: Dict[str, str] = {
+            "ETag": etag,
+            "Last-Modified": last_modified,
+            "Cache-Control": self.cache_control,
+            "Accept-Ranges": "bytes",
+        }
+
+        if self._not_modified(request, etag, stat.st_mtime):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        byte_range = self._byte_range(request, etag, last_modified, size)
+
+        if byte_range is None and self.cache is not None and size <= self.cache.max_file_size:
+            version = (stat.st_mtime_ns, size)
+            data = self.cache.get(str(path), version)
+            if data is None:
+                async with aiofiles.open(path, "rb") as f:
+                    data = await f.read()
+                self.cache.put(str(path), version, data)
+            return Response(content=data, media_type=media_type, headers=headers)
+
+        if byte_range is None:
+            start, end, status_code = 0, size - 1, status.HTTP_200_OK
+        else:
+            start, end = byte_range
+            status_code = status.HTTP_206_PARTIAL_CONTENT
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            self._stream(path, start, end - start + 1),
+            status_code=status_code,
+            media_type=media_type,
+            headers=headers,
+        )
@@ -0,0 +1,204 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import math
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, run a single worker there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# ID token claims carried inside a signed backend token; the rest of the ID token is dropped
+# to keep the Authorization header small
+USER_CLAIMS = ("name", "preferred_username", "email", "oid", "sub", "tid")
+
+_HEADER = {"alg": "HS256", "typ": "JWT"}
+
+
+class TokenError(Exception):
+    """Raised when a signed token is malformed, has a bad signature or has expired."""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(signing_input: bytes, secret: bytes) -> str:
+    return _b64encode(hmac.new(secret, signing_input, hashlib.sha256).digest())
+
+
+def issue_token(user: Dict, expires_in: int, secret: bytes, user_id: str) -> str:
+    """
+    Issues an HS256 JWT carrying the user's claims, so any worker holding the secret can
+    validate it without a token store.
+
+    Args:
+        user (dict): ID token claims of the user.
+        expires_in (int): Lifetime in seconds.
+        secret (bytes): Signing key shared by every worker.
+        user_id (str): Stable user identifier, stored as the "sub" claim.
+    """
+    now = time.time()
+    payload = {
+        "sub": user_id,
+        "user": {claim: user[claim] for claim in USER_CLAIMS if claim in user},
+        # Milliseconds, rounded down, so a login right after a logout_all in the same second
+        # is not covered by that user's cut-off
+        "iat": math.floor(now * 1000) / 1000,
+        "exp": int(now) + int(expires_in),
+        "jti": str(uuid.uuid4()),
+    }
+    signing_input = ".".join(
+        _b64encode(json.dumps(part, separators=(",", ":")).encode("utf-8")) for part in (_HEADER, payload)
+    )
+    return f"{signing_input}.{_sign(signing_input.encode('ascii'), secret)}"
+
+
+def verify_token(token: str, secret: bytes, now: Optional[float] = None, leeway: int = 0) -> Dict:
+    """
+    Checks the signature and expiry of a signed token, in CPU only.
+
+    Returns:
+        dict: The token's claims.
+
+    Raises:
+        TokenError: If the token is malformed, forged or expired.
+    """
+    try:
+        header_b64, payload_b64, signature = token.split(".")
+    except ValueError:
+        raise TokenError("Malformed token")
+
+    expected = _sign(f"{header_b64}.{payload_b64}".encode("ascii"), secret)
+    if not hmac.compare_digest(signature, expected):
+        raise TokenError("Invalid signature")
+
+    try:
+        header = json.loads(_b64decode(header_b64))
+        claims = json.loads(_b64decode(payload_b64))
+    except (ValueError, UnicodeDecodeError):
+        raise TokenError("Malformed token")
+    if header.get("alg") != "HS256":
+        raise TokenError("Unsupported algorithm")
+
+    now = now if now is not None else time.time()
+    if claims.get("exp", 0) + leeway < now:
+        raise TokenError("Token expired")
+    return claims
+
+
+class RevocationList:
+    """
+    Signed tokens stay valid until they expire, so logout records what it revokes: single
+    token IDs until their expiry, and per-user cut-off times that invalidate every token
+    issued before them. Entries are dropped once the tokens they cover have expired.
+
+    The list is kept in memory for the hot path and saved to a small JSON file that other
+    workers pick up with reload(). Every change re-reads and merges the file under an
+    exclusive lock before writing it, so workers revoking at the same time keep each
+    other's entries.
+    """
+
+    def __init__(self, path: str, max_token_lifetime: int = 86400):
+        self.path = path
+        self.max_token_lifetime = max_token_lifetime
+        self.tokens: Dict[str, float] = {}
+        self.users: Dict[str, float] = {}
+        self._mtime: Optional[float] = None
+
+    def is_revoked(self, claims: Dict) -> bool:
+        if claims.get("jti") in self.tokens:
+            return True
+        revoked_before = self.users.get(claims.get("sub"))
+        return revoked_before is not None and claims.get("iat", 0) < revoked_before
+
+    def revoke_token(self, claims: Dict) -> None:
+        with self._locked():
+            self._merge(self._read())
+            self.tokens[claims["jti"]] = claims["exp"]
+            self._write()
+
+    def revoke_user(self, user_id: str) -> None:
+        with self._locked():
+            self._merge(self._read())
+            self.users[user_id] = max(time.time(), self.users.get(user_id, 0))
+            self._write()
+
+    def purge(self, now: Optional[float] = None) -> int:
+        """Drops entries that can no longer match an unexpired token."""
+        now = now if now is not None else time.time()
+        if not any(self._expired(now)):
+            return 0  # Nothing to drop, skip taking the file lock
+        with self._locked():
+            self._merge(self._read())
+            expired_tokens, expired_users = self._expired(now)
+            for jti in expired_tokens:
+                del self.tokens[jti]
+            for user in expired_users:
+                del self.users[user]
+            if expired_tokens or expired_users:
+                self._write()
+        return len(expired_tokens) + len(expired_users)
+
+    def _expired(self, now: float) -> Tuple[List[str], List[str]]:
+        expired_tokens = [jti for jti, exp in self.tokens.items() if exp < now]
+        expired_users = [user for user, at in self.users.items() if at + self.max_token_lifetime < now]
+        return expired_tokens, expired_users
+
+    def reload(self) -> None:
+        """Picks up revocations saved by other workers, merging them with our own."""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        data = self._read()
+        if data is not None:
+            self._merge(data)
+            self._mtime = mtime
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with open(self.path + ".lock", "a") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self) -> Optional[Dict]:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _merge(self, data: Optional[Dict]) -> None:
+        if not data:
+            return
+        self.tokens.update(data.get("tokens", {}))
+        for user, at in data.get("users", {}).items():
+            self.users[user] = max(at, self.users.get(user, 0))
+
+    def _write(self) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"tokens": self.tokens, "users": self.users}, f)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.path.getmtime(self.path)
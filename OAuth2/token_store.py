@@ -0,0 +1,296 @@
+import asyncio
+import heapq
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: the single-process check of the JSON backend is skipped
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def user_key(user: Dict) -> str:
+    """Stable identifier of a user from their ID token claims."""
+    for claim in ("oid", "sub", "preferred_username", "email"):
+        if user.get(claim):
+            return f"{claim}:{user[claim]}"
+    return json.dumps(user, sort_keys=True)
+
+
+class JSONTokenBackend:
+    """
+    Persists the whole token store as one JSON file, replaced atomically on every flush.
+
+    Each flush overwrites the file with this process's tokens, so the backend is for a
+    single process only: load() takes an exclusive lock on the file and a second process
+    fails to start. Use the SQLite backend to run several workers.
+    """
+
+    shared = False
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock_file = None
+
+    def load(self) -> Dict[str, Dict]:
+        if fcntl and self._lock_file is None:
+            lock_file = open(self.path + '.lock', 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                raise RuntimeError(f"{self.path} is in use by another process; the json token store backend "
+                                   f"is single-process, use TOKEN_STORE_BACKEND=sqlite for several workers.")
+            self._lock_file = lock_file
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def persist(self, tokens: Dict[str, Dict], changes: Dict[str, Optional[Dict]]) -> None:
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(tokens, f)
+        os.replace(tmp_path, self.path)
+
+    def close(self) -> None:
+        if self._lock_file is not None:
+            self._lock_file.close()  # Closing the file releases the lock
+            self._lock_file = None
+
+
+class SQLiteTokenBackend:
+    """
+    Persists tokens as rows in a local SQLite database, writing only what changed. Several
+    processes can share the database: each writes only its own changes and can look up the
+    tokens the others issued.
+    """
+
+    shared = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tokens (token TEXT PRIMARY KEY, expiration REAL NOT NULL, user TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def load(self) -> Dict[str, Dict]:
+        rows = self._conn.execute("SELECT token, expiration, user FROM tokens").fetchall()
+        return {token: {"expiration": expiration, "user": json.loads(user)} for token, expiration, user in rows}
+
+    def lookup(self, token: str) -> Optional[Dict]:
+        row = self._conn.execute("SELECT expiration, user FROM tokens WHERE token = ?", (token,)).fetchone()
+        return {"expiration": row[0], "user": json.loads(row[1])} if row else None
+
+    def persist(self, tokens: Dict[str, Dict], changes: Dict[str, Optional[Dict]]) -> None:
+        upserts = [(token, info["expiration"], json.dumps(info["user"])) for token, info in changes.items() if info]
+        deletes = [(token,) for token, info in changes.items() if info is None]
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO tokens VALUES (?, ?, ?)", upserts)
+            self._conn.executemany("DELETE FROM tokens WHERE token = ?", deletes)
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class TokenStore:
+    """
+    Backend tokens held in memory, so validating a token is a dict lookup that never touches
+    disk. Expirations sit in a min-heap, so cleanup only looks at tokens that are due, and
+    a user -> tokens index makes logging a user out of every session proportional to their
+    own sessions rather than to the whole store.
+
+    New tokens are written with issue(), which returns once the token is in the backend, so
+    a token handed to a client is never lost and other workers can look it up right away.
+    Removals and expirations are persisted write-behind: they are batched and flushed to the
+    backend every `flush_interval` seconds off the event loop, and on stop().
+
+    With a shared backend (SQLite) several worker processes can use the same store: a token
+    missing from memory is looked up in the backend with fetch(), and sync() reloads the
+    backend so logouts made on other workers are picked up. The JSON backend is
+    single-process only.
+
+    All methods except start/stop/flush/fetch/sync/issue are synchronous and meant to be called
+    from the event loop, which is what serialises them.
+    """
+
+    def __init__(self, backend, flush_interval: float = 1.0):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self._tokens: Dict[str, Dict] = {}
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._user_tokens: Dict[str, Set[str]] = {}
+        self._changes: Dict[str, Optional[Dict]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+
+    @property
+    def shared(self) -> bool:
+        return getattr(self.backend, "shared", False)
+
+    def _index(self, tokens: Dict[str, Dict]) -> None:
+        self._tokens = tokens
+        self._expiry_heap = [(info["expiration"], token) for token, info in tokens.items()]
+        heapq.heapify(self._expiry_heap)
+        self._user_tokens = {}
+        for token, info in tokens.items():
+            self._user_tokens.setdefault(user_key(info["user"]), set()).add(token)
+
+    async def start(self) -> None:
+        self._index(await asyncio.to_thread(self.backend.load))
+        self._flusher = asyncio.create_task(self._flush_loop())
+        logger.info(f"Token store loaded {len(self._tokens)} tokens.")
+
+    async def fetch(self, token: str) -> Optional[Dict]:
+        """get() that falls back to the shared backend for tokens issued by another worker."""
+        info = self.get(token)
+        if info is not None or not self.shared or token in self._tokens or token in self._changes:
+            return info
+        info = await asyncio.to_thread(self.backend.lookup, token)
+        # Checked again after the await, the token may have been added or removed meanwhile
+        if info is not None and token not in self._tokens and token not in self._changes:
+            self._tokens[token] = info
+            heapq.heappush(self._expiry_heap, (info["expiration"], token))
+            self._user_tokens.setdefault(user_key(info["user"]), set()).add(token)
+        return self.get(token)
+
+    async def sync(self) -> None:
+        """Reloads a shared backend, dropping tokens other workers removed."""
+        if not self.shared:
+            return
+        await self.flush()
+        tokens = await asyncio.to_thread(self.backend.load)
+        # Changes made while loading are not in the backend yet
+        for token, info in self._changes.items():
+            if info is None:
+                tokens.pop(token, None)
+            else:
+                tokens[token] = info
+        self._index(tokens)
+
+    async def stop(self) -> None:
+        if self._flusher:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        await asyncio.to_thread(self.backend.close)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Token store flush failed, will retry: {e}")
+
+    async def flush(self) -> None:
+        """Writes pending changes to the backend."""
+        async with self._flush_lock:
+            if not self._changes:
+                return
+            changes, self._changes = self._changes, {}
+            snapshot = dict(self._tokens)
+            try:
+                await asyncio.to_thread(self.backend.persist, snapshot, changes)
+            except Exception:
+                # Put the batch back, without overwriting anything that changed meanwhile
+                for token, info in changes.items():
+                    self._changes.setdefault(token, info)
+                raise
+
+    def add(self, token: str, info: Dict) -> None:
+        self.remove(token)
+        self._tokens[token] = info
+        heapq.heappush(self._expiry_heap, (info["expiration"], token))
+        self._user_tokens.setdefault(user_key(info["user"]), set()).add(token)
+        self._changes[token] = info
+
+    async def issue(self, token: str, info: Dict) -> None:
+        """add() that returns only once the token has been written to the backend."""
+        self.add(token, info)
+        await self.flush()
+
+    def get(self, token: str, now: Optional[float] = None) -> Optional[Dict]:
+        """Token info, or None if the token is unknown or has expired."""
+        info = self._tokens.get(token)
+        if info is None or info["expiration"] < (now if now is not None else time.time()):
+            return None
+        return info
+
+    def contains(self, token: str) -> bool:
+        return token in self._tokens
+
+    def remove(self, token: str) -> Optional[Dict]:
+        info = self._tokens.pop(token, None)
+        if info is not None:
+            key = user_key(info["user"])
+            tokens = self._user_tokens.get(key)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._user_tokens[key]
+            self._changes[token] = None
+        return info
+
+    def tokens_for_user(self, user: Dict) -> Set[str]:
+        return set(self._user_tokens.get(user_key(user), ()))
+
+    def remove_user(self, user: Dict) -> List[str]:
+        """Revokes every token of a user."""
+        tokens = list(self._user_tokens.get(user_key(user), ()))
+        for token in tokens:
+            self.remove(token)
+        return tokens
+
+    def next_expiration(self) -> Optional[float]:
+        """Earliest expiration in the heap, possibly of a token that was already removed."""
+        return self._expiry_heap[0][0] if self._expiry_heap else None
+
+    def remove_expired(self, now: Optional[float] = None) -> List[str]:
+        """Removes and returns the tokens whose expiration has passed."""
+        now = now if now is not None else time.time()
+        expired = []
+        while self._expiry_heap and self._expiry_heap[0][0] < now:
+            expiration, token = heapq.heappop(self._expiry_heap)
+            info = self._tokens.get(token)
+            # Skip heap entries of tokens already removed or re-added with a later expiration
+            if info is not None and info["expiration"] == expiration:
+                self.remove(token)
+                expired.append(token)
+        return expired
+
+    def items(self) -> Iterator[Tuple[str, Dict]]:
+        return iter(list(self._tokens.items()))
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def user_count(self) -> int:
+        return len(self._user_tokens)
+
+
+def create_token_store(json_path: str, backend: str = "json", sqlite_path: Optional[str] = None,
+                       flush_interval: float = 1.0) -> TokenStore:
+    """
+    Builds a TokenStore on the "json" backend (json_path) or the "sqlite" backend
+    (sqlite_path, defaulting to json_path with a .db extension).
+    """
+    if backend == "sqlite":
+        path = sqlite_path if sqlite_path else os.path.splitext(json_path)[0] + ".db"
+        return TokenStore(SQLiteTokenBackend(path), flush_interval)
+    if backend == "json":
+        return TokenStore(JSONTokenBackend(json_path), flush_interval)
+    raise ValueError(f"Unknown token store backend: {backend}")
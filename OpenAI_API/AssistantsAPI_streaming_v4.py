@@ -1,8 +1,9 @@
+import asyncio
 import threading
 from queue import Queue
-from typing import Generator, override
-from openai import AssistantEventHandler
-from OpenAI_API.tool_calling import vectorDB_tool, returnPDF
+from typing import Callable, Generator, Optional, override
+from openai import AssistantEventHandler, APIStatusError, AsyncOpenAI
+from OpenAI_API.tool_calling import vectorDB_tool, multiNamespace_tool, returnPDF, getPDFSummary
 from OpenAI_API.table_excel_tool import getExcel
 import json
 from OpenAI_API.utils import load_json_file
@@ -10,6 +11,7 @@ from openai import OpenAI
 import os
 from dotenv import load_dotenv
 from OpenAI_API.highlight_tool import highlight_pdf
+from OpenAI_API.run_lifecycle import TERMINAL_STATES, RunLifecycle, wait_for_terminal_async
 
 load_dotenv()
 
@@ -17,12 +19,18 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 
 class EventHandler(AssistantEventHandler):
-    def __init__(self, client, text_queue):
+    def __init__(self, client, text_queue, on_run_created: Optional[Callable[[str], None]] = None,
+                 lifecycle: Optional[RunLifecycle] = None):
         super().__init__()
         self.current_run_id = None
         self.client = client
         self.text_queue = text_queue
         self.run_id = None
+        self.on_run_created = on_run_created
+        self.lifecycle = lifecycle
+
+    def stopped(self) -> bool:
+        return self.lifecycle is not None and self.lifecycle.stopped.is_set()
 
     @override
     def on_text_created(self, text) -> None:
@@ -46,11 +54,19 @@ class EventHandler(AssistantEventHandler):
 
     @override
     def on_event(self, event):
+        if self.lifecycle:
+            self.lifecycle.on_event(event)
+
         if event.event == 'thread.run.created':
             self.current_run_id = event.data.id
             print(f"Run ID: {self.current_run_id}")
+            if self.on_run_created:
+                self.on_run_created(self.current_run_id)
 
         if event.event == 'thread.run.requires_action':
+            if self.stopped():
+                # The run is being cancelled, don't run tools for it
+                return
             run_id = event.data.id
             self.handle_requires_action(event.data, run_id)
 
@@ -62,10 +78,18 @@ class EventHandler(AssistantEventHandler):
                 bot_input = json.loads(tool.function.arguments)
                 output = vectorDB_tool(bot_input["userInput"], bot_input["namespace"])
                 tool_outputs.append({"tool_call_id": tool.id, "output": output})
+            if tool.function.name == "multiNamespace_tool":
+                bot_input = json.loads(tool.function.arguments)
+                output = multiNamespace_tool(bot_input["userInput"], bot_input["namespaces"])
+                tool_outputs.append({"tool_call_id": tool.id, "output": output})
             if tool.function.name == "returnPDF":
                 bot_input = json.loads(tool.function.arguments)
                 output = returnPDF(bot_input["namespace"], bot_input["page_number"])
                 tool_outputs.append({"tool_call_id": tool.id, "output": output})
+            if tool.function.name == "getPDFSummary":
+                bot_input = json.loads(tool.function.arguments)
+                output = getPDFSummary(bot_input["namespace"])
+                tool_outputs.append({"tool_call_id": tool.id, "output": output})
             if tool.function.name == "getExcel":
                 bot_input = json.loads(tool.function.arguments)
                 output = getExcel(bot_input["namespace"], bot_input["page_number"], bot_input["table_number"])
@@ -75,10 +99,12 @@ class EventHandler(AssistantEventHandler):
                 output = highlight_pdf(bot_input["namespace"])
                 tool_outputs.append({"tool_call_id": tool.id, "output": output})
 
+        if self.stopped():
+            return
         self.submit_tool_outputs(tool_outputs, run_id)
 
     def submit_tool_outputs(self, tool_outputs, run_id):
-        tempHandler = EventHandler(self.client, self.text_queue)
+        tempHandler = EventHandler(self.client, self.text_queue, lifecycle=self.lifecycle)
         with self.client.beta.threads.runs.submit_tool_outputs_stream(
                 thread_id=self.current_run.thread_id,
                 run_id=self.current_run.id,
@@ -86,6 +112,8 @@ class EventHandler(AssistantEventHandler):
                 event_handler=tempHandler,
         ) as stream:
             for text in stream.text_deltas:
+                if self.stopped():
+                    break
                 if hasattr(text, 'value'):
                     pass
                 else:
@@ -94,15 +122,40 @@ class EventHandler(AssistantEventHandler):
 
 
 class AssistantAPI_streaming:
-    def __init__(self, client, assistant):
+    """
+    Streams an assistant's answers on one OpenAI thread.
+
+    Args:
+        client: OpenAI client.
+        assistant (str): Assistant ID.
+        thread_id (str): Thread to continue, e.g. a session's thread loaded from the session
+            store. A new thread is created when None.
+        on_run_change (callable): Called with the run ID when a run starts and with None when
+            it has finished streaming, so the run can be recorded outside this process.
+        async_client: AsyncOpenAI client used by cancelRunAsync, created from client's key
+            when None.
+    """
+
+    def __init__(self, client, assistant, thread_id: Optional[str] = None,
+                 on_run_change: Optional[Callable[[Optional[str]], None]] = None, async_client=None):
         self.client = client
-        self.thread = self.client.beta.threads.create()
+        self.async_client = async_client if async_client else AsyncOpenAI(api_key=client.api_key)
+        self.thread_id = thread_id if thread_id else self.client.beta.threads.create().id
         self.assistant_id = assistant
         self.current_run_id = None
+        self.on_run_change = on_run_change
+        # Run state followed from the stream events, shared with the streaming thread
+        self.run = RunLifecycle()
+        self._text_queue: Optional[Queue] = None
+
+    def _run_created(self, run_id: str) -> None:
+        self.current_run_id = run_id
+        if self.on_run_change:
+            self.on_run_change(run_id)
 
     def prompt(self, message):
         self.client.beta.threads.messages.create(
-            thread_id=self.thread.id,
+            thread_id=self.thread_id,
             role="user",
             content=message,
         )
@@ -111,28 +164,48 @@ class AssistantAPI_streaming:
         """Generates responses based on the user's input, yielding each response incrementally."""
         self.prompt(user_input)
         text_queue = Queue()
-        tempEventHandler = EventHandler(self.client, text_queue)
+        self._text_queue = text_queue
+        # Each turn gets its own lifecycle, so a previous turn's stream that is still closing
+        # cannot touch the state of this one
+        run = RunLifecycle()
+        run.start()
+        self.run = run
+        tempEventHandler = EventHandler(self.client, text_queue, on_run_created=self._run_created,
+                                        lifecycle=run)
 
         def run_stream():
             self.current_run = self.client.beta.threads.runs.stream(
-                thread_id=self.thread.id,
+                thread_id=self.thread_id,
                 assistant_id=self.assistant_id,
                 event_handler=tempEventHandler
             )
-            with self.current_run as stream:
-                for text in stream.text_deltas:
-                    self.current_run_id = tempEventHandler.current_run_id
-                    if hasattr(text, 'value'):
-                        pass
-                    else:
-                        text_queue.put(str(text))
+            try:
+                with self.current_run as stream:
+                    for text in stream.text_deltas:
+                        # Leaving the with block closes the HTTP stream
+                        if run.stopped.is_set():
+                            break
+                        if hasattr(text, 'value'):
+                            pass
+                        else:
+                            text_queue.put(str(text))
+                # A stop that came before the run was created could not cancel it then
+                if run.stopped.is_set():
+                    late_run_id = run.request_stop()
+                    if late_run_id:
+                        self._cancel(late_run_id)
+            finally:
                 text_queue.put(None)
+                run.quiet()
+                if self.on_run_change and self.run is run:
+                    self.on_run_change(None)
 
         threading.Thread(target=run_stream).start()
 
         while True:
             text = text_queue.get()
-            if text is None:
+            # Text already queued when a stop came in is dropped too
+            if text is None or run.stopped.is_set():
                 break
             yield text
 
@@ -150,22 +223,65 @@ class AssistantAPI_streaming:
                 print(text, end="", flush=True)
 
     def getThread(self):
-        return self.thread
+        return self.client.beta.threads.retrieve(self.thread_id)
+
+    def _stop_streaming(self) -> Optional[str]:
+        """Ends user_chat's output right away and returns the run ID to cancel, if any."""
+        run_id = self.run.request_stop()
+        if self._text_queue is not None:
+            self._text_queue.put(None)
+        return run_id
+
+    def _cancel(self, run_id: str) -> None:
+        try:
+            self.client.beta.threads.runs.cancel(thread_id=self.thread_id, run_id=run_id)
+            print(f"Run ID: {run_id} cancelled.")
+        except APIStatusError as e:
+            # The run finished between its last event and the cancel
+            print(f"Run ID: {run_id} could not be cancelled: {e.message}")
 
     def cancelRun(self):
-        run = self.client.beta.threads.runs.retrieve(
-            thread_id=self.thread.id,
-            run_id=self.current_run_id
-        )
-        print(f"Run ID: {self.current_run_id} is cancelling...")
-        if run.status == "completed":
-            print(f"Run ID: {self.current_run_id} is already completed.")
+        """
+        Stops streaming and cancels the current run. The run's status comes from the stream
+        events, so there is no retrieve before the cancel.
+        """
+        run_id = self._stop_streaming()
+        if run_id:
+            self._cancel(run_id)
+
+    async def cancelRunAsync(self):
+        """cancelRun for the event loop: the cancel request goes through the async client."""
+        run_id = self._stop_streaming()
+        if not run_id:
+            return
+        try:
+            await self.async_client.beta.threads.runs.cancel(thread_id=self.thread_id, run_id=run_id)
+            print(f"Run ID: {run_id} cancelled.")
+        except APIStatusError as e:
+            print(f"Run ID: {run_id} could not be cancelled: {e.message}")
+
+    async def waitForRunEndAsync(self, timeout: float = 10.0) -> None:
+        """
+        Waits until the last run has reached a terminal status on the server, so the next
+        message can be posted to the thread. Call it after cancelRunAsync.
+        """
+        run = self.run
+        if run.state == "idle" or run.state in TERMINAL_STATES:
             return
-        if run.status == "canceled":
-            print(f"Run ID: {self.current_run_id} is already cancelled.")
+        if run.run_id is None:
+            # Stopped before the run was created, the streaming thread cancels it once it is
+            await asyncio.to_thread(run.quieted.wait, timeout)
+            if run.run_id is None:
+                return
+        try:
+            status = await wait_for_terminal_async(self.async_client, self.thread_id, run.run_id, timeout)
+        except APIStatusError as e:
+            print(f"Run ID: {run.run_id} status could not be read: {e.message}")
             return
-        self.client.beta.threads.runs.cancel(thread_id=self.thread.id, run_id=self.current_run_id)
-        print(f"Run ID: {self.current_run_id} cancelled.")
+        if status:
+            run.settle(status)
+        else:
+            print(f"Run ID: {run.run_id} did not finish within {timeout}s.")
 
 
 def main():
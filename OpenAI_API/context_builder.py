@@ -0,0 +1,160 @@
+import ast
+import re
+from typing import Any, Dict, List, Tuple
+
+from Embeddings.tokenizer import count_tokens
+
+ANSWER_INSTRUCTIONS = (
+    "IMPORTANT: Only answer from these search results. If the answer is not in them, say "
+    "'I couldn't find the information in the database results.' Do NOT make up or assume anything."
+)
+TABLE_LINK_INSTRUCTIONS = "Render the localhost table image link whenever the user asks for a table."
+
+# Instructions the tool used to append to every result, kept to measure what the compact context saves
+LEGACY_INSTRUCTIONS = (
+    ". IMPORTANT: Only answer if the information is found in the Query Search Results. Do NOT make up or assume "
+    "any information. If the information isn't available, clearly respond with something like 'I couldn't find "
+    "the information in the database results.' PLEASE STRICTLY FOLLOW THIS AND DO NOT MAKE THINGS UP OR SAY "
+    "SOMETHING IS THERE WHEN IT ISN'T!!.(Please Render LocalHost Links if Available. Always render the LocalHost "
+    "Link whenever the user asks for the table) instead of giving the link to the user. Whenever you see a table, "
+    "please render the LocalHost Link.)"
+)
+
+HEADING_PATTERN = re.compile(r"<HEADING[^>]*>(.*?)<\s*HEADING\s*/>", re.IGNORECASE)
+BOLD_PATTERN = re.compile(r"<BOLD[^>]*>(.*?)</BOLD>", re.IGNORECASE)
+TABLE_OPEN_PATTERN = re.compile(r"<TABLE EXTRACT \(TABLE NUMBER = (\d+), PAGE NUMBER = (\d+)\)>", re.IGNORECASE)
+TABLE_CLOSE_PATTERN = re.compile(r"<TABLE EXTRACT\s*/>", re.IGNORECASE)
+IMAGE_LINK_PATTERN = re.compile(r"table extracted to (localhost:\S+)", re.IGNORECASE)
+PAGE_NUMBER_PATTERN = re.compile(r"PAGE\s*NUMBER\s*=\s*(\d+)", re.IGNORECASE)
+TITLE_MARKER_PATTERN = re.compile(r"\{\[.*?\]\}")
+
+
+def _is_label(line: str) -> bool:
+    """Headings and table labels are kept in every block so each block reads on its own."""
+    return line.startswith("## ") or line.startswith("[table ")
+
+
+def _table_row(line: str) -> str:
+    """Turn a "['a', 'b', None]" row into "a | b"."""
+    try:
+        cells = ast.literal_eval(line)
+    except (ValueError, SyntaxError):
+        return line
+    if not isinstance(cells, list):
+        return line
+    return " | ".join(str(cell) for cell in cells if cell not in (None, ""))
+
+
+def compact_chunk(text: str, keep_image_links: bool = False) -> Tuple[List[str], List[int]]:
+    """
+    Rewrites a stored chunk without the extraction markup the model does not need.
+
+    Returns:
+        tuple: (compact lines, sorted 1-based page numbers the chunk came from)
+    """
+    pages = sorted({int(page) for page in PAGE_NUMBER_PATTERN.findall(text)})
+    lines: List[str] = []
+
+    for raw_line in text.splitlines():
+        line = TITLE_MARKER_PATTERN.sub("", raw_line).strip()
+        if not line or TABLE_CLOSE_PATTERN.fullmatch(line):
+            continue
+
+        table_open = TABLE_OPEN_PATTERN.fullmatch(line)
+        if table_open:
+            lines.append(f"[table {table_open.group(1)}, page {table_open.group(2)}]")
+            continue
+
+        image_link = IMAGE_LINK_PATTERN.search(line)
+        if image_link:
+            if keep_image_links:
+                lines.append(f"table image: {image_link.group(1)}")
+            continue
+
+        heading = HEADING_PATTERN.fullmatch(line)
+        if heading:
+            lines.append(f"## {heading.group(1).strip()}")
+            continue
+
+        line = BOLD_PATTERN.sub(r"\1", line)
+        if line.startswith("[") and line.endswith("]"):
+            line = _table_row(line)
+        lines.append(re.sub(r"\s+", " ", line))
+
+    return lines, pages
+
+
+def context_instructions(keep_image_links: bool = False) -> str:
+    return ANSWER_INSTRUCTIONS + (" " + TABLE_LINK_INSTRUCTIONS if keep_image_links else "")
+
+
+def build_context(matches: List[Dict[str, Any]], token_budget: int = 3000, keep_image_links: bool = False,
+                  duplicate_threshold: float = 0.8, include_instructions: bool = True) -> Tuple[str, Dict[str, int]]:
+    """
+    Packs retrieved chunks into a compact tool output under a token budget.
+
+    Chunks are taken in score order. A chunk whose lines are mostly (duplicate_threshold)
+    already in the context is dropped, and lines already emitted are not repeated, which
+    removes the overlap between neighbouring chunks and the header rows repeated by split
+    tables. A chunk that does not fit the remaining budget is skipped so a smaller one
+    further down can still be used.
+
+    Args:
+        matches (list): Pinecone matches with 'score' and metadata['text'].
+        token_budget (int): Maximum tokens for the returned context, instructions included.
+        keep_image_links (bool): Keep the localhost table image links.
+        duplicate_threshold (float): Fraction of already-seen lines at which a chunk is dropped.
+        include_instructions (bool): Append the answering instructions (see context_instructions).
+
+    Returns:
+        tuple: (context string, stats with raw_tokens, context_tokens, tokens_saved,
+            chunks_in, chunks_used, duplicates)
+    """
+    instructions = context_instructions(keep_image_links) if include_instructions else ""
+    used_tokens = count_tokens(instructions) + 1 if instructions else 0
+    seen_lines = set()
+    blocks: List[str] = []
+    duplicates = 0
+
+    ranked = sorted(matches, key=lambda match: match.get('score', 0), reverse=True)
+    for match in ranked:
+        lines, pages = compact_chunk(match['metadata']['text'], keep_image_links)
+        if not lines:
+            continue
+
+        content_lines = [line for line in lines if not _is_label(line)]
+        if content_lines:
+            overlap = sum(1 for line in content_lines if line in seen_lines) / len(content_lines)
+            if overlap >= duplicate_threshold:
+                duplicates += 1
+                continue
+
+        new_lines = [line for line in lines if _is_label(line) or line not in seen_lines]
+        page_label = f" pages {','.join(map(str, pages))}" if pages else ""
+        block = f"[{len(blocks) + 1}] score {match.get('score', 0):.3f}{page_label}\n" + "\n".join(new_lines)
+        block_tokens = count_tokens(block) + 1
+        if used_tokens + block_tokens > token_budget:
+            continue
+
+        blocks.append(block)
+        seen_lines.update(new_lines)
+        used_tokens += block_tokens
+
+    context = "\n\n".join(blocks + ([instructions] if instructions else [])) if blocks else \
+        ("No matching results. " + instructions).strip()
+
+    raw_context = "Query Search Results: " + "".join(
+        "\n\n" + '-' * 50 + "\n\n" + f"\nScore: {match.get('score', 0)}\n\n" + match['metadata']['text']
+        for match in matches
+    ) + LEGACY_INSTRUCTIONS
+    raw_tokens = count_tokens(raw_context)
+    context_tokens = count_tokens(context)
+    stats = {
+        "raw_tokens": raw_tokens,
+        "context_tokens": context_tokens,
+        "tokens_saved": raw_tokens - context_tokens,
+        "chunks_in": len(matches),
+        "chunks_used": len(blocks),
+        "duplicates": duplicates,
+    }
+    return context, stats
@@ -7,6 +7,7 @@ import sys
 from collections import defaultdict
 import argparse
 from OpenAI_API.tool_calling import checkNamespace
+from OpenAI_API.warm_cache import warm_cache
 
 
 # Function Definitions
@@ -71,14 +72,8 @@ def load_textract_json(page_number, namespace):
     Returns:
         dict or None: The loaded JSON data or None if file not found or invalid.
     """
-    json_filename = f'PDF_Extraction/AWS_Textract/Cache/{namespace}_{page_number}.json'
-    if not os.path.isfile(json_filename):
-        return None
-    try:
-        with open(json_filename, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        return None
+    # Parsed pages are cached per namespace and may already be warm from a session prefetch
+    return warm_cache.textract_page(namespace, page_number)
 
 def convert_bbox(bbox, page_rect):
     """
@@ -275,8 +270,11 @@ def highlight_pdf(namespace):
     pdf_path = f'PDF_Extraction/AWS_Textract/Inputs/{pdf_name}'
     output_pdf_path = f'PDF_Extraction/AWS_Textract/GET/highlighted_{namespace}.pdf'
 
-    # Load and sort data
-    sorted_data = load_and_sort_data(text_sections_json)
+    # Load and sort data, keeping this namespace's results when several were searched at once
+    sorted_data = [
+        entry for entry in load_and_sort_data(text_sections_json)
+        if entry.get('Namespace', namespace) == namespace
+    ]
 
     if not sorted_data:
         return "No data found in the JSON file. Exiting."
@@ -298,7 +296,8 @@ def highlight_pdf(namespace):
 
     # Open the PDF
     try:
-        pdf_document = fitz.open(pdf_path)
+        pdf_bytes = warm_cache.pdf_bytes(namespace)
+        pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf") if pdf_bytes else fitz.open(pdf_path)
     except Exception as e:
         return f"Error opening PDF file: {e}"
 
@@ -338,8 +337,9 @@ def highlight_pdf(namespace):
         # Build a map from block ID to block
         blocks_map = {block['Id']: block for block in textract_data.get('Blocks', [])}
 
-        # Extract lines and their bounding boxes for this page
-        lines = [block for block in textract_data.get('Blocks', []) if block.get('BlockType') == 'LINE']
+        # Extract lines and their bounding boxes for this page. The parsed page is shared
+        # through the warm cache, so ProcessedText is set on copies of its blocks
+        lines = [dict(block) for block in textract_data.get('Blocks', []) if block.get('BlockType') == 'LINE']
 
         if not lines:
             continue
@@ -349,7 +349,7 @@ def highlight_pdf(namespace):
             line['ProcessedText'] = preprocess_text(line.get('Text', ''))
 
         # Extract tables and their bounding boxes for this page
-        tables = [block for block in textract_data.get('Blocks', []) if block.get('BlockType') == 'TABLE']
+        tables = [dict(block) for block in textract_data.get('Blocks', []) if block.get('BlockType') == 'TABLE']
 
         if tables:
             # Preprocess Textract tables
@@ -418,11 +418,11 @@ def highlight_pdf(namespace):
                     continue
 
                 min_length = int(target_length * 0.8)
-                max_length = int(target_length * 1.2)
 
+                # No upper bound: a chunk may hold only a row group of a split table
                 candidate_tables = [
                     table for table in tables
-                    if min_length <= len(table['ProcessedText']) <= max_length
+                    if min_length <= len(table['ProcessedText'])
                 ]
 
                 if not candidate_tables:
@@ -0,0 +1,80 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+NAMESPACES_PATH = "PDF_Extraction/AWS_Textract/Inputs/Namespaces.json"
+
+
+class NamespaceCatalog:
+    """
+    The list of namespaces from Namespaces.json, shared by the assistant's tools and the API.
+
+    The file is loaded once and re-read only when its mtime changes. Every loaded version
+    gets an ETag (a hash of the file), so clients can revalidate with If-None-Match, and
+    watch() pushes each new version to subscribers instead of making them poll.
+    """
+
+    def __init__(self, path: str = NAMESPACES_PATH, poll_interval: float = 2.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._namespaces: List[Dict[str, Any]] = []
+        self._etag = '"empty"'
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    def snapshot(self) -> Tuple[str, List[Dict[str, Any]]]:
+        """(ETag, namespaces) of the current file, reloading it if it changed."""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        with self._lock:
+            if mtime is not None and mtime != self._mtime:
+                try:
+                    with open(self.path, "rb") as file:
+                        raw = file.read()
+                    self._namespaces = json.loads(raw)
+                    self._etag = f'"{hashlib.sha256(raw).hexdigest()[:16]}"'
+                    self._mtime = mtime
+                except (OSError, ValueError):
+                    pass  # Mid-write, keep serving the version we already have
+            return self._etag, self._namespaces
+
+    def namespaces(self) -> List[Dict[str, Any]]:
+        return self.snapshot()[1]
+
+    def names(self) -> List[str]:
+        return [namespace["NamespaceName"] for namespace in self.namespaces()]
+
+    def subscribe(self) -> asyncio.Queue:
+        """Queue that receives (ETag, namespaces) whenever the catalog changes."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    def _publish(self, version: Tuple[str, List[Dict[str, Any]]]) -> None:
+        for queue in list(self._subscribers):
+            # A slow subscriber only needs the latest version, drop the one it has not read
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(version)
+
+    async def watch(self) -> None:
+        """Checks the file every poll_interval seconds and notifies subscribers of changes."""
+        etag, _ = self.snapshot()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            version = await asyncio.to_thread(self.snapshot)
+            if version[0] != etag:
+                etag = version[0]
+                self._publish(version)
+
+
+namespace_catalog = NamespaceCatalog()
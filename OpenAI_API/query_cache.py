@@ -0,0 +1,204 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def _normalize(vector: List[float]) -> np.ndarray:
+    unit = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(unit))
+    return unit / norm if norm else unit
+
+
+def _normalize_query(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class NamespaceVersions:
+    """
+    Reads the per-namespace versions that ingestion bumps in pinecone.json whenever a
+    namespace's vectors change. The file is only re-read when its mtime changes.
+    """
+
+    def __init__(self, path: str = "Pinecone/pinecone.json"):
+        self.path = path
+        self._mtime: Optional[float] = None
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str) -> int:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return 0
+        with self._lock:
+            if mtime != self._mtime:
+                try:
+                    with open(self.path, "r") as json_file:
+                        self._versions = json.load(json_file).get("namespace_versions", {})
+                    self._mtime = mtime
+                except (OSError, ValueError):
+                    pass  # Mid-write, keep the versions we already have
+            return self._versions.get(namespace, 0)
+
+
+class _NamespaceEntries:
+    """
+    One namespace's cached queries in LRU order. Their unit embeddings are rows of a single
+    matrix, so finding the most similar query is one matrix-vector product.
+    """
+
+    def __init__(self, version: int, capacity: int):
+        self.version = version
+        self.capacity = capacity
+        # query text -> (created, matrix row, raw embedding, results)
+        self.entries: "OrderedDict[str, Tuple[float, int, List[float], List[Dict[str, Any]]]]" = OrderedDict()
+        # Allocated on the first store, once the embedding size is known
+        self.matrix: Optional[np.ndarray] = None
+        self.used = np.zeros(capacity, dtype=bool)
+        self.row_keys: List[Optional[str]] = [None] * capacity
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def remove(self, key: str) -> None:
+        _, row, _, _ = self.entries.pop(key)
+        self.used[row] = False
+        self.row_keys[row] = None
+
+    def add(self, key: str, unit: np.ndarray, raw: List[float], results: List[Dict[str, Any]]) -> None:
+        if self.matrix is None or self.matrix.shape[1] != unit.shape[0]:
+            self.matrix = np.zeros((self.capacity, unit.shape[0]), dtype=np.float32)
+            self.entries.clear()
+            self.used[:] = False
+            self.row_keys = [None] * self.capacity
+        if key in self.entries:
+            self.remove(key)
+        elif len(self.entries) >= self.capacity:
+            self.remove(next(iter(self.entries)))
+        row = int(np.argmin(self.used))
+        self.matrix[row] = unit
+        self.used[row] = True
+        self.row_keys[row] = key
+        self.entries[key] = (time.time(), row, raw, results)
+
+    def most_similar(self, unit: np.ndarray, threshold: float) -> Optional[str]:
+        """Key of the cached query with the highest cosine similarity, if at least threshold."""
+        if not self.entries or self.matrix.shape[1] != unit.shape[0]:
+            return None
+        similarities = self.matrix @ unit
+        similarities[~self.used] = -np.inf
+        row = int(np.argmax(similarities))
+        return self.row_keys[row] if similarities[row] >= threshold else None
+
+
+class SemanticQueryCache:
+    """
+    Caches retrieval results per namespace, keyed by the query embedding. A new query whose
+    embedding has cosine similarity of at least `threshold` with a cached one is answered
+    from the cache, skipping the sparse embedding and the vector query. Repeats of the exact
+    same query text also skip the dense embedding.
+
+    Entries expire after `ttl` seconds, and a namespace's entries are dropped as soon as its
+    version in pinecone.json changes, i.e. when it has been re-ingested.
+    """
+
+    def __init__(
+            self,
+            threshold: float = 0.93,
+            ttl: float = 3600,
+            max_entries_per_namespace: int = 128,
+            versions: Optional[NamespaceVersions] = None
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries_per_namespace = max_entries_per_namespace
+        self.versions = versions if versions else NamespaceVersions()
+        self._entries: Dict[str, _NamespaceEntries] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.exact_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.expirations = 0
+
+    def _namespace_entries(self, namespace: str) -> _NamespaceEntries:
+        """Entries for the namespace, dropped first if it has been re-ingested. Call with the lock held."""
+        version = self.versions.get(namespace)
+        entries = self._entries.get(namespace)
+        if entries is not None and entries.version != version:
+            self.invalidations += 1
+            entries = None
+        if entries is None:
+            entries = self._entries[namespace] = _NamespaceEntries(version, self.max_entries_per_namespace)
+        return entries
+
+    def _expire(self, entries: _NamespaceEntries) -> None:
+        cutoff = time.time() - self.ttl
+        for query in [query for query, entry in entries.entries.items() if entry[0] < cutoff]:
+            entries.remove(query)
+            self.expirations += 1
+
+    def cached_embedding(self, namespace: str, query: str) -> Optional[List[float]]:
+        """Embedding of a query asked before with exactly the same text, if still cached."""
+        with self._lock:
+            entries = self._namespace_entries(namespace)
+            self._expire(entries)
+            entry = entries.entries.get(_normalize_query(query))
+            return entry[2] if entry else None
+
+    def lookup(self, namespace: str, query: str, embedding: List[float]) -> Optional[List[Dict[str, Any]]]:
+        """Cached results for the most similar earlier query, or None on a miss."""
+        unit = _normalize(embedding)
+        with self._lock:
+            entries = self._namespace_entries(namespace)
+            self._expire(entries)
+
+            key = _normalize_query(query)
+            if key in entries.entries:
+                self.hits += 1
+                self.exact_hits += 1
+                entries.entries.move_to_end(key)
+                return entries.entries[key][3]
+
+            best_key = entries.most_similar(unit, self.threshold)
+            if best_key is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entries.entries.move_to_end(best_key)
+            return entries.entries[best_key][3]
+
+    def store(self, namespace: str, query: str, embedding: List[float], results: List[Dict[str, Any]]) -> None:
+        # Keep plain dicts so cached results do not hold on to client response objects
+        results = [
+            {"id": match["id"], "score": match["score"], "metadata": dict(match["metadata"])}
+            for match in results
+        ]
+        with self._lock:
+            entries = self._namespace_entries(namespace)
+            entries.add(_normalize_query(query), _normalize(embedding), list(embedding), results)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "exact_hits": self.exact_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "expirations": self.expirations,
+                "entries": sum(len(entries) for entries in self._entries.values()),
+            }
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        return (f"Query cache: {stats['hits']} hits ({stats['exact_hits']} exact), {stats['misses']} misses, "
+                f"hit rate {stats['hit_rate']:.0%}, {stats['entries']} entries, "
+                f"{stats['invalidations']} invalidations, {stats['expirations']} expirations")
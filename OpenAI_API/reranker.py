@@ -0,0 +1,126 @@
+import re
+from collections import Counter
+from typing import AbstractSet, Any, Dict, List, Optional
+
+import numpy as np
+
+TAG_PATTERN = re.compile(r"<[^<>]+>")
+TERM_PATTERN = re.compile(r"[a-z0-9]+(?:[-.][a-z0-9]+)*")
+CAS_PATTERN = re.compile(r"\b\d{2,7}-\d{2}-\d\b")
+SECTION_PATTERN = re.compile(r"\bsection\s*(\d{1,2}(?:\.\d{1,2})?)\b", re.IGNORECASE)
+CAMEL_CASE_PATTERN = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+
+# Namespace words that name the document type rather than the product
+DOCUMENT_TYPE_WORDS = {"label", "sds", "msds"}
+
+
+def tokenize(text: str) -> List[str]:
+    return TERM_PATTERN.findall(TAG_PATTERN.sub(" ", text).lower())
+
+
+def product_terms(namespace: str) -> List[str]:
+    """Product words of a namespace, e.g. "DuPontMatrixLabel" -> ["du", "pont", "matrix"]."""
+    words = CAMEL_CASE_PATTERN.sub(" ", namespace).replace("_", " ").replace("-", " ")
+    return [word for word in tokenize(words) if word not in DOCUMENT_TYPE_WORDS]
+
+
+def contains_product(product: List[str], tokens: AbstractSet[str]) -> bool:
+    """
+    Whether a chunk's tokens name the product: every product word is a whole token, or a
+    run of consecutive product words is written as one ("du", "pont" in "DuPont").
+    """
+    covered = [True] + [False] * len(product)
+    for end in range(1, len(product) + 1):
+        covered[end] = any(covered[start] and "".join(product[start:end]) in tokens for start in range(end))
+    return covered[-1]
+
+
+class BM25Reranker:
+    """
+    Reorders retrieved chunks on the CPU by blending the vector score with BM25 computed
+    over the retrieved set itself, plus boosts for chunks containing the exact CAS numbers
+    and SDS section numbers named in the question and the product name of the namespace.
+
+    BM25 is computed with numpy over a chunks x query terms frequency matrix, so scoring
+    stays a handful of array operations however many chunks are retrieved.
+    """
+
+    def __init__(
+            self,
+            k1: float = 1.2,
+            b: float = 0.75,
+            lexical_weight: float = 0.1,
+            cas_boost: float = 0.1,
+            section_boost: float = 0.05,
+            product_boost: float = 0.02
+    ):
+        self.k1 = k1
+        self.b = b
+        self.lexical_weight = lexical_weight
+        self.cas_boost = cas_boost
+        self.section_boost = section_boost
+        self.product_boost = product_boost
+
+    def _bm25(self, query_terms: List[str], documents: List[Counter], lengths: List[int]) -> List[float]:
+        # A term repeated in the query counts once per repetition
+        query_counts = Counter(query_terms)
+        terms = list(query_counts)
+        frequency = np.array([[document.get(term, 0) for term in terms] for document in documents], dtype=float)
+        lengths_array = np.array(lengths, dtype=float)
+
+        n_docs = len(documents)
+        average_length = lengths_array.mean() or 1.0
+        document_frequency = np.count_nonzero(frequency, axis=0)
+        idf = np.log(1 + (n_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+
+        norm = self.k1 * (1 - self.b + self.b * lengths_array / average_length)
+        saturated = frequency * (self.k1 + 1) / (frequency + norm[:, None])
+        weights = np.array([query_counts[term] for term in terms], dtype=float) * idf
+        return (saturated @ weights).tolist()
+
+    def rerank(self, query: str, matches: List[Dict[str, Any]], namespace: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Args:
+            query (str): The user's question, without anything appended for embedding.
+            matches (list): Pinecone matches with 'id', 'score' and metadata['text'].
+            namespace (str): Namespace searched, used for the product name boost.
+
+        Returns:
+            list: Matches as dicts, best first, with the blended 'score' and the original
+                'vector_score'.
+        """
+        if not matches:
+            return []
+
+        texts = [match['metadata']['text'] for match in matches]
+        lowered = [text.lower() for text in texts]
+        token_lists = [tokenize(text) for text in texts]
+        documents = [Counter(tokens) for tokens in token_lists]
+        lengths = [len(tokens) for tokens in token_lists]
+
+        query_terms = tokenize(query)
+        bm25_scores = self._bm25(query_terms, documents, lengths) if query_terms else [0.0] * len(matches)
+        top_bm25 = max(bm25_scores) or 1.0
+
+        cas_numbers = CAS_PATTERN.findall(query)
+        sections = [re.compile(rf"\bsection\s*{re.escape(number)}\b") for number in SECTION_PATTERN.findall(query)]
+        product = product_terms(namespace) if namespace else []
+
+        reranked = []
+        for match, text, document, bm25 in zip(matches, lowered, documents, bm25_scores):
+            score = match['score'] + self.lexical_weight * bm25 / top_bm25
+            if any(cas in text for cas in cas_numbers):
+                score += self.cas_boost
+            if any(section.search(text) for section in sections):
+                score += self.section_boost
+            if product and contains_product(product, document.keys()):
+                score += self.product_boost
+            reranked.append({
+                "id": match['id'],
+                "score": score,
+                "vector_score": match['score'],
+                "metadata": match['metadata'],
+            })
+
+        reranked.sort(key=lambda match: match['score'], reverse=True)
+        return reranked
@@ -0,0 +1,78 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from Embeddings.tokenizer import count_tokens
+
+# Matches requested from Pinecone before the cutoff is applied. Metadata only, no vector
+# values, so fetching a wider candidate set costs little more than the old fixed top_k.
+OVERFETCH_K = 25
+
+
+def adaptive_cutoff(
+        matches: List[Dict[str, Any]],
+        min_k: int = 3,
+        max_k: int = 15,
+        max_score_gap: float = 0.08,
+        min_relative_score: float = 0.75,
+        token_budget: Optional[int] = None
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Chooses how many of the over-fetched matches are worth sending to the model.
+
+    The first min_k matches are always kept. After that the list is cut at the first match
+    that falls more than max_score_gap below the one before it, scores under
+    min_relative_score times the top score, or would push the chunk text past token_budget.
+
+    Args:
+        matches (list): Pinecone matches, each with 'score' and metadata['text'].
+        min_k (int): Matches kept regardless of their scores.
+        max_k (int): Hard cap on the number of matches kept.
+        max_score_gap (float): Largest drop allowed between consecutive scores.
+        min_relative_score (float): Lowest score kept, as a fraction of the top score.
+        token_budget (int): Optional cap on the total tokens of the kept chunk texts.
+
+    Returns:
+        tuple: (kept matches, stats with fetched, k, reason, top_score, cutoff_score, scores)
+    """
+    ranked = sorted(matches, key=lambda match: match.get('score', 0), reverse=True)
+    scores = [match.get('score', 0) for match in ranked]
+    kept: List[Dict[str, Any]] = []
+    used_tokens = 0
+    reason = "exhausted"
+
+    for idx, match in enumerate(ranked):
+        if len(kept) >= max_k:
+            reason = "max_k"
+            break
+
+        tokens = count_tokens(match['metadata']['text'])
+        if idx >= min_k:
+            if scores[idx - 1] - scores[idx] > max_score_gap:
+                reason = "score_gap"
+                break
+            if scores[0] > 0 and scores[idx] < scores[0] * min_relative_score:
+                reason = "relative_score"
+                break
+            if token_budget and used_tokens + tokens > token_budget:
+                reason = "token_budget"
+                break
+
+        kept.append(match)
+        used_tokens += tokens
+
+    stats = {
+        "fetched": len(ranked),
+        "k": len(kept),
+        "reason": reason,
+        "tokens": used_tokens,
+        "top_score": scores[0] if scores else None,
+        "cutoff_score": scores[len(kept) - 1] if kept else None,
+        "scores": [round(score, 3) for score in scores],
+    }
+    return kept, stats
+
+
+def format_cutoff_stats(stats: Dict[str, Any]) -> str:
+    if not stats["fetched"]:
+        return "Retrieval: no matches"
+    return (f"Retrieval: k={stats['k']}/{stats['fetched']} ({stats['reason']}), {stats['tokens']} tokens, "
+            f"top={stats['top_score']:.3f} cutoff={stats['cutoff_score']:.3f} scores={stats['scores']}")
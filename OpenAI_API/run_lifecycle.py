@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+# Run statuses after which nothing more streams and cancelling is pointless
+TERMINAL_STATES = frozenset({"completed", "cancelled", "failed", "expired", "incomplete"})
+
+
+class CancelMetrics:
+    """Cancel-to-quiet latencies of this process: from a stop request until local streaming has ended."""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.cancels = 0
+
+    def record(self, latency_ms: float) -> None:
+        with self._lock:
+            self._latencies.append(latency_ms)
+            self.cancels += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            cancels = self.cancels
+        if not latencies:
+            return {"cancels": cancels}
+        return {
+            "cancels": cancels,
+            "p50_ms": round(latencies[len(latencies) // 2], 2),
+            "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+            "max_ms": round(latencies[-1], 2),
+        }
+
+
+cancel_metrics = CancelMetrics()
+
+
+class RunLifecycle:
+    """
+    State of the run streaming on a thread, driven by the stream's own events rather than by
+    retrieving the run, so it is always the run that is actually streaming.
+
+    The streaming thread calls start(), on_event() and quiet(); the event loop calls
+    request_stop(). A stop is seen by the streaming thread at its next event or delta.
+    """
+
+    def __init__(self, metrics: CancelMetrics = cancel_metrics):
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self.stopped = threading.Event()
+        # Set once the streaming thread is done with the run, including any late cancel
+        self.quieted = threading.Event()
+        self.run_id: Optional[str] = None
+        self.state = "idle"
+        self._stop_requested_at: Optional[float] = None
+        self._cancel_sent_for: Optional[str] = None
+
+    def start(self) -> None:
+        """Resets the state for a new turn."""
+        with self._lock:
+            self.stopped.clear()
+            self.quieted.clear()
+            self.run_id = None
+            self.state = "starting"
+            self._stop_requested_at = None
+            self._cancel_sent_for = None
+
+    def on_event(self, event) -> None:
+        """Follows thread.run.* events; other events are ignored."""
+        if not event.event.startswith("thread.run.") or event.event.startswith("thread.run.step"):
+            return
+        with self._lock:
+            self.run_id = event.data.id
+            self.state = event.data.status
+
+    @property
+    def active(self) -> bool:
+        return self.state not in TERMINAL_STATES and self.state != "idle"
+
+    def request_stop(self) -> Optional[str]:
+        """
+        Stops local streaming and returns the run ID to cancel on the server, or None if no
+        run has been created yet, it has finished, or a cancel was already sent for it.
+        """
+        with self._lock:
+            if self._stop_requested_at is None:
+                self._stop_requested_at = time.perf_counter()
+            self.stopped.set()
+            if self.run_id is None or self.state in TERMINAL_STATES or self._cancel_sent_for == self.run_id:
+                return None
+            self._cancel_sent_for = self.run_id
+            return self.run_id
+
+    def settle(self, status: str) -> None:
+        """Records a status read from the server after streaming ended, e.g. "cancelled"."""
+        with self._lock:
+            self.state = status
+
+    def quiet(self) -> None:
+        """Called when local streaming has ended; records the latency if it ended on a stop."""
+        with self._lock:
+            if self.state not in TERMINAL_STATES:
+                self.state = "cancelling" if self.stopped.is_set() else "idle"
+            started = self._stop_requested_at
+            self._stop_requested_at = None
+        self.quieted.set()
+        if started is not None:
+            latency_ms = (time.perf_counter() - started) * 1000
+            self.metrics.record(latency_ms)
+            print(f"Run {self.run_id} quiet {latency_ms:.1f} ms after the stop request. {self.metrics.stats()}")
+
+
+def wait_for_terminal(client, thread_id: str, run_id: str, timeout: float = 10.0,
+                      delay: float = 0.1, max_delay: float = 1.0) -> Optional[str]:
+    """
+    Polls a run until it reaches a terminal status. A thread rejects new messages while its
+    run is still "cancelling", so a cancel is followed by this before posting again.
+
+    Returns:
+        str: The terminal status, or None if the run had not finished within timeout.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        status = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id).status
+        if status in TERMINAL_STATES:
+            return status
+        if time.monotonic() + delay > deadline:
+            return None
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+
+async def wait_for_terminal_async(async_client, thread_id: str, run_id: str, timeout: float = 10.0,
+                                  delay: float = 0.1, max_delay: float = 1.0) -> Optional[str]:
+    """wait_for_terminal for the event loop, polling through an AsyncOpenAI client."""
+    deadline = time.monotonic() + timeout
+    while True:
+        run = await async_client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+        if run.status in TERMINAL_STATES:
+            return run.status
+        if time.monotonic() + delay > deadline:
+            return None
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, max_delay)
@@ -0,0 +1,172 @@
+import base64
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from OpenAI_API.context_builder import compact_chunk
+from OpenAI_API.query_cache import NamespaceVersions
+from OpenAI_API.reranker import BM25Reranker
+from OpenAI_API.utils import extract_tags_and_pages
+
+SEARCH_POOL_K = 50
+PREVIEW_CHARS = 400
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor is malformed or belongs to a different query."""
+
+
+def _query_key(namespace: str, query: str) -> str:
+    normalized = re.sub(r"\s+", " ", query).strip().lower()
+    return hashlib.sha256(f"{namespace}\x00{normalized}".encode("utf-8")).hexdigest()[:16]
+
+
+def encode_cursor(query_key: str, offset: int) -> str:
+    raw = json.dumps({"q": query_key, "o": offset}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str, query_key: str) -> int:
+    """Offset a cursor points at, checked against the query it was issued for."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        offset = int(data["o"])
+        cursor_key = data["q"]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    if cursor_key != query_key or offset < 0:
+        raise InvalidCursor("Cursor does not belong to this query")
+    return offset
+
+
+class HybridSearch:
+    """
+    Paginated hybrid search over one namespace for the /search endpoint.
+
+    The first request for a query embeds it, queries Pinecone with the dense and sparse
+    vectors for a pool of `pool_k` candidates, reranks them and extracts each hit's page
+    numbers. The ranked pool is cached, so following pages are slices of it and cost no
+    model or database calls; it is dropped after `ttl` seconds or when the namespace is
+    re-ingested.
+
+    Dependencies are passed in so the server can build them with absolute paths.
+    """
+
+    def __init__(self, database, embedding_model, pinecone_sparse: Callable[[str], Dict[str, Any]],
+                 sparse_encoder=None, versions: Optional[NamespaceVersions] = None,
+                 reranker: Optional[BM25Reranker] = None, index_name: str = "rag-model",
+                 pool_k: int = SEARCH_POOL_K, ttl: float = 300, max_entries: int = 256):
+        self.database = database
+        self.embedding_model = embedding_model
+        self.pinecone_sparse = pinecone_sparse
+        self.sparse_encoder = sparse_encoder
+        self.versions = versions
+        self.reranker = reranker if reranker else BM25Reranker()
+        self.index_name = index_name
+        self.pool_k = pool_k
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # query key -> (created, namespace version, ranked hits)
+        self._pools: "OrderedDict[str, Tuple[float, int, List[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached_pool(self, key: str, version: int) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            entry = self._pools.get(key)
+            if entry is None:
+                return None
+            created, pool_version, hits = entry
+            if pool_version != version or time.monotonic() - created > self.ttl:
+                del self._pools[key]
+                return None
+            self._pools.move_to_end(key)
+            return hits
+
+    def _store_pool(self, key: str, version: int, hits: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._pools[key] = (time.monotonic(), version, hits)
+            self._pools.move_to_end(key)
+            while len(self._pools) > self.max_entries:
+                self._pools.popitem(last=False)
+
+    def _build_pool(self, namespace: str, query: str, timings: Dict[str, float]) -> List[Dict[str, Any]]:
+        started = time.perf_counter()
+        embedding = self.embedding_model.embedding(query)["Embedding"]
+        timings["embed"] = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        sparse_vector = self.sparse_encoder.encode_query(namespace, query) if self.sparse_encoder else None
+        if sparse_vector is None:
+            sparse_vector = self.pinecone_sparse(query)
+        timings["sparse"] = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        matches = self.database.query(
+            index_name=self.index_name,
+            embedding=embedding,
+            indices=sparse_vector["indices"],
+            values=sparse_vector["values"],
+            namespace=namespace,
+            top_k=self.pool_k,
+            include_values=False
+        )
+        timings["query"] = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        ranked = self.reranker.rerank(query, matches, namespace)
+        hits = []
+        for rank, match in enumerate(ranked, start=1):
+            text = match["metadata"]["text"]
+            hits.append({
+                "rank": rank,
+                "id": match["id"],
+                "score": round(match["score"], 4),
+                "vector_score": round(match["vector_score"], 4),
+                # extract_tags_and_pages is zero-based, the UI links to 1-based PDF pages
+                "pages": [page + 1 for page in extract_tags_and_pages(text)],
+                "preview": "\n".join(compact_chunk(text)[0])[:PREVIEW_CHARS],
+            })
+        timings["rerank"] = (time.perf_counter() - started) * 1000
+        return hits
+
+    def search(self, namespace: str, query: str, cursor: Optional[str] = None,
+               limit: int = 10) -> Tuple[List[Dict[str, Any]], Optional[str], int, Dict[str, Any]]:
+        """
+        One page of results.
+
+        Returns:
+            tuple: (hits, cursor of the next page or None, total hits in the pool, timings)
+                where timings holds milliseconds per stage and whether the pool was cached.
+
+        Raises:
+            InvalidCursor: If the cursor was not issued for this namespace and query.
+        """
+        key = _query_key(namespace, query)
+        offset = decode_cursor(cursor, key) if cursor else 0
+        version = self.versions.get(namespace) if self.versions else 0
+
+        timings: Dict[str, Any] = {}
+        hits = self._cached_pool(key, version)
+        timings["cached"] = hits is not None
+        if hits is None:
+            hits = self._build_pool(namespace, query, timings)
+        # PineconeDatabase.query returns no matches when it fails, so an empty pool is not
+        # kept: it would hide the namespace's results for the whole TTL
+        if not timings["cached"] and hits:
+            self._store_pool(key, version, hits)
+
+        page = hits[offset:offset + limit]
+        next_offset = offset + len(page)
+        next_cursor = encode_cursor(key, next_offset) if next_offset < len(hits) else None
+        return page, next_cursor, len(hits), timings
+
+
+def server_timing(timings: Dict[str, Any]) -> str:
+    """Formats search timings as a Server-Timing header value."""
+    parts = [f"{stage};dur={duration:.1f}" for stage, duration in timings.items() if stage != "cached"]
+    parts.append(f'pool;desc="{"cached" if timings.get("cached") else "built"}"')
+    return ", ".join(parts)
@@ -0,0 +1,109 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+
+class SQLiteSessionStore:
+    """
+    Chat sessions in a local SQLite database: the OpenAI thread of each session and the run
+    currently streaming on it. Every worker of the chat server on the same machine opens the
+    same file, so any worker can pick up any session and no sticky routing is needed.
+    """
+
+    def __init__(self, path: str = "OpenAI_API/sessions.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, thread_id TEXT NOT NULL, run_id TEXT, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Optional[str]]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT thread_id, run_id FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return {"thread_id": row[0], "run_id": row[1]} if row else None
+
+    def set_thread(self, session_id: str, thread_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, NULL, ?)", (session_id, thread_id, time.time())
+            )
+
+    def set_run(self, session_id: str, run_id: Optional[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE sessions SET run_id = ?, updated_at = ? WHERE session_id = ?", (run_id, time.time(), session_id)
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# Updates the run of a session only while the session exists: a plain HSET on an expired
+# key would create a hash without a thread_id
+SET_RUN_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], 'thread_id') == 1 then
+    redis.call('HSET', KEYS[1], 'run_id', ARGV[1])
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+class RedisSessionStore:
+    """
+    Chat sessions in Redis or any server speaking its protocol (KeyDB, Valkey, ...), for
+    workers spread over several machines. Sessions expire after `ttl` seconds without use.
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", ttl: int = 7 * 24 * 3600):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis session store needs the 'redis' package (pip install redis).")
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._set_run = self._redis.register_script(SET_RUN_SCRIPT)
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(session_id: str) -> str:
+        return f"chat_session:{session_id}"
+
+    def get(self, session_id: str) -> Optional[Dict[str, Optional[str]]]:
+        session = self._redis.hgetall(self._key(session_id))
+        if not session.get("thread_id"):
+            return None
+        return {"thread_id": session["thread_id"], "run_id": session.get("run_id") or None}
+
+    def set_thread(self, session_id: str, thread_id: str) -> None:
+        key = self._key(session_id)
+        with self._redis.pipeline() as pipe:
+            pipe.delete(key)
+            pipe.hset(key, mapping={"thread_id": thread_id, "run_id": ""})
+            pipe.expire(key, self.ttl)
+            pipe.execute()
+
+    def set_run(self, session_id: str, run_id: Optional[str]) -> None:
+        # Like the SQLite UPDATE, a session that has expired is left alone
+        self._set_run(keys=[self._key(session_id)], args=[run_id or "", self.ttl])
+
+    def close(self) -> None:
+        self._redis.close()
+
+
+def create_session_store(backend: str = "sqlite", sqlite_path: str = "OpenAI_API/sessions.db",
+                         redis_url: str = "redis://localhost:6379/0"):
+    """Builds the "sqlite" (workers on one machine) or "redis" (workers on several) session store."""
+    if backend == "sqlite":
+        return SQLiteSessionStore(sqlite_path)
+    if backend == "redis":
+        return RedisSessionStore(redis_url)
+    raise ValueError(f"Unknown session store backend: {backend}")
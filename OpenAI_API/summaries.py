@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from OpenAI_API.context_builder import HEADING_PATTERN, compact_chunk
+
+SUMMARY_MODEL = "gpt-4o-mini"
+
+SECTION_PROMPT = (
+    "Summarize this section of a crop protection product Label or Safety Data Sheet in 2-4 sentences. "
+    "Keep product names, CAS numbers, rates, crops and hazard statements exactly as written."
+)
+DOCUMENT_PROMPT = (
+    "Write a one-paragraph overview of this Label or Safety Data Sheet from its section summaries: what the "
+    "product is, what it is used on, and its main hazards and restrictions."
+)
+
+# Before every opening <HEADING> tag, not before the closing <HEADING/>
+_SECTION_SPLIT_PATTERN = re.compile(r"(?=<HEADING(?![^>]*/>)[^>]*>)", re.IGNORECASE)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def split_sections(content: str, min_chars: int = 200) -> List[Tuple[str, str]]:
+    """
+    Splits extraction output at <HEADING> tags into (heading, compact text) sections. Sections
+    shorter than min_chars are folded into the one before them.
+    """
+    sections: List[Tuple[str, str]] = []
+    for block in _SECTION_SPLIT_PATTERN.split(content):
+        lines, _ = compact_chunk(block)
+        if not lines:
+            continue
+        first_line = block.strip().splitlines()[0]
+        heading = HEADING_PATTERN.match(first_line)
+        title = heading.group(1).strip() if heading else "Introduction"
+        text = "\n".join(lines)
+        if sections and len(text) < min_chars:
+            previous_title, previous_text = sections[-1]
+            sections[-1] = (previous_title, f"{previous_text}\n{text}")
+        else:
+            sections.append((title, text))
+    return sections
+
+
+class SummaryStore:
+    """
+    Precomputed summaries, one JSON file per namespace in `directory`, holding the document
+    summary, per-section summaries and the hash of the content they were generated from.
+    Files are re-read only when they change, so serving a summary is a dict lookup.
+    """
+
+    def __init__(self, directory: str = "Pinecone/summaries"):
+        self.directory = directory
+        self._loaded: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def path(self, namespace: str) -> str:
+        return os.path.join(self.directory, f"{namespace}.json")
+
+    def get(self, namespace: str) -> Optional[Dict[str, Any]]:
+        if os.path.basename(namespace) != namespace:
+            return None
+        path = self.path(namespace)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._loaded.get(namespace)
+            if cached and cached[0] == mtime:
+                return cached[1]
+        try:
+            with open(path, "r", encoding="utf-8") as json_file:
+                record = json.load(json_file)
+        except (OSError, json.JSONDecodeError):
+            return None
+        with self._lock:
+            self._loaded[namespace] = (mtime, record)
+        return record
+
+    def put(self, namespace: str, record: Dict[str, Any]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(namespace)
+        with open(path + ".tmp", "w", encoding="utf-8") as json_file:
+            json.dump(record, json_file, indent=4)
+        os.replace(path + ".tmp", path)
+
+
+def _complete(client, model: str, instructions: str, text: str) -> str:
+    response = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": instructions},
+            {"role": "user", "content": text},
+        ],
+        temperature=0,
+    )
+    return response.choices[0].message.content.strip()
+
+
+def refresh_summary(store: SummaryStore, namespace: str, content: str, client=None,
+                    model: str = SUMMARY_MODEL, workers: int = 4, max_section_chars: int = 8000,
+                    force: bool = False) -> bool:
+    """
+    Regenerates a namespace's summaries if its content hash changed since they were made.
+    Sections whose text is unchanged keep their previous summary, so an edit to one section
+    costs one section call plus the document call.
+
+    Args:
+        store (SummaryStore): Where summaries are kept.
+        namespace (str): Namespace the content was ingested into.
+        content (str): The full extraction output that was chunked and embedded.
+        client: OpenAI client, created from the environment when None.
+        force (bool): Regenerate even if the content hash is unchanged.
+
+    Returns:
+        bool: True if summaries were regenerated.
+    """
+    content_hash = text_hash(content)
+    previous = store.get(namespace)
+    if previous and previous.get("content_hash") == content_hash and not force:
+        print(f"Summary of {namespace} is up to date.")
+        return False
+
+    if client is None:
+        from openai import OpenAI
+        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    started = time.perf_counter()
+    reusable = {} if force or not previous else {
+        section["hash"]: section["summary"] for section in previous.get("sections", [])
+    }
+    sections = split_sections(content)
+    hashes = [text_hash(text) for _, text in sections]
+    pending = [i for i, section_hash in enumerate(hashes) if section_hash not in reusable]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        generated = dict(zip(pending, executor.map(
+            lambda i: _complete(client, model, SECTION_PROMPT, f"{sections[i][0]}\n{sections[i][1][:max_section_chars]}"),
+            pending
+        )))
+
+    section_records = [
+        {"heading": heading, "hash": hashes[i], "summary": generated[i] if i in generated else reusable[hashes[i]]}
+        for i, (heading, _) in enumerate(sections)
+    ]
+    overview = "\n".join(f"{section['heading']}: {section['summary']}" for section in section_records)
+    summary = _complete(client, model, DOCUMENT_PROMPT, overview) if section_records else ""
+
+    store.put(namespace, {
+        "namespace": namespace,
+        "content_hash": content_hash,
+        "model": model,
+        "generated_at": time.time(),
+        "summary": summary,
+        "sections": section_records,
+    })
+    print(f"Summarized {namespace}: {len(pending)} of {len(sections)} sections regenerated "
+          f"in {time.perf_counter() - started:.1f}s.")
+    return True
@@ -1,6 +1,7 @@
 import json
 import os
 import pandas as pd
+from OpenAI_API.warm_cache import warm_cache
 
 
 def extract_tables(textract_response):
@@ -186,18 +187,14 @@ def getExcel(namespace, page_number, table_number):
     Returns:
         str: A string with information about the saved table(s) and file location.
     """
-    # Construct the JSON file path
-    json_path = f"PDF_Extraction/AWS_Textract/Cache/{namespace}_{page_number}.json"
+    # Construct the output file path
     output_excel_path = f"PDF_Extraction/AWS_Textract/GET/{namespace}_page{page_number}_tables.xlsx"
 
-    # Check if the JSON file exists
-    if not os.path.exists(json_path):
+    # Load the raw Textract JSON response, cached per namespace
+    textract_response = warm_cache.textract_page(namespace, page_number)
+    if textract_response is None:
         return f"No JSON file found for namespace '{namespace}' and page {page_number}."
 
-    # Load the raw Textract JSON response
-    with open(json_path, "r") as f:
-        textract_response = json.load(f)
-
     # Extract tables from the JSON
     tables = extract_tables(textract_response)
 
@@ -6,13 +6,22 @@ from LangChain.Model import Model
 from LangChain.OpenAI_Model import OpenAI_Model
 from Embeddings.Embedding import Embeddings
 from Embeddings.text_embedding_3_large import text_embedding_3_large_openAI
+from Embeddings.sparse_encoder import BM25SparseEncoder
 import os
-from difflib import get_close_matches
 import json
 from OpenAI_API.utils import *
+from OpenAI_API.context_builder import build_context, context_instructions
+from OpenAI_API.retrieval import OVERFETCH_K, adaptive_cutoff, format_cutoff_stats
+from OpenAI_API.reranker import BM25Reranker
+from OpenAI_API.query_cache import SemanticQueryCache
+from OpenAI_API.warm_cache import warm_cache
+from OpenAI_API.namespace_catalog import namespace_catalog
+from OpenAI_API.summaries import SummaryStore
 from openai import OpenAI
 from pinecone import Pinecone
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 
 
@@ -24,6 +33,32 @@ llm_database: VectorDatabase = PineconeDatabase()
 
 embedding_llm: Embeddings = text_embedding_3_large_openAI()
 
+sparse_encoder = BM25SparseEncoder("Pinecone/sparse_stats")
+
+# Document and section summaries precomputed at ingestion
+summary_store = SummaryStore("Pinecone/summaries")
+
+# Maximum tokens vectorDB_tool hands back to the model per call
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Choose top_k per query from the score distribution instead of the fixed 15 (7 for SDS)
+ADAPTIVE_RETRIEVAL = os.getenv("ADAPTIVE_RETRIEVAL", "1") != "0"
+# Maximum tokens of raw chunk text kept by the adaptive cutoff
+RETRIEVAL_TOKEN_CAP = int(os.getenv("RETRIEVAL_TOKEN_CAP", "6000"))
+# Rerank retrieved chunks with BM25 and exact-term boosts before the cutoff
+RERANK = os.getenv("RERANK", "1") != "0"
+reranker = BM25Reranker()
+# Answer near-identical questions about the same namespace from cached retrieval results
+QUERY_CACHE = os.getenv("QUERY_CACHE", "1") != "0"
+query_cache = SemanticQueryCache(
+    threshold=float(os.getenv("QUERY_CACHE_THRESHOLD", "0.93")),
+    ttl=float(os.getenv("QUERY_CACHE_TTL", "3600"))
+)
+# multiNamespace_tool: matches kept across all namespaces, split evenly with at least
+# FANOUT_MIN_QUOTA per namespace, and the most namespaces queried at the same time
+FANOUT_TOTAL_K = int(os.getenv("FANOUT_TOTAL_K", "12"))
+FANOUT_MIN_QUOTA = 3
+FANOUT_MAX_WORKERS = 8
+
 
 load_dotenv()
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
@@ -31,8 +66,18 @@ pinecone = Pinecone(api_key=PINECONE_API_KEY)
 
 
 
-def getPDFSummary(namespace):
-    pass
+def getPDFSummary(namespace: str) -> str:
+    """
+    Returns the summary of a PDF that was generated when it was ingested, with the summary
+    of each of its sections.
+    """
+    resolved = warm_cache.resolve(namespace)
+    record = summary_store.get(resolved) if resolved else None
+    if record is None:
+        return f"No summary is available for '{namespace}'."
+
+    sections = "\n".join(f"- {section['heading']}: {section['summary']}" for section in record["sections"])
+    return f"Summary of {resolved}:\n{record['summary']}\n\nSections:\n{sections}"
 
 
 # def vectorDB_tool(userInput: str, namespace: str) -> str:
@@ -158,70 +203,196 @@ def highlight_search_strings_in_pdf(
     print(f"Highlights added! Saved as '{output_path}'")
 
 
-def vectorDB_tool(userInput: str, namespace: str):
-    print("User Input: ", userInput)
-    namespace = checkNamespace(namespace)
-    if not namespace:
-        return f"No namespace found for '{namespace}'."
-
+def namespace_top_k(namespace: str):
+    """
+    Returns:
+        tuple: (number of matches to request, most matches to keep)
+    """
     top_k = 15
     #check if namespace has the word "Label" in it
     if "SDS" in namespace:
         top_k = 7
+    if ADAPTIVE_RETRIEVAL:
+        # Fetch a wide candidate set and let the score distribution decide how many to keep
+        return OVERFETCH_K, top_k
+    return top_k, top_k
+
+
+def embed_query(query_text: str, namespaces):
+    # Exact repeats of a cached question skip the embedding call as well
+    if QUERY_CACHE:
+        for namespace in namespaces:
+            embedding = query_cache.cached_embedding(namespace, query_text)
+            if embedding is not None:
+                return embedding
+    return embedding_llm.embedding(query_text)["Embedding"]
+
+
+def embed_queries(query_texts):
+    """
+    embed_query for one query text per namespace, with every text that is not cached sent
+    in a single embedding request.
+
+    Returns:
+        dict: {namespace: embedding}
+    """
+    embeddings = {}
+    if QUERY_CACHE:
+        for namespace, query_text in query_texts.items():
+            embedding = query_cache.cached_embedding(namespace, query_text)
+            if embedding is not None:
+                embeddings[namespace] = embedding
+    missing = [namespace for namespace in query_texts if namespace not in embeddings]
+    if missing:
+        batch = embedding_llm.embedding_batch([query_texts[namespace] for namespace in missing])
+        embeddings.update((namespace, item["Embedding"]) for namespace, item in zip(missing, batch))
+    return embeddings
+
+
+def product_query(userInput: str, namespace: str) -> str:
+    """The text embedded and searched for a question about one namespace's product."""
+    return f"{userInput.lower()}. Product Name is {namespace}"
+
+
+def retrieve(question: str, query_text: str, namespace: str, embedding):
+    """
+    Query, rerank and cut off the matches of one namespace.
+
+    Args:
+        question (str): The user's question, used for reranking.
+        query_text (str): The text that was embedded, used as the cache key.
+        namespace (str): Resolved namespace.
+        embedding (list): Dense embedding of query_text.
+
+    Returns:
+        list: The matches to send to the model, best first.
+    """
+    top_k, max_k = namespace_top_k(namespace)
+
+    query_results = query_cache.lookup(namespace, query_text, embedding) if QUERY_CACHE else None
+    if query_results is None:
+        # Namespaces ingested with --sparse local are encoded in-process, the rest by Pinecone
+        sparse_vector = sparse_encoder.encode_query(namespace, query_text)
+        if sparse_vector is None:
+            sparse_vector = pinecone_sparse_query(pinecone, query_text)
+
+        kwargs = {
+            "index_name": "rag-model",
+            "embedding": embedding,
+            "indices": sparse_vector["indices"],
+            "values": sparse_vector["values"],
+            "tokens": sparse_vector["tokens"],
+            "namespace": namespace,
+            "top_k": top_k,
+            "include_values": False
+        }
 
-    userInput = userInput.lower()
-    userInput += f". Product Name is {namespace}"
-    embedding_data = embedding_llm.embedding(userInput)
-
-    temp_chunk = str(remove_tags_and_stopwords(userInput))
+        # Query the vector database
+        query_results = llm_database.query(**kwargs)
+        if QUERY_CACHE and query_results:
+            query_cache.store(namespace, query_text, embedding, query_results)
+    if QUERY_CACHE:
+        print(query_cache.format_stats())
 
-    sparse_vector = pinecone.inference.embed(
-        model="pinecone-sparse-english-v0",
-        inputs=temp_chunk,
-        parameters={"input_type": "passage", "return_tokens": True}
-    )
+    if RERANK:
+        start = time.perf_counter()
+        query_results = reranker.rerank(question, query_results, namespace)
+        print(f"({namespace}) Reranked {len(query_results)} matches in {(time.perf_counter() - start) * 1000:.2f} ms")
+    if ADAPTIVE_RETRIEVAL:
+        query_results, cutoff_stats = adaptive_cutoff(query_results, max_k=max_k, token_budget=RETRIEVAL_TOKEN_CAP)
+        print(f"({namespace}) {format_cutoff_stats(cutoff_stats)}")
+    return query_results
 
-    indices_list = sparse_vector.data[0]["sparse_indices"]
-    values_list = sparse_vector.data[0]["sparse_values"]
-    tokens_list = sparse_vector.data[0]["sparse_tokens"]
-
-    kwargs = {
-        "index_name": "rag-model",
-        "embedding": embedding_data["Embedding"],
-        "indices": indices_list,
-        "values": values_list,
-        "tokens": tokens_list,
-        "namespace": namespace,
-        "top_k": top_k
-    }
-
-    # Query the vector database
-    query_results = llm_database.query(**kwargs)
-
-    vector_str = "Query Search Results: "
-    search_strings = []
-    vector_array = []
-
-    for embedding in query_results:
-        vector_str += "\n\n" + '-' * 50 + "\n\n"
-        vector_str += f"\nScore: {embedding['score']}\n\n"
-        temp_searchStr = embedding['metadata']['text']
-        vector_str += temp_searchStr
-        search_strings.append(temp_searchStr)
-        vector_entry = {
-            "Score": embedding["score"],
-            "Text": embedding["metadata"]["text"]
-        }
-        vector_array.append(vector_entry)
 
+def save_vector_results(entries):
     with open("vectorRes.json", "w") as json_file:
-        json.dump(vector_array, json_file, indent=2)
+        json.dump(entries, json_file, indent=2)
 
     add_pages_to_json("vectorRes.json", "vectorRes.json")
 
-    vector_str += ". IMPORTANT: Only answer if the information is found in the Query Search Results. Do NOT make up or assume any information. If the information isn't available, clearly respond with something like 'I couldn't find the information in the database results.' PLEASE STRICTLY FOLLOW THIS AND DO NOT MAKE THINGS UP OR SAY SOMETHING IS THERE WHEN IT ISN'T!!."
-    vector_str += "(Please Render LocalHost Links if Available. Always render the LocalHost Link whenever the user asks for the table) instead of giving the link to the user. Whenever you see a table, please render the LocalHost Link.)"
-    return vector_str.lower()
+
+def print_context_stats(stats):
+    print(f"Context: {stats['chunks_used']}/{stats['chunks_in']} chunks ({stats['duplicates']} duplicates), "
+          f"{stats['context_tokens']} tokens, saved {stats['tokens_saved']} of {stats['raw_tokens']}")
+
+
+def vectorDB_tool(userInput: str, namespace: str):
+    print("User Input: ", userInput)
+    namespace = checkNamespace(namespace)
+    if not namespace:
+        return f"No namespace found for '{namespace}'."
+
+    question = userInput
+    query_text = product_query(userInput, namespace)
+    embedding = embed_query(query_text, [namespace])
+    query_results = retrieve(question, query_text, namespace, embedding)
+
+    save_vector_results([
+        {"Score": embedding["score"], "Text": embedding["metadata"]["text"]}
+        for embedding in query_results
+    ])
+
+    # Table image links are only worth their tokens when the user is asking about a table
+    context, stats = build_context(
+        query_results,
+        token_budget=CONTEXT_TOKEN_BUDGET,
+        keep_image_links="table" in question.lower()
+    )
+    print_context_stats(stats)
+    return context
+
+
+def multiNamespace_tool(userInput: str, namespaces):
+    """
+    Answers one question against several namespaces at once, e.g. a Label and its SDS or
+    several products. Each namespace is searched with the same product-qualified query text
+    as vectorDB_tool, all of them embedded in one request, and queried on its own thread, so
+    the call takes as long as the slowest namespace rather than their sum.
+    Each namespace gets an equal quota of matches and of the context token budget.
+    """
+    print("User Input: ", userInput, "Namespaces: ", namespaces)
+    if not namespaces:
+        return "No namespaces given, pass at least one namespace to search."
+    resolved = []
+    for namespace in namespaces:
+        match = checkNamespace(namespace)
+        if not match:
+            return f"No namespace found for '{namespace}'."
+        if match not in resolved:
+            resolved.append(match)
+    if len(resolved) == 1:
+        return vectorDB_tool(userInput, resolved[0])
+
+    question = userInput
+    query_texts = {namespace: product_query(userInput, namespace) for namespace in resolved}
+    embeddings = embed_queries(query_texts)
+
+    with ThreadPoolExecutor(max_workers=min(len(resolved), FANOUT_MAX_WORKERS)) as executor:
+        futures = {
+            namespace: executor.submit(retrieve, question, query_texts[namespace], namespace, embeddings[namespace])
+            for namespace in resolved
+        }
+        results = {namespace: future.result() for namespace, future in futures.items()}
+
+    quota = max(FANOUT_MIN_QUOTA, FANOUT_TOTAL_K // len(resolved))
+    budget = CONTEXT_TOKEN_BUDGET // len(resolved)
+    keep_image_links = "table" in question.lower()
+    sections = []
+    vector_array = []
+    for namespace in resolved:
+        matches = results[namespace][:quota]
+        vector_array.extend(
+            {"Namespace": namespace, "Score": match["score"], "Text": match["metadata"]["text"]}
+            for match in matches
+        )
+        context, stats = build_context(matches, token_budget=budget, keep_image_links=keep_image_links,
+                                       include_instructions=False)
+        print(f"({namespace}) ", end="")
+        print_context_stats(stats)
+        sections.append(f"=== {namespace} ===\n{context}")
+
+    save_vector_results(vector_array)
+    return "\n\n".join(sections + [context_instructions(keep_image_links)])
 
 
 def returnPDF(namespace: str, page_number: str):
@@ -236,25 +407,26 @@ def returnPDF(namespace: str, page_number: str):
 
 
 def getNamespaces():
-    inputDir = "PDF_Extraction/AWS_Textract/Inputs/Namespaces.json"
-    # Read the JSON file and parse it into a Python object
-    with open(inputDir, "r") as file:
-        namespace = json.load(file)
-    return namespace
+    # Namespaces.json is cached by the catalog and only re-read when it changes
+    return namespace_catalog.namespaces()
 
 
 def checkNamespace(namespace: str):
-    namespaces = getNamespaces()
-    namespace_names = [ns["NamespaceName"].lower() for ns in namespaces]
-    best_match = get_close_matches(namespace.lower(), namespace_names, n=1, cutoff=0.6)
-    if best_match:
-        # Find and return the corresponding namespace dictionary
-        match = best_match[0]
-        for ns in namespaces:
-            if ns["NamespaceName"].lower() == match:
-                print(f"Matched namespace: {ns['NamespaceName']}")
-                return ns['NamespaceName']
-    return None
+    match = warm_cache.resolve(namespace)
+    if match:
+        print(f"Matched namespace: {match}")
+    return match
+
+
+def warm_session(namespace: str):
+    """
+    Starts warming the caches for the namespace a chat session is about: namespace
+    resolution, the Pinecone index connection, the parsed Textract pages and the PDF.
+
+    Returns:
+        str: The resolved namespace, or None if no namespace matches.
+    """
+    return warm_cache.prefetch(namespace, connect=lambda: llm_database.connect("rag-model"))
 
 
 
@@ -55,3 +55,74 @@ def add_pages_to_json(input_file, output_file):
     # Write the updated JSON back to a new file
     with open(output_file, 'w') as f:
         json.dump(data, f, indent=2)
+
+
+_stopwords_cache = {}
+
+
+def load_stopwords(stopwords_file="english.txt"):
+    """
+    Loads the stopword list once per path. A missing file means no stopwords are removed.
+    Args:
+        stopwords_file (str): One stopword per line.
+    Returns:
+        frozenset: Lowercased stopwords.
+    """
+    if stopwords_file not in _stopwords_cache:
+        try:
+            with open(stopwords_file, 'r') as file:
+                _stopwords_cache[stopwords_file] = frozenset(word.strip().lower() for word in file.readlines())
+        except OSError:
+            _stopwords_cache[stopwords_file] = frozenset()
+    return _stopwords_cache[stopwords_file]
+
+
+def remove_tags_and_stopwords(text, stopwords_file="english.txt"):
+    """
+    Cleans text for the Pinecone sparse model the same way ingestion does.
+    Args:
+        text (str): Query or chunk text.
+        stopwords_file (str): Path of the stopword list.
+    Returns:
+        str: The text without tags, numbers, single letters, links and stopwords.
+    """
+    # Remove HTML-like tags
+    text = re.sub(r"</?\s*\w+(?:\s*[^>]*)?>", "", text)
+    # Remove chunks surrounded by {[ ]}
+    text = re.sub(r"\{\[.*?\]\}", "", text)
+    # Remove numbers
+    text = re.sub(r"\b\d+\b", "", text)
+    # Remove individual letters
+    text = re.sub(r"\b[a-zA-Z]\b", "", text)
+    # Remove URLs and links
+    text = re.sub(r"\bhttps?://\S+|localhost:\S+\b", "", text)
+    # Remove concatenated stopwords like is/are, and/or
+    text = re.sub(r"\b\w+/\w+\b", "", text)
+
+    # Remove stopwords
+    stopwords = load_stopwords(stopwords_file)
+    words = text.split()
+    filtered_words = [word for word in words if word.lower() not in stopwords]
+    return ' '.join(filtered_words).strip()
+
+
+def pinecone_sparse_query(pinecone_client, text, stopwords_file="english.txt"):
+    """
+    Encodes a query with Pinecone's sparse model, cleaned the same way ingestion cleans chunks.
+    Args:
+        pinecone_client: Pinecone client whose inference API does the encoding.
+        text (str): Query text.
+        stopwords_file (str): Path of the stopword list.
+    Returns:
+        dict: The sparse vector's indices, values and tokens.
+    """
+    response = pinecone_client.inference.embed(
+        model="pinecone-sparse-english-v0",
+        inputs=str(remove_tags_and_stopwords(text, stopwords_file)),
+        parameters={"input_type": "passage", "return_tokens": True}
+    )
+    return {
+        "indices": response.data[0]["sparse_indices"],
+        "values": response.data[0]["sparse_values"],
+        "tokens": response.data[0]["sparse_tokens"],
+    }
@@ -0,0 +1,192 @@
+import glob
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from difflib import get_close_matches
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from OpenAI_API.namespace_catalog import NamespaceCatalog, namespace_catalog
+
+TEXTRACT_CACHE_DIR = "PDF_Extraction/AWS_Textract/Cache"
+PDF_DIR = "PDF_Extraction/AWS_Textract/Inputs"
+PAGE_IMAGE_DIR = "PDF_Extraction/AWS_Textract/PNG_Cache"
+
+
+def _file_version(path: str) -> Optional[Tuple[int, int]]:
+    """(mtime_ns, size) of a file, None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class WarmCache:
+    """
+    Process-wide caches for the work every tool call repeats: resolving the namespace the
+    model names, parsing the per-page Textract JSON and reading the PDF. prefetch() fills
+    them for a namespace in the background as soon as a session knows which product it is
+    about, so the first answer's tool calls do not pay the cold costs.
+
+    Parsed Textract pages and PDF bytes are kept for the `max_namespaces` most recently
+    used namespaces, keyed by the file's mtime and size so a re-extracted page or replaced
+    PDF is read again.
+    """
+
+    def __init__(self, max_namespaces: int = 4, catalog: NamespaceCatalog = namespace_catalog):
+        self.max_namespaces = max_namespaces
+        self.catalog = catalog
+        self._lock = threading.Lock()
+        self._catalog_etag: Optional[str] = None
+        self._resolved: Dict[str, Optional[str]] = {}
+        # namespace -> {"pages": {page_number: ((mtime_ns, size), parsed json)},
+        #               "pdf": ((mtime_ns, size), bytes) or None}
+        self._documents: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._prefetching: Dict[str, threading.Thread] = {}
+        self.status: Dict[str, Dict[str, Any]] = {}
+
+    def namespaces(self) -> List[Dict[str, Any]]:
+        """Namespaces from the catalog, forgetting resolved names when it changes."""
+        etag, namespaces = self.catalog.snapshot()
+        with self._lock:
+            if etag != self._catalog_etag:
+                self._catalog_etag = etag
+                self._resolved.clear()
+        return namespaces
+
+    def resolve(self, namespace: str) -> Optional[str]:
+        """Closest namespace name to what the model asked for, or None."""
+        namespaces = self.namespaces()
+        key = namespace.lower()
+        with self._lock:
+            if key in self._resolved:
+                return self._resolved[key]
+
+        names = {ns["NamespaceName"].lower(): ns["NamespaceName"] for ns in namespaces}
+        best_match = get_close_matches(key, list(names), n=1, cutoff=0.6)
+        resolved = names[best_match[0]] if best_match else None
+        with self._lock:
+            self._resolved[key] = resolved
+        return resolved
+
+    def _document(self, namespace: str) -> Dict[str, Any]:
+        """Cache entry of a namespace, evicting the least recently used. Call with the lock held."""
+        document = self._documents.get(namespace)
+        if document is None:
+            document = {"pages": {}, "pdf": None}
+            self._documents[namespace] = document
+            while len(self._documents) > self.max_namespaces:
+                self._documents.popitem(last=False)
+        self._documents.move_to_end(namespace)
+        return document
+
+    def textract_page(self, namespace: str, page_number: int) -> Optional[Dict[str, Any]]:
+        """
+        Parsed Textract JSON of a zero-based page, None if it is missing or invalid. Callers
+        share the returned dict and must not rely on mutating it.
+        """
+        json_filename = os.path.join(TEXTRACT_CACHE_DIR, f"{namespace}_{page_number}.json")
+        version = _file_version(json_filename)
+        with self._lock:
+            pages = self._document(namespace)["pages"]
+            cached = pages.get(page_number)
+            if cached and cached[0] == version:
+                return cached[1]
+            pages.pop(page_number, None)
+        if version is None:
+            return None
+
+        try:
+            with open(json_filename, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+        with self._lock:
+            self._document(namespace)["pages"][page_number] = (version, data)
+        return data
+
+    def pdf_bytes(self, namespace: str) -> Optional[bytes]:
+        """Contents of the namespace's input PDF, for fitz.open(stream=...)."""
+        pdf_path = os.path.join(PDF_DIR, f"{namespace}.pdf")
+        version = _file_version(pdf_path)
+        with self._lock:
+            document = self._document(namespace)
+            if document["pdf"] is not None and document["pdf"][0] == version:
+                return document["pdf"][1]
+            document["pdf"] = None
+        if version is None:
+            return None
+
+        try:
+            with open(pdf_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        with self._lock:
+            self._document(namespace)["pdf"] = (version, data)
+        return data
+
+    def _prefetch(self, namespace: str, connect: Optional[Callable[[], Any]]) -> None:
+        started = time.perf_counter()
+        status = {"state": "running", "pages": 0, "images": 0, "pdf": False, "connected": False}
+        self.status[namespace] = status
+        try:
+            if connect:
+                connect()
+                status["connected"] = True
+
+            status["pdf"] = self.pdf_bytes(namespace) is not None
+
+            page_pattern = re.compile(rf"^{re.escape(namespace)}_(\d+)\.json$")
+            for path in glob.glob(os.path.join(TEXTRACT_CACHE_DIR, f"{glob.escape(namespace)}_*.json")):
+                match = page_pattern.match(os.path.basename(path))
+                if match and self.textract_page(namespace, int(match.group(1))) is not None:
+                    status["pages"] += 1
+
+            # Page images are served by the file server, reading them warms the OS page cache
+            for path in glob.glob(os.path.join(PAGE_IMAGE_DIR, f"{glob.escape(namespace)}_*.png")):
+                with open(path, "rb") as f:
+                    while f.read(1 << 20):
+                        pass
+                status["images"] += 1
+
+            status["state"] = "done"
+        except Exception as e:
+            status["state"] = "failed"
+            status["error"] = str(e)
+        finally:
+            status["seconds"] = round(time.perf_counter() - started, 3)
+            print(f"Warm-up of {namespace}: {status}")
+            with self._lock:
+                self._prefetching.pop(namespace, None)
+
+    def prefetch(self, namespace: str, connect: Optional[Callable[[], Any]] = None) -> Optional[str]:
+        """
+        Resolves the namespace and warms its caches on a background thread. A prefetch
+        already running for the namespace is not started again.
+
+        Args:
+            namespace (str): Namespace or product name as the user gave it.
+            connect (callable): Optional call that opens the vector database connection.
+
+        Returns:
+            str: The resolved namespace, or None if no namespace matches.
+        """
+        resolved = self.resolve(namespace)
+        if not resolved:
+            return None
+        with self._lock:
+            if resolved in self._prefetching:
+                return resolved
+            thread = threading.Thread(target=self._prefetch, args=(resolved, connect), daemon=True)
+            self._prefetching[resolved] = thread
+        thread.start()
+        return resolved
+
+
+warm_cache = WarmCache()
@@ -6,22 +6,150 @@ from PIL import Image
 from dotenv import load_dotenv
 import json
 import boto3
-from pdf2image import convert_from_path
 from collections import defaultdict, Counter
-from typing import List, Dict, Any, Union, Tuple
+from typing import List, Dict, Any, Union, Tuple, Optional, NamedTuple
 import fitz
 import re
 
-
-def extract_single_page_as_png(pdf_filepath: str, page_number: int, output_filepath: str) -> None:
-    images = convert_from_path(pdf_filepath, first_page=page_number + 1, last_page=page_number + 1)
-
-    if images:
-        image = images[0]
-        image.save(output_filepath, 'PNG')
-        print(f"Page {page_number} saved as {output_filepath}")
-    else:
-        print(f"Page {page_number} not found in the PDF.")
+# Run from this directory with the repository root on PYTHONPATH, like the Pinecone scripts:
+# PYTHONPATH=../.. python awsv3.py --input Inputs/<name>.pdf
+from PDF_Extraction.AWS_Textract.page_stream import PageStreamWriter
+
+
+class FontBaseline(NamedTuple):
+    size: float
+    color: Any
+    flags: int
+    span_count: int
+
+
+class DocumentFontProfile:
+    """
+    Streaming histograms of span size, color and flags, kept both per page and for the
+    whole document. Pages are fed once with add_page and baselines are cached after that.
+    """
+
+    def __init__(self, min_page_spans: int = 50):
+        self.min_page_spans = min_page_spans
+        self.sizes: Counter = Counter()
+        self.colors: Counter = Counter()
+        self.flags: Counter = Counter()
+        self._page_counters: Dict[int, Tuple[Counter, Counter, Counter]] = {}
+        self._document_baseline: Optional[FontBaseline] = None
+        self._page_baselines: Dict[int, FontBaseline] = {}
+
+    def add_page(self, page_number: int, blocks: List[Dict[str, Any]]) -> None:
+        page_sizes: Counter = Counter()
+        page_colors: Counter = Counter()
+        page_flags: Counter = Counter()
+        for block in blocks:
+            for line in block.get('lines', []):
+                for span in line.get('spans', []):
+                    page_sizes[span.get('size', 0)] += 1
+                    page_colors[span.get('color', '')] += 1
+                    page_flags[span.get('flags', 0)] += 1
+        self.sizes.update(page_sizes)
+        self.colors.update(page_colors)
+        self.flags.update(page_flags)
+        self._page_counters[page_number] = (page_sizes, page_colors, page_flags)
+        self._document_baseline = None
+        self._page_baselines.pop(page_number, None)
+
+    @staticmethod
+    def _baseline(sizes: Counter, colors: Counter, flags: Counter) -> FontBaseline:
+        return FontBaseline(
+            size=sizes.most_common(1)[0][0] if sizes else 0,
+            color=colors.most_common(1)[0][0] if colors else '',
+            flags=flags.most_common(1)[0][0] if flags else 0,
+            span_count=sum(sizes.values())
+        )
+
+    def document_baseline(self) -> FontBaseline:
+        if self._document_baseline is None:
+            self._document_baseline = self._baseline(self.sizes, self.colors, self.flags)
+        return self._document_baseline
+
+    def page_baseline(self, page_number: int) -> FontBaseline:
+        if page_number not in self._page_baselines:
+            self._page_baselines[page_number] = self._baseline(*self._page_counters.get(page_number, (Counter(), Counter(), Counter())))
+        return self._page_baselines[page_number]
+
+    def baseline_for_page(self, page_number: int) -> FontBaseline:
+        """Page baseline when the page has enough text to be trusted, otherwise the document one."""
+        page_baseline = self.page_baseline(page_number)
+        if page_baseline.span_count >= self.min_page_spans:
+            return page_baseline
+        return self.document_baseline()
+
+
+class PDFDocumentContext:
+    """
+    Owns the opened PDF and everything derived from it for one ingestion run.
+    Every per-page stage reads from this object instead of re-opening the file.
+    """
+
+    def __init__(self, pdf_filepath: str, dpi: int = 200):
+        self.pdf_filepath = pdf_filepath
+        self.pdf_name = os.path.basename(pdf_filepath).replace('.pdf', '')
+        self.dpi = dpi
+        self.document = fitz.open(pdf_filepath)
+        self.page_count = self.document.page_count
+        self._page_dimensions: Dict[int, Tuple[float, float]] = {}
+        self._page_blocks: Dict[int, List[Dict[str, Any]]] = {}
+        self._page_images: Dict[int, Image.Image] = {}
+        self._font_profile: Optional[DocumentFontProfile] = None
+
+    def __enter__(self) -> "PDFDocumentContext":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def _load_page(self, page_number: int) -> None:
+        page = self.document.load_page(page_number)
+        self._page_dimensions[page_number] = (page.rect.width, page.rect.height)
+        self._page_blocks[page_number] = page.get_text("dict").get('blocks', [])
+
+    def page_dimensions(self, page_number: int) -> Tuple[float, float]:
+        """Return (width, height) of the page in PDF points."""
+        if page_number not in self._page_dimensions:
+            self._load_page(page_number)
+        return self._page_dimensions[page_number]
+
+    def page_blocks(self, page_number: int) -> List[Dict[str, Any]]:
+        """Return the fitz span dictionary blocks of the page, parsed once per run."""
+        if page_number not in self._page_blocks:
+            self._load_page(page_number)
+        return self._page_blocks[page_number]
+
+    def page_image(self, page_number: int) -> Image.Image:
+        """Render the page from the already open document and keep it until released."""
+        if page_number not in self._page_images:
+            pixmap = self.document.load_page(page_number).get_pixmap(dpi=self.dpi)
+            self._page_images[page_number] = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+        return self._page_images[page_number]
+
+    def release_page_image(self, page_number: int) -> None:
+        """Drop a rendered page once every stage is done with it to keep memory flat."""
+        self._page_images.pop(page_number, None)
+
+    def font_profile(self) -> DocumentFontProfile:
+        """Profile span size/color/flags over every page in one pass, the first time it is needed."""
+        if self._font_profile is None:
+            profile = DocumentFontProfile()
+            for page_number in range(self.page_count):
+                profile.add_page(page_number, self.page_blocks(page_number))
+            self._font_profile = profile
+        return self._font_profile
+
+    def close(self) -> None:
+        self._page_images.clear()
+        self.document.close()
+
+
+def save_page_as_png(document: PDFDocumentContext, page_number: int, output_filepath: str) -> None:
+    document.page_image(page_number).save(output_filepath, 'PNG')
+    print(f"Page {page_number} saved as {output_filepath}")
 
 
 def extract_png_with_cache(pdf_filepath: str, page_number: int, client: boto3.client, filepath: str) -> Dict[str, Any]:
@@ -67,7 +195,8 @@ def is_title(line_block: Dict[str, Any], max_line_height: float, top_threshold:
     return is_max_height and is_top_of_page
 
 
-def json_to_text(response: Dict[str, Any], image_path: str, output_dir: str, pdf_name: str, page_number: int, padding: int = 10) -> str:
+def json_to_text(response: Dict[str, Any], image_path: str, output_dir: str, pdf_name: str, page_number: int, padding: int = 10,
+                 image: Optional[Image.Image] = None) -> str:
     def extract_tables(blocks_map: Dict[str, Any], table_block: Dict[str, Any]) -> List[List[Union[str, None]]]:
         table: List[List[Union[str, None]]] = []
         if 'Relationships' in table_block:
@@ -100,8 +229,9 @@ def json_to_text(response: Dict[str, Any], image_path: str, output_dir: str, pdf
         height = bbox['Height'] * image_height
         return left, top, left + width, top + height
 
-    # Read the image
-    image = Image.open(image_path)
+    # Read the image unless the caller already has it rendered
+    if image is None:
+        image = Image.open(image_path)
     image_width, image_height = image.size
 
     # Ensure the output directory exists
@@ -259,22 +389,15 @@ def json_to_text(response: Dict[str, Any], image_path: str, output_dir: str, pdf
     return "\n".join(extracted_text)
 
 
-def extract_headings_and_bold_text(pdf_page: str, page_number: int) -> str:
-    pdf_document = fitz.open(pdf_page)
-    page = pdf_document.load_page(page_number)
-    blocks = page.get_text("dict").get('blocks', [])
-
-    sizes = [span.get('size', 0) for block in blocks for line in block.get('lines', []) for span in
-             line.get('spans', [])]
-    colors = [span.get('color', '') for block in blocks for line in block.get('lines', []) for span in
-              line.get('spans', [])]
+def extract_headings_and_bold_text(document: PDFDocumentContext, page_number: int) -> str:
+    blocks = document.page_blocks(page_number)
 
-    regular_size = Counter(sizes).most_common(1)[0][0]
-    regular_color = Counter(colors).most_common(1)[0][0]
+    baseline = document.font_profile().baseline_for_page(page_number)
+    regular_size, regular_color = baseline.size, baseline.color
     size_threshold = regular_size * 1.2
 
     tagged_spans: List[Tuple[str, str]] = []
-    page_height = page.rect.height  # Get the height of the page
+    page_height = document.page_dimensions(page_number)[1]  # Get the height of the page
     bottom_threshold_ratio = 0.05  # Define threshold (e.g., bottom 5% of the page)
     bottom_threshold = page_height * bottom_threshold_ratio
 
@@ -326,8 +449,6 @@ def extract_headings_and_bold_text(pdf_page: str, page_number: int) -> str:
                         # Tag as BOLD
                         tagged_spans.append((text, 'BOLD'))
 
-    pdf_document.close()
-
     return "\n".join(
         f"<{tag} (PAGE NUMBER = {page_number +1})>{text}< {tag} />" if tag == 'HEADING' else
         f"<{tag} (PAGE NUMBER = {page_number +1})>{text}</{tag}>" if tag == 'BOLD' else
@@ -408,56 +529,46 @@ def replace_headings(parsed_output: str, tagged_text: str, page_number: int) ->
     return "\n".join(updated_output)
 
 
-def final_output(response: Dict[str, Any], pdf_filepath: str, page_number: int, image_path: str, output_dir: str, pdf_name: str, padding: int = 10) -> str:
-    json_text = json_to_text(response, image_path, output_dir, pdf_name, page_number, padding)
-    tagged_text = extract_headings_and_bold_text(pdf_page=pdf_filepath, page_number=page_number)
+def final_output(response: Dict[str, Any], document: PDFDocumentContext, page_number: int, image_path: str, output_dir: str, padding: int = 10) -> str:
+    json_text = json_to_text(response, image_path, output_dir, document.pdf_name, page_number, padding,
+                             image=document.page_image(page_number))
+    tagged_text = extract_headings_and_bold_text(document=document, page_number=page_number)
 
     return replace_headings(json_text, tagged_text, page_number)
 
 
-def save_combined_text(accumulated_text: List[str], file: str) -> None:
-    output_dir = 'Outputs'
-    os.makedirs(output_dir, exist_ok=True)
-
-    base_name = os.path.basename(file).replace('.pdf', '')
-    output_filepath = os.path.join(output_dir, f"{base_name}.txt")
-
-    with open(output_filepath, 'w', encoding='utf-8') as text_file:
-        text_file.write('\n'.join(accumulated_text))
-
-    print(f'Combined text saved to {output_filepath}')
-
-
-def extract_entire_pdf(pdf_filepath: str, client: boto3.client, output_filepath: str) -> None:
-    pdf_document = fitz.open(pdf_filepath)
-    num_pages = pdf_document.page_count
-    accumulated_text: List[str] = []
-
-    pdf_name = os.path.basename(pdf_filepath).replace('.pdf', '')
+def extract_entire_pdf(pdf_filepath: str, client: boto3.client, output_filepath: str, restart: bool = False) -> None:
     output_dir = 'GET'
 
-    for page_number in range(num_pages):
-        print(f"Processing page {page_number} of {pdf_filepath}")
-
-        extract_single_page_as_png(pdf_filepath, page_number, output_filepath)
-        response = extract_png_with_cache(pdf_filepath, page_number, client, output_filepath)
-
-        accumulated_text.append(final_output(
-            response=response,
-            pdf_filepath=pdf_filepath,
-            page_number=page_number,
-            image_path=output_filepath,
-            output_dir=output_dir,
-            pdf_name=pdf_name,
-            padding=10
-        ))
-        print("PAGE DONE!!\n")
-
-    save_combined_text(accumulated_text, pdf_filepath)
+    with PDFDocumentContext(pdf_filepath) as document, \
+            PageStreamWriter(document.pdf_name, output_dir='Outputs', restart=restart) as writer:
+        for page_number in range(document.page_count):
+            if writer.has_page(page_number):
+                print(f"Skipping page {page_number} of {pdf_filepath}, already in {writer.path}")
+                continue
+            print(f"Processing page {page_number} of {pdf_filepath}")
+
+            save_page_as_png(document, page_number, output_filepath)
+            response = extract_png_with_cache(pdf_filepath, page_number, client, output_filepath)
+
+            writer.append_page(page_number, final_output(
+                response=response,
+                document=document,
+                page_number=page_number,
+                image_path=output_filepath,
+                output_dir=output_dir,
+                padding=10
+            ))
+            document.release_page_image(page_number)
+            print("PAGE DONE!!\n")
+
+        combined_filepath = writer.finish(document.page_count)
+
+    print(f'Combined text saved to {combined_filepath}')
     print("PDF FINISHED")
 
 
-def main(pdf_filepath: str) -> None:
+def main(pdf_filepath: str, restart: bool = False) -> None:
     output_filepath = "page_image.png"
 
     load_dotenv()
@@ -471,11 +582,12 @@ def main(pdf_filepath: str) -> None:
         aws_secret_access_key=SECRET_ACCESS_KEY
     )
 
-    extract_entire_pdf(pdf_filepath, client, output_filepath)
+    extract_entire_pdf(pdf_filepath, client, output_filepath, restart=restart)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process a PDF and extract text.")
     parser.add_argument("--input", required=True, help="Path to the PDF file.")
+    parser.add_argument("--restart", action="store_true", help="Discard pages saved by a previous run.")
     args = parser.parse_args()
-    main(args.input)
+    main(args.input, restart=args.restart)
@@ -0,0 +1,154 @@
+import json
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class StreamIncomplete(Exception):
+    """Raised when following a page stream times out before the writer marked it done."""
+
+
+def page_stream_path(pdf_name: str, output_dir: str = 'Outputs') -> str:
+    return os.path.join(output_dir, 'Pages', f"{pdf_name}.jsonl")
+
+
+def _read_records(path: str) -> Tuple[List[Dict], int]:
+    """
+    Reads every complete record of a page stream.
+
+    Returns:
+        tuple: (records, byte offset just past the last complete record)
+    """
+    records: List[Dict] = []
+    good_offset = 0
+    with open(path, 'rb') as f:
+        for raw_line in f:
+            if not raw_line.endswith(b'\n'):
+                break  # Partial write from a crash, everything after it is dropped
+            try:
+                records.append(json.loads(raw_line))
+            except json.JSONDecodeError:
+                break
+            good_offset += len(raw_line)
+    return records, good_offset
+
+
+class PageStreamWriter:
+    """
+    Appends each finished page to Outputs/Pages/{pdf_name}.jsonl as one JSON line with its
+    character offset in the combined text. A run that crashes can resume from the first
+    page that is not in the file, and readers can consume pages while the PDF is processed.
+    """
+
+    def __init__(self, pdf_name: str, output_dir: str = 'Outputs', restart: bool = False):
+        self.pdf_name = pdf_name
+        self.output_dir = output_dir
+        self.path = page_stream_path(pdf_name, output_dir)
+        self.pages: Dict[int, Dict] = {}
+        self.finished = False
+        self._next_offset = 0
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if restart and os.path.exists(self.path):
+            os.remove(self.path)
+
+        if os.path.exists(self.path):
+            records, good_offset = _read_records(self.path)
+            # Truncate a torn trailing line so the next append starts on a clean record
+            with open(self.path, 'r+b') as f:
+                f.truncate(good_offset)
+            for record in records:
+                if record.get('done'):
+                    self.finished = True
+                    continue
+                self.pages[record['page']] = record
+                self._next_offset = record['offset'] + record['length'] + 1
+            if self.pages:
+                print(f"Resuming {pdf_name}: {len(self.pages)} pages already in {self.path}")
+
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def __enter__(self) -> "PageStreamWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def has_page(self, page_number: int) -> bool:
+        return page_number in self.pages
+
+    def append_page(self, page_number: int, text: str) -> None:
+        """Write one page as a single line and fsync it before returning."""
+        record = {
+            "page": page_number,
+            "offset": self._next_offset,
+            "length": len(text),
+            "text": text
+        }
+        self._write(record)
+        self.pages[page_number] = record
+        self._next_offset += len(text) + 1  # Pages are joined with a newline in the combined text
+
+    def finish(self, page_count: int) -> str:
+        """Mark the stream complete and write the combined Outputs/{pdf_name}.txt from it."""
+        if not self.finished:
+            self._write({"done": True, "pages": page_count})
+            self.finished = True
+
+        output_filepath = os.path.join(self.output_dir, f"{self.pdf_name}.txt")
+        temp_filepath = f"{output_filepath}.tmp"
+        with open(temp_filepath, 'w', encoding='utf-8') as text_file:
+            for idx, (_, text) in enumerate(iter_pages(self.path)):
+                if idx:
+                    text_file.write('\n')
+                text_file.write(text)
+        os.replace(temp_filepath, output_filepath)
+        return output_filepath
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+    def _write(self, record: Dict) -> None:
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+
+def iter_pages(path: str, follow: bool = False, poll_interval: float = 1.0,
+               timeout: Optional[float] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Yields (page_number, text) from a page stream in the order pages were written.
+
+    Args:
+        path (str): Path to the .jsonl page stream.
+        follow (bool): Keep waiting for new pages until the writer marks the stream done.
+        poll_interval (float): Seconds between checks for new pages when following.
+        timeout (float): Give up following after this many seconds without a new page.
+
+    Raises:
+        StreamIncomplete: If following timed out before the stream was marked done, so the
+            pages yielded so far are not the whole document.
+    """
+    position = 0
+    last_progress = time.monotonic()
+
+    while True:
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                f.seek(position)
+                for raw_line in f:
+                    if not raw_line.endswith(b'\n'):
+                        break  # The writer is mid-line, pick it up on the next poll
+                    position += len(raw_line)
+                    record = json.loads(raw_line)
+                    if record.get('done'):
+                        return
+                    last_progress = time.monotonic()
+                    yield record['page'], record['text']
+
+        if not follow:
+            return
+        if timeout is not None and time.monotonic() - last_progress > timeout:
+            raise StreamIncomplete(f"No new page in {path} for {timeout}s and the stream is not done")
+        time.sleep(poll_interval)
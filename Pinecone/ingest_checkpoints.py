@@ -0,0 +1,81 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable
+
+
+def content_hash(chunk: str) -> str:
+    """SHA-256 of the chunk text exactly as it is embedded and stored."""
+    return hashlib.sha256(chunk.encode('utf-8')).hexdigest()
+
+
+def normalize_chunk(chunk: str) -> str:
+    # Case is kept: L/ha and l/ha are different units, so a case-only edit is a new chunk
+    return re.sub(r"\s+", " ", chunk).strip()
+
+
+def chunk_id(namespace: str, chunk: str) -> str:
+    """
+    Content-addressed vector ID: the same chunk text in the same namespace always maps to
+    the same ID, so inserting a heading no longer shifts the IDs of every later chunk.
+    Whitespace-only edits keep the ID and are caught by the checkpointed content_hash.
+    """
+    digest = hashlib.sha256(f"{namespace}\x00{normalize_chunk(chunk)}".encode('utf-8')).hexdigest()
+    return f"chunk#{digest[:32]}"
+
+
+class ChunkCheckpointStore:
+    """
+    Local SQLite record of every chunk that has landed in Pinecone, keyed by namespace and
+    chunk ID with the content hash it was upserted with. Rows are committed one chunk at a
+    time, so an interrupted ingestion knows exactly where to pick up.
+    """
+
+    def __init__(self, db_path: str = "../Pinecone/ingest_checkpoints.db"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                namespace TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                upserted_at REAL NOT NULL,
+                PRIMARY KEY (namespace, chunk_id)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def landed(self, namespace: str) -> Dict[str, str]:
+        """Return {chunk_id: content_hash} for every chunk already upserted to the namespace."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id, content_hash FROM chunks WHERE namespace = ?", (namespace,)
+            ).fetchall()
+        return dict(rows)
+
+    def record(self, namespace: str, chunk_id: str, chunk_index: int, chunk_hash: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?)",
+                (namespace, chunk_id, chunk_index, chunk_hash, time.time())
+            )
+            self._conn.commit()
+
+    def forget(self, namespace: str, chunk_ids: Iterable[str]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM chunks WHERE namespace = ? AND chunk_id = ?",
+                [(namespace, chunk_id) for chunk_id in chunk_ids]
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
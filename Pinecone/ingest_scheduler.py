@@ -0,0 +1,187 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from Embeddings.Embedding import Embeddings
+from Embeddings.text_embedding_3_large import text_embedding_3_large_openAI
+from VectorDatabase.VectorDatabase import VectorDatabase
+from VectorDatabase.Pinecone import PineconeDatabase
+from Embeddings.tokenizer import count_tokens
+
+
+class RateLimiter:
+    """Thread-safe token bucket allowing `rate` units per second with bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> None:
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """Embedding model shared by every worker, throttled on requests and tokens per minute."""
+
+    def __init__(self, model: Embeddings, requests_per_minute: float, tokens_per_minute: float):
+        self.model = model
+        self.request_limiter = RateLimiter(requests_per_minute / 60.0, capacity=max(1.0, requests_per_minute / 60.0))
+        self.token_limiter = RateLimiter(tokens_per_minute / 60.0, capacity=tokens_per_minute)
+
+    def get_model_name(self) -> str:
+        return self.model.get_model_name()
+
+    def get_dimensions(self) -> int:
+        return self.model.get_dimensions()
+
+    def format_representations(self) -> str:
+        return f"RateLimited({self.model.format_representations()})"
+
+    def embedding(self, question: str) -> Dict[str, Any]:
+        self.request_limiter.acquire()
+        self.token_limiter.acquire(count_tokens(question))
+        return self.model.embedding(question)
+
+    def embedding_batch(self, questions: List[str]) -> List[Dict[str, Any]]:
+        self.request_limiter.acquire()
+        self.token_limiter.acquire(sum(count_tokens(question) for question in questions))
+        return self.model.embedding_batch(questions)
+
+
+class RateLimitedVectorDatabase(VectorDatabase):
+    """Vector database shared by every worker, throttled on requests per second."""
+
+    def __init__(self, database: VectorDatabase, limiter: RateLimiter):
+        super().__init__(database.k)
+        self.database = database
+        self.limiter = limiter
+
+    def upsert(self, **kwargs: Any) -> bool:
+        self.limiter.acquire()
+        return self.database.upsert(**kwargs)
+
+    def query(self, **kwargs: Any) -> List[Tuple[List[float], str]]:
+        self.limiter.acquire()
+        return self.database.query(**kwargs)
+
+    def update_sparse(self, **kwargs: Any) -> bool:
+        self.limiter.acquire()
+        return self.database.update_sparse(**kwargs)
+
+    def list_ids(self, **kwargs: Any) -> List[str]:
+        self.limiter.acquire()
+        return self.database.list_ids(**kwargs)
+
+    def delete(self, **kwargs: Any) -> bool:
+        self.limiter.acquire()
+        return self.database.delete(**kwargs)
+
+    def format_representation(self) -> str:
+        return f"RateLimited({self.database.format_representation()})"
+
+
+class IngestProgress:
+    """Chunk and document counters shared by the workers, with a throughput based ETA."""
+
+    def __init__(self, total_documents: int):
+        self.total_documents = total_documents
+        self.documents_done = 0
+        self.total_chunks = 0
+        self.chunks_done = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add_chunks(self, count: int) -> None:
+        with self._lock:
+            self.total_chunks += count
+
+    def chunk_done(self, count: int = 1) -> None:
+        with self._lock:
+            self.chunks_done += count
+
+    def document_done(self) -> None:
+        with self._lock:
+            self.documents_done += 1
+
+    def report(self) -> str:
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            remaining = self.total_chunks - self.chunks_done
+            rate = self.chunks_done / elapsed if elapsed > 0 else 0.0
+            eta = f"{remaining / rate:.0f}s" if rate > 0 else "unknown"
+            return (f"documents {self.documents_done}/{self.total_documents}, "
+                    f"chunks {self.chunks_done}/{self.total_chunks} known, "
+                    f"{rate:.1f} chunks/s, elapsed {elapsed:.0f}s, ETA {eta}")
+
+
+class IngestionScheduler:
+    """
+    Ingests many documents concurrently. All workers share one embedding client and one
+    Pinecone client, and every OpenAI and Pinecone call goes through global rate limits
+    so concurrency never trips the API quotas.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        embedding_requests_per_minute: float = 3000,
+        embedding_tokens_per_minute: float = 1_000_000,
+        pinecone_requests_per_second: float = 50,
+        report_interval: float = 10.0,
+    ):
+        self.max_workers = max_workers
+        self.report_interval = report_interval
+        self.pinecone_limiter = RateLimiter(pinecone_requests_per_second)
+        self.embedding_model: Embeddings = RateLimitedEmbeddings(
+            text_embedding_3_large_openAI(), embedding_requests_per_minute, embedding_tokens_per_minute
+        )
+        self.vectorDatabase: VectorDatabase = RateLimitedVectorDatabase(PineconeDatabase(debug=True), self.pinecone_limiter)
+
+    def run(self, files: List[str], ingest_file: Callable[[str, IngestProgress], Dict[str, int]]) -> Dict[str, Dict[str, int]]:
+        """
+        Runs ingest_file(file, progress) for every file on the worker pool, printing a
+        progress/ETA line every report_interval seconds and after each document.
+
+        Returns:
+            dict: Per-file stats as returned by ingest_file.
+        """
+        progress = IngestProgress(len(files))
+        results: Dict[str, Dict[str, int]] = {}
+        stop_reporting = threading.Event()
+
+        def report_loop() -> None:
+            while not stop_reporting.wait(self.report_interval):
+                print(f"[progress] {progress.report()}")
+
+        reporter = threading.Thread(target=report_loop, daemon=True)
+        reporter.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {executor.submit(ingest_file, file, progress): file for file in files}
+                for future in as_completed(futures):
+                    file = futures[future]
+                    try:
+                        results[file] = future.result()
+                    except Exception as e:
+                        print(f"(file={file}) failed: {e}")
+                        results[file] = {"skipped": 0, "embedded": 0, "failed": 1, "deleted": 0}
+                    progress.document_done()
+                    print(f"[progress] {progress.report()}")
+        finally:
+            stop_reporting.set()
+
+        return results
@@ -1,4 +1,4 @@
-import time
+import argparse
 import os
 import json
 from VectorDatabase.VectorDatabase import VectorDatabase
@@ -6,13 +6,19 @@ from VectorDatabase.Pinecone import PineconeDatabase
 from Embeddings.Embedding import Embeddings
 from Embeddings.text_embedding_3_large import text_embedding_3_large_openAI
 from LangChain.HeaderTableTextSplitter_AWS_v2 import HeaderTableTextSplitter
+from PDF_Extraction.AWS_Textract.page_stream import StreamIncomplete, iter_pages, page_stream_path
+from Pinecone.ingest_checkpoints import ChunkCheckpointStore, chunk_id, content_hash
+from Pinecone.ingest_scheduler import IngestionScheduler, IngestProgress, RateLimiter
+from Embeddings.tokenizer import MAX_BATCH_INPUTS, MAX_INPUT_TOKENS, count_tokens, pack_by_tokens, truncate_to_tokens
+from Embeddings.sparse_encoder import BM25SparseEncoder
+from OpenAI_API.summaries import SummaryStore, refresh_summary
 from pinecone import Pinecone
 from dotenv import load_dotenv
+from typing import Callable, Dict, Iterable, List, Optional
+import threading
 import re
 
 
-import re
-
 def remove_tags(text):
     # Remove HTML-like tags
     text = re.sub(r"</?\s*\w+(?:\s*[^>]*)?>", "", text)
@@ -61,7 +67,290 @@ PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 pinecone = Pinecone(api_key=PINECONE_API_KEY)
 
 
-def main():
+def pinecone_sparse_vector(chunk: str, sparse_limiter: Optional[RateLimiter] = None) -> dict:
+    """Sparse vector of a chunk from the pinecone-sparse-english-v0 inference model."""
+    if sparse_limiter:
+        sparse_limiter.acquire()
+    response = pinecone.inference.embed(
+        model="pinecone-sparse-english-v0",
+        inputs=remove_tags_and_stopwords(chunk),
+        parameters={"input_type": "passage", "return_tokens": True}
+    )
+    return {
+        "indices": response.data[0]["sparse_indices"],
+        "values": response.data[0]["sparse_values"],
+        "tokens": response.data[0]["sparse_tokens"],
+    }
+
+
+def build_vector(embedding_model: Embeddings, chunk: str, chunk_id: str, namespace: str,
+                 sparse_limiter: Optional[RateLimiter] = None, embedding_vector: Optional[List[float]] = None,
+                 sparse_vector: Optional[dict] = None) -> dict:
+    if embedding_vector is None:
+        embedding_vector = embedding_model.embedding(remove_tags(chunk))["Embedding"]
+    if sparse_vector is None:
+        sparse_vector = pinecone_sparse_vector(chunk, sparse_limiter)
+    return {
+        "index_name": "rag-model",
+        "id_": chunk_id,
+        "embedding": embedding_vector,
+        "string": chunk,
+        "indices": sparse_vector["indices"],
+        "values": sparse_vector["values"],
+        "tokens": sparse_vector["tokens"],
+        "namespace": namespace
+    }
+
+
+def ingest_chunks(chunks: Iterable[str], namespace: str, checkpoints: ChunkCheckpointStore,
+                  vectorDatabase: VectorDatabase, embedding_model: Embeddings, dry_run: bool = False,
+                  sparse_limiter: Optional[RateLimiter] = None, progress: Optional[IngestProgress] = None,
+                  max_batch_inputs: int = MAX_BATCH_INPUTS, sparse_encoder: Optional[BM25SparseEncoder] = None,
+                  sparse_stats: Optional[dict] = None, resparse: bool = False,
+                  complete: Optional[Callable[[], bool]] = None) -> Dict[str, int]:
+    """
+    Syncs a namespace to the given chunks using content-addressed IDs. IDs already in the
+    namespace are skipped unless their checkpointed content_hash differs from the chunk text
+    (a whitespace-only edit); only new or edited chunks are embedded, packed into as few
+    embedding requests as the token limits allow, and upserted, each checkpointed right after
+    its upsert succeeds. Once every chunk is in, IDs that vanished from the document are deleted.
+
+    With sparse_encoder and sparse_stats, sparse vectors are computed locally for each
+    batch instead of one Pinecone inference call per chunk. resparse rewrites only the sparse
+    values of chunks that are already stored, e.g. after switching a namespace's sparse
+    encoding or refitting its stats; their dense embeddings are kept, so the embedding API
+    is only called for new chunks.
+
+    What is stored comes from index.list; the local checkpoints stand in for it only when
+    listing fails. Nothing is pruned unless the namespace could be listed and, for chunks
+    coming from a stream, complete() confirms the stream reached its end after the last chunk;
+    otherwise chunks of the part that was not read would be deleted as vanished.
+
+    Returns:
+        dict: Counts of skipped, embedded, resparsed, failed and deleted chunks.
+    """
+    try:
+        existing = set(vectorDatabase.list_ids(index_name="rag-model", namespace=namespace))
+        listed = True
+    except Exception as e:
+        # Skip against the local checkpoints only and keep every stored vector
+        print(f"(namespace={namespace}) could not list stored IDs, pruning is skipped: {e}")
+        existing = set()
+        listed = False
+    landed = checkpoints.landed(namespace)
+    # A listing is authoritative: a checkpointed chunk missing from it was deleted remotely
+    stored = existing if listed else set(landed)
+    stats = {"skipped": 0, "embedded": 0, "resparsed": 0, "failed": 0, "deleted": 0}
+    desired = set()
+    # Stored chunks whose sparse values are rewritten once the new chunks are in
+    stale_sparse = []
+
+    def settle(outcome: Optional[str], count: int = 1) -> None:
+        # Progress counts a chunk once it has been upserted, skipped or has failed
+        if outcome:
+            stats[outcome] += count
+        if progress:
+            progress.chunk_done(count)
+
+    def prepared(i: int, id_: str, chunk: str):
+        cleaned = remove_tags(chunk)
+        if count_tokens(cleaned) > MAX_INPUT_TOKENS:
+            # The full chunk is still stored, only its embedding covers the first part
+            print(f"(namespace={namespace}) chunk {i} is over {MAX_INPUT_TOKENS} tokens, embedding its start")
+            cleaned = truncate_to_tokens(cleaned)
+        return i, id_, chunk, cleaned
+
+    def chunks_to_embed():
+        for i, chunk in enumerate(chunks, start=1):
+            id_ = chunk_id(namespace, chunk)
+            if id_ in desired:
+                settle(None)  # Identical chunk earlier in the document
+                continue
+            desired.add(id_)
+
+            chunk_hash = content_hash(chunk)
+            if id_ in stored and landed.get(id_, chunk_hash) == chunk_hash:
+                if not resparse:
+                    settle("skipped")
+                elif dry_run:
+                    print(f"(namespace={namespace}) would re-encode the sparse values of {id_} (chunk {i})")
+                    settle("resparsed")
+                else:
+                    stale_sparse.append((i, id_, chunk))
+                continue
+
+            if dry_run:
+                print(f"(namespace={namespace}) would embed {id_} (chunk {i}, {len(chunk)} chars)")
+                settle("embedded")
+                continue
+
+            yield prepared(i, id_, chunk)
+
+    def sparse_vectors_of(texts: List[str]) -> List[Optional[dict]]:
+        if sparse_encoder:
+            return sparse_encoder.encode_documents(texts, sparse_stats)
+        return [None] * len(texts)
+
+    def embed_and_upsert(batch) -> None:
+        try:
+            embeddings = embedding_model.embedding_batch([cleaned for _, _, _, cleaned in batch])
+            sparse_vectors = sparse_vectors_of([chunk for _, _, chunk, _ in batch])
+        except Exception as e:
+            # Counted as failed so nothing is pruned; the next run retries these chunks
+            print(f"(namespace={namespace}) embedding a batch of {len(batch)} chunks failed: {e}")
+            settle("failed", len(batch))
+            return
+        for (i, id_, chunk, _), embedding, sparse_vector in zip(batch, embeddings, sparse_vectors):
+            try:
+                vector = build_vector(embedding_model, chunk, id_, namespace, sparse_limiter,
+                                      embedding_vector=embedding["Embedding"], sparse_vector=sparse_vector)
+            except Exception as e:
+                print(f"(namespace={namespace}) sparse encoding chunk {i} failed: {e}")
+                settle("failed")
+                continue
+            if vectorDatabase.upsert(**vector):
+                checkpoints.record(namespace, id_, i, content_hash(chunk))
+                settle("embedded")
+            else:
+                settle("failed")
+
+    def rewrite_sparse(stored) -> List[tuple]:
+        """Updates the sparse values of stored chunks and returns those that need a re-upsert."""
+        reupsert = []
+        for start in range(0, len(stored), max_batch_inputs):
+            batch = stored[start:start + max_batch_inputs]
+            try:
+                sparse_vectors = sparse_vectors_of([chunk for _, _, chunk in batch])
+                sparse_vectors = [vector or pinecone_sparse_vector(chunk, sparse_limiter)
+                                  for (_, _, chunk), vector in zip(batch, sparse_vectors)]
+            except Exception as e:
+                print(f"(namespace={namespace}) sparse encoding a batch of {len(batch)} chunks failed: {e}")
+                settle("failed", len(batch))
+                continue
+            for (i, id_, chunk), sparse_vector in zip(batch, sparse_vectors):
+                if not (sparse_vector["indices"] and sparse_vector["values"]):
+                    # An update cannot clear the old sparse values, the chunk is stored dense-only again
+                    reupsert.append(prepared(i, id_, chunk))
+                elif vectorDatabase.update_sparse(index_name="rag-model", id_=id_, namespace=namespace,
+                                                  **sparse_vector):
+                    settle("resparsed")
+                else:
+                    settle("failed")
+        return reupsert
+
+    for batch in pack_by_tokens(chunks_to_embed(), text_of=lambda item: item[3], max_batch_inputs=max_batch_inputs):
+        embed_and_upsert(batch)
+    for batch in pack_by_tokens(rewrite_sparse(stale_sparse), text_of=lambda item: item[3],
+                                max_batch_inputs=max_batch_inputs):
+        embed_and_upsert(batch)
+
+    # Only prune once the new version is fully in, so the namespace never goes empty
+    vanished = sorted(stored - desired)
+    if listed and not dry_run:
+        # Checkpoints of chunks that are neither stored nor wanted any more
+        checkpoints.forget(namespace, set(landed) - existing - desired)
+    whole_document = complete is None or complete()
+    if vanished and stats["failed"] == 0 and not (listed and whole_document):
+        print(f"(namespace={namespace}) kept {len(vanished)} possibly vanished chunks, "
+              f"the {'listing' if not listed else 'document'} was incomplete")
+    elif vanished and stats["failed"] == 0:
+        if dry_run:
+            print(f"(namespace={namespace}) would delete {len(vanished)} vanished chunks")
+            stats["deleted"] = len(vanished)
+        elif vectorDatabase.delete(index_name="rag-model", ids=vanished, namespace=namespace):
+            checkpoints.forget(namespace, vanished)
+            stats["deleted"] = len(vanished)
+
+    print(f"(namespace={namespace}) skipped={stats['skipped']} "
+          f"{'to_embed' if dry_run else 'embedded'}={stats['embedded']} resparsed={stats['resparsed']} "
+          f"failed={stats['failed']} deleted={stats['deleted']}")
+    return stats
+
+
+def mark_file_ingested(pinecone_json_path: str, file: str) -> None:
+    with open(pinecone_json_path, "r") as json_file:
+        data = json.load(json_file)
+
+    files_set = set(data["files"])
+    files_set.add(file)
+    data["files"] = list(files_set)
+
+    with open(pinecone_json_path, "w") as json_file:
+        json.dump(data, json_file, indent=4)
+
+
+def bump_namespace_version(pinecone_json_path: str, namespace: str) -> None:
+    """Invalidates the server's query cache for a namespace whose vectors have changed."""
+    with open(pinecone_json_path, "r") as json_file:
+        data = json.load(json_file)
+
+    versions = data.setdefault("namespace_versions", {})
+    versions[namespace] = versions.get(namespace, 0) + 1
+
+    with open(pinecone_json_path, "w") as json_file:
+        json.dump(data, json_file, indent=4)
+
+
+def update_summary(namespace: str, content: str) -> None:
+    """Regenerates the namespace's precomputed summaries if its content changed."""
+    try:
+        refresh_summary(SummaryStore("../Pinecone/summaries"), namespace, content)
+    except Exception as e:
+        # Summaries are served as they were until the next ingestion succeeds
+        print(f"Error summarizing {namespace}: {e}")
+
+
+def ingest_page_stream(namespace: str, outputs_dir: str = "../PDF_Extraction/AWS_Textract/Outputs/",
+                       timeout: float = 600, dry_run: bool = False, token_budget: Optional[int] = None,
+                       summaries: bool = True) -> Dict[str, int]:
+    """
+    Ingests a document from its page stream while awsv3 is still writing it. Chunks are
+    embedded and upserted as soon as the splitter can close them.
+    """
+    vectorDatabase: VectorDatabase = PineconeDatabase(debug=True)
+    embedding_model: Embeddings = text_embedding_3_large_openAI()
+    splitter = HeaderTableTextSplitter(token_budget=token_budget)
+    checkpoints = ChunkCheckpointStore()
+
+    # The stats cannot be refitted before the document is complete, so a namespace already
+    # encoded locally keeps its saved stats and any other namespace uses the Pinecone model
+    sparse_encoder = BM25SparseEncoder("../Pinecone/sparse_stats")
+    sparse_stats = sparse_encoder.load(namespace)
+
+    pages_path = page_stream_path(namespace, outputs_dir)
+    # Pages are kept to summarize the whole document once the stream is complete
+    page_texts: List[str] = []
+    stream = {"complete": False}
+
+    def pages():
+        try:
+            for _, text in iter_pages(pages_path, follow=True, timeout=timeout):
+                page_texts.append(text)
+                yield text
+        except StreamIncomplete as e:
+            # Ingest what was read, but it is not the whole document
+            print(f"(namespace={namespace}) {e}")
+            return
+        stream["complete"] = True
+
+    try:
+        # Small embedding batches so chunks still land while the PDF is being extracted
+        stats = ingest_chunks(splitter.split_pages(pages()), namespace, checkpoints,
+                              vectorDatabase, embedding_model, dry_run=dry_run, max_batch_inputs=16,
+                              sparse_encoder=sparse_encoder if sparse_stats else None, sparse_stats=sparse_stats,
+                              complete=lambda: stream["complete"])
+        if not dry_run and (stats["embedded"] or stats["resparsed"] or stats["deleted"]):
+            bump_namespace_version("../Pinecone/pinecone.json", namespace)
+        # A stream that timed out is a truncated document, keep the previous summary
+        if summaries and not dry_run and stats["failed"] == 0 and stream["complete"]:
+            update_summary(namespace, "\n".join(page_texts))
+        return stats
+    finally:
+        checkpoints.close()
+
+
+def main(dry_run: bool = False, reingest: bool = False, workers: int = 4, token_budget: Optional[int] = None,
+         sparse: str = "pinecone", summaries: bool = True):
     filepath = "../PDF_Extraction/AWS_Textract/Outputs/"
     pinecone_json_path = "../Pinecone/pinecone.json"
 
@@ -71,78 +360,92 @@ def main():
         files_set = set(data["files"])
 
     # Identify new files to process
-    files = [f for f in os.listdir(filepath) if os.path.isfile(os.path.join(filepath, f))]
-    files_needed = [file for file in files if file not in files_set]
+    files = [f for f in os.listdir(filepath) if f.endswith(".txt") and os.path.isfile(os.path.join(filepath, f))]
+    files_needed = files if reingest else [file for file in files if file not in files_set]
 
-    added_files = []
-    for file in files_needed:
+    scheduler = IngestionScheduler(max_workers=workers)
+    checkpoints = ChunkCheckpointStore()
+    sparse_encoder = BM25SparseEncoder("../Pinecone/sparse_stats")
+    json_lock = threading.Lock()
+
+    def ingest_file(file: str, progress: IngestProgress) -> Dict[str, int]:
         namespace = file.replace(".txt", "")
-        added_files.append(file)
-        vectorDatabase: VectorDatabase = PineconeDatabase(debug=True)
-        embedding_model: Embeddings = text_embedding_3_large_openAI()
 
         # Read the content of the file
         with open(os.path.join(filepath, file), 'r', encoding='utf-8') as read_file:
             content = read_file.read()
 
         # Split the content into chunks
-        splitter = HeaderTableTextSplitter()
+        splitter = HeaderTableTextSplitter(token_budget=token_budget)
         chunks = splitter.split_text(content)
-        print(f"(file={file}) has {len(chunks)} chunks")
+        progress.add_chunks(len(chunks))
+        print(f"(file={file}) has {len(chunks)} chunks\n{splitter.token_report(chunks)}")
 
-        batch = []
-        for i, chunk in enumerate(chunks, start=1):
-            embedding_vector = embedding_model.embedding(remove_tags(chunk))["Embedding"]
-            sparse_vector = pinecone.inference.embed(
-                model="pinecone-sparse-english-v0",
-                inputs=remove_tags_and_stopwords(chunk),
-                parameters={"input_type": "passage", "return_tokens": True}
-            )
-            indices_list=sparse_vector.data[0]["sparse_indices"]
-            values_list=sparse_vector.data[0]["sparse_values"]
-            tokens_list=sparse_vector.data[0]["sparse_tokens"]
-            vector_data = {
-                "index_name": "rag-model",
-                "id_": f"id_{i}",
-                "embedding": embedding_vector,
-                "string": chunk,
-                "indices": indices_list,
-                "values": values_list,
-                "tokens": tokens_list,
-                "namespace": namespace
-            }
-            batch.append(vector_data)
-
-            # If batch size reaches 10, upsert the batch
-            if len(batch) == len(chunks):
-                print(f"Ingesting batch of 10 vectors for {file}...")
-                for vector in batch:
-                    vectorDatabase.upsert(**vector)
-                batch = []
-                time.sleep(5)  # Wait for 5 seconds between batches
-
-        # Upsert any remaining vectors in the last batch
-        if batch:
-            print(f"Ingesting final batch of {len(batch)} vectors for {file}...")
-            for vector in batch:
-                vectorDatabase.upsert(**vector)
-            time.sleep(5)
+        # Every vector in a namespace must use the same sparse encoding as its queries, so
+        # switching encodings rewrites the sparse values of chunks that are already stored
+        local_sparse = sparse == "local"
+        switching = sparse_encoder.has_stats(namespace) != local_sparse
+        sparse_stats = sparse_encoder.fit(chunks) if local_sparse else None
+        # Refitting changes the average length that local document vectors are normalised
+        # with, so unchanged chunks get new sparse values too rather than mixing normalisations
+        resparse = switching or (local_sparse and sparse_encoder.documents_changed(sparse_encoder.load(namespace),
+                                                                                   sparse_stats))
+        if resparse and not switching:
+            print(f"(file={file}) sparse stats changed, re-encoding the sparse values of stored chunks")
 
-    print("-" * 55)
-    print("Ingesting done!!!")
-    print("-" * 55)
+        stats = ingest_chunks(chunks, namespace, checkpoints, scheduler.vectorDatabase, scheduler.embedding_model,
+                              dry_run=dry_run, sparse_limiter=scheduler.pinecone_limiter, progress=progress,
+                              sparse_encoder=sparse_encoder if local_sparse else None, sparse_stats=sparse_stats,
+                              resparse=resparse)
 
-    # Update the list of processed files
-    with open(pinecone_json_path, "r") as json_file:
-        data = json.load(json_file)
-        files_set = set(data["files"])
+        # Queries switch encoding once the namespace's vectors have
+        if not dry_run and stats["failed"] == 0:
+            if local_sparse:
+                sparse_encoder.save(namespace, sparse_stats)
+            elif switching:
+                sparse_encoder.forget(namespace)
 
-    files_set.update(added_files)
-    data["files"] = list(files_set)
+        # Record the file as soon as all of its chunks have landed
+        if not dry_run and stats["failed"] == 0 and file not in files_set:
+            with json_lock:
+                mark_file_ingested(pinecone_json_path, file)
+        if not dry_run and (stats["embedded"] or stats["resparsed"] or stats["deleted"]):
+            with json_lock:
+                bump_namespace_version(pinecone_json_path, namespace)
+        if summaries and not dry_run and stats["failed"] == 0:
+            update_summary(namespace, content)
+        return stats
 
-    with open(pinecone_json_path, "w") as json_file:
-        json.dump(data, json_file, indent=4)
+    try:
+        scheduler.run(files_needed, ingest_file)
+    finally:
+        checkpoints.close()
+
+    print("-" * 55)
+    print("Dry run done!!!" if dry_run else "Ingesting done!!!")
+    print("-" * 55)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Ingest extracted label and SDS text into Pinecone.")
+    parser.add_argument("--follow", metavar="NAMESPACE",
+                        help="Ingest a document from its page stream while it is still being extracted.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Report which chunks would be embedded or deleted without changing anything.")
+    parser.add_argument("--reingest", action="store_true",
+                        help="Diff every output file against its namespace, not only files missing from pinecone.json.")
+    parser.add_argument("--workers", type=int, default=4, help="Number of documents ingested concurrently.")
+    parser.add_argument("--token-budget", type=int, default=None,
+                        help="Chunk by embedding-model tokens with this cap per chunk instead of by characters.")
+    parser.add_argument("--sparse", choices=["pinecone", "local"], default="pinecone",
+                        help="Sparse encoding: the Pinecone inference model, or local BM25 fitted per namespace. "
+                             "Use with --reingest to switch namespaces that are already ingested.")
+    parser.add_argument("--skip-summaries", action="store_true",
+                        help="Do not regenerate the precomputed summaries of namespaces whose content changed.")
+    args = parser.parse_args()
+    if args.follow:
+        ingest_page_stream(args.follow, dry_run=args.dry_run, token_budget=args.token_budget,
+                           summaries=not args.skip_summaries)
+    else:
+        main(dry_run=args.dry_run, reingest=args.reingest, workers=args.workers, token_budget=args.token_budget,
+             sparse=args.sparse, summaries=not args.skip_summaries)
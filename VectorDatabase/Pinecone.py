@@ -21,6 +21,7 @@ class PineconeDatabase(VectorDatabase):
         super().__init__(k)
         self.k = k
         self.debug = debug
+        self._indexes: Dict[str, Any] = {}
 
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.DEBUG if self.debug else logging.INFO)
@@ -32,6 +33,25 @@ class PineconeDatabase(VectorDatabase):
             ch.setFormatter(formatter)
             self.logger.addHandler(ch)
 
+    def _index(self, index_name: str):
+        """Index handle, created once per index so its connection pool is reused across calls."""
+        index = self._indexes.get(index_name)
+        if index is None:
+            index = self._indexes.setdefault(index_name, pinecone.Index(index_name))
+        return index
+
+    def connect(self, index_name: str) -> bool:
+        """
+        Open the index connection ahead of the first query.
+        """
+        try:
+            self._index(index_name).describe_index_stats()
+            self.logger.debug(f"Connected to index: {index_name}")
+            return True
+        except Exception as e:
+            self.logger.error(f"Connect failed with exception: {e}")
+            return False
+
     def upsert(self, **kwargs: Any) -> bool:
         """
         Upsert a vector embedding into the Pinecone index.
@@ -49,19 +69,21 @@ class PineconeDatabase(VectorDatabase):
 
             self.logger.debug(f"Upserting into index: {index_name} with ID: {id_}")
 
-            index = pinecone.Index(index_name)
+            index = self._index(index_name)
             vector = {
                 "id": id_,
                 "values": embedding,
-                "sparse_values": {
-                    "values": sparse_values,
-                    "indices": sparse_indices,
-                },
                 "metadata": {
                     "text": string,
                     "tokens": sparse_tokens
                 }
             }
+            # A chunk with no sparse terms (e.g. only numbers) is stored dense-only
+            if sparse_values and sparse_indices:
+                vector["sparse_values"] = {
+                    "values": sparse_values,
+                    "indices": sparse_indices,
+                }
             index.upsert(
                 vectors=[vector],
                 namespace=namespace
@@ -86,22 +108,27 @@ class PineconeDatabase(VectorDatabase):
             embedding = kwargs.get("embedding")
             namespace = kwargs.get("namespace")
             top_k = kwargs.get("top_k", self.k)
+            sparse_values = kwargs.get("values")
+            sparse_indices = kwargs.get("indices")
+            include_values = kwargs.get("include_values", True)
 
             self.logger.debug(f"Querying index: {index_name} with top_k: {top_k}")
 
-            index = pinecone.Index(index_name)
-            query = index.query(
-                vector=embedding,
-                namespace=namespace,
-                top_k=top_k,
-                sparse_vector={
+            index = self._index(index_name)
+            query_kwargs = {
+                "vector": embedding,
+                "namespace": namespace,
+                "top_k": top_k,
+                # filter={"tokens": {"$in": sparse_tokens}},
+                "include_values": include_values,
+                "include_metadata": True
+            }
+            if sparse_values and sparse_indices:
+                query_kwargs["sparse_vector"] = {
                     "values": sparse_values,
                     "indices": sparse_indices
-                },
-                # filter={"tokens": {"$in": sparse_tokens}},
-                include_values=True,
-                include_metadata=True
-            )
+                }
+            query = index.query(**query_kwargs)
 
             self.logger.debug("Query successful.")
             return query['matches']
@@ -109,6 +136,88 @@ class PineconeDatabase(VectorDatabase):
             self.logger.error(f"Query failed with exception: {e}")
             return []
 
+    def update_sparse(self, **kwargs: Any) -> bool:
+        """
+        Rewrite the sparse values and token metadata of a stored vector in place, e.g. after
+        the namespace's sparse encoding changed, without re-sending its dense embedding.
+        """
+        try:
+            index_name = kwargs.get("index_name")
+            namespace = kwargs.get("namespace")
+            id_ = kwargs.get("id_")
+
+            self.logger.debug(f"Updating sparse values in index: {index_name} with ID: {id_}")
+
+            index = self._index(index_name)
+            index.update(
+                id=id_,
+                sparse_values={
+                    "values": kwargs.get("values"),
+                    "indices": kwargs.get("indices"),
+                },
+                set_metadata={"tokens": kwargs.get("tokens")},
+                namespace=namespace
+            )
+
+            self.logger.debug("Update successful.")
+            return True
+        except Exception as e:
+            self.logger.error(f"Update failed with exception: {e}")
+            return False
+
+    def list_ids(self, **kwargs: Any) -> List[str]:
+        """
+        List every vector ID in a namespace, optionally restricted to an ID prefix.
+
+        Returns:
+            List[str]: The stored vector IDs.
+
+        Raises:
+            Exception: If listing fails. Callers diff against this list, so an empty list
+                on failure would look like an empty namespace.
+        """
+        try:
+            index_name = kwargs.get("index_name")
+            namespace = kwargs.get("namespace")
+            prefix = kwargs.get("prefix")
+
+            self.logger.debug(f"Listing IDs in index: {index_name}, namespace: {namespace}")
+
+            index = self._index(index_name)
+            list_kwargs = {"namespace": namespace}
+            if prefix:
+                list_kwargs["prefix"] = prefix
+            ids: List[str] = []
+            for page in index.list(**list_kwargs):
+                ids.extend(page)
+
+            self.logger.debug(f"Listed {len(ids)} IDs.")
+            return ids
+        except Exception as e:
+            self.logger.error(f"List failed with exception: {e}")
+            raise
+
+    def delete(self, **kwargs: Any) -> bool:
+        """
+        Delete vectors by ID from a namespace, in batches of 1000.
+        """
+        try:
+            index_name = kwargs.get("index_name")
+            namespace = kwargs.get("namespace")
+            ids = list(kwargs.get("ids", []))
+
+            self.logger.debug(f"Deleting {len(ids)} IDs from index: {index_name}, namespace: {namespace}")
+
+            index = self._index(index_name)
+            for start in range(0, len(ids), 1000):
+                index.delete(ids=ids[start:start + 1000], namespace=namespace)
+
+            self.logger.debug("Delete successful.")
+            return True
+        except Exception as e:
+            self.logger.error(f"Delete failed with exception: {e}")
+            return False
+
     def format_representation(self) -> str:
         """
         Return a string representation of the vector database's current state or metadata.
@@ -29,6 +29,30 @@ class VectorDatabase(ABC):
         """
         pass
 
+    @abstractmethod
+    def update_sparse(self, **kwargs: Any) -> bool:
+        """
+        Replace the sparse values of a stored vector, keeping its dense embedding.
+        """
+        pass
+
+    @abstractmethod
+    def list_ids(self, **kwargs: Any) -> List[str]:
+        """
+        List the IDs of every vector stored in a namespace.
+
+        Returns:
+            List[str]: The stored vector IDs.
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, **kwargs: Any) -> bool:
+        """
+        Delete vectors by ID from a namespace.
+        """
+        pass
+
     @abstractmethod
     def format_representation(self) -> str:
         """
@@ -1,7 +1,10 @@
 # backend/server.py
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+import argparse
 import asyncio
+import uvicorn
+from typing import Optional
 from VectorDatabase.VectorDatabase import VectorDatabase
 from VectorDatabase.Pinecone import PineconeDatabase
 from dotenv import load_dotenv
@@ -9,6 +12,10 @@ import os
 import markdown
 from OpenAI_API.AssistantsAPI_streaming_v4 import AssistantAPI_streaming
 from OpenAI_API.utils import *
+from OpenAI_API.tool_calling import warm_session
+from OpenAI_API.warm_cache import warm_cache
+from OpenAI_API.session_store import create_session_store
+from OpenAI_API.run_lifecycle import cancel_metrics, wait_for_terminal
 from openai import OpenAI
 
 load_dotenv()
@@ -25,17 +32,59 @@ app.add_middleware(
 
 client = OpenAI(api_key=OPENAI_API_KEY)
 assistant_id_json = load_json_file("OpenAI_API/assistant_id.json")
-assistant_run = AssistantAPI_streaming(client, assistant_id_json.get("assistant_id"))
+assistant_id = assistant_id_json.get("assistant_id")
+
+# Each chat session's thread and current run live in a store every worker shares, so the
+# server runs with several workers and a reconnecting client can land on any of them.
+# "sqlite" suits workers on one machine, "redis" (or a compatible server) several machines.
+session_store = create_session_store(
+    os.getenv("SESSION_STORE", "sqlite"),
+    sqlite_path=os.getenv("SESSION_STORE_PATH", "OpenAI_API/sessions.db"),
+    redis_url=os.getenv("SESSION_STORE_URL", "redis://localhost:6379/0")
+)
 
 
-def getIterator(message: str):
+def open_session(session_id: Optional[str]) -> AssistantAPI_streaming:
+    """
+    Streaming assistant on a session's thread. A new session gets a new thread, recorded in
+    the session store; without a session ID the thread lasts as long as the connection.
+    """
+    if not session_id:
+        return AssistantAPI_streaming(client, assistant_id)
+
+    def record_run(run_id: Optional[str]):
+        session_store.set_run(session_id, run_id)
+
+    session = session_store.get(session_id)
+    if session is None:
+        assistant_run = AssistantAPI_streaming(client, assistant_id, on_run_change=record_run)
+        session_store.set_thread(session_id, assistant_run.thread_id)
+        return assistant_run
+
+    if session["run_id"]:
+        # A run left streaming by a dropped connection, possibly on another worker, would
+        # block new messages on the thread until it finishes
+        try:
+            client.beta.threads.runs.cancel(thread_id=session["thread_id"], run_id=session["run_id"])
+        except Exception as e:
+            print(f"Run {session['run_id']} could not be cancelled: {e}")
+        try:
+            # The first message of the new connection would be rejected while it is cancelling
+            if wait_for_terminal(client, session["thread_id"], session["run_id"]) is None:
+                print(f"Run {session['run_id']} is still not finished.")
+        except Exception as e:
+            print(f"Run {session['run_id']} status could not be read: {e}")
+        session_store.set_run(session_id, None)
+    return AssistantAPI_streaming(client, assistant_id, session["thread_id"], on_run_change=record_run)
+
+
+async def generate_response_chunks(assistant_run: AssistantAPI_streaming, message: str, stop_event: asyncio.Event):
     iterator = assistant_run.user_chat(message)
-    return iterator
-
-
-async def generate_response_chunks(message: str, stop_event: asyncio.Event):
-    response = f"Echo: {message}"
-    for char in getIterator(message):
+    while True:
+        # Waiting for the next delta blocks, keep it off the event loop
+        char = await asyncio.to_thread(next, iterator, None)
+        if char is None:
+            break
         if stop_event.is_set():
             print("Response generation stopped")
             break
@@ -43,9 +92,33 @@ async def generate_response_chunks(message: str, stop_event: asyncio.Event):
         await asyncio.sleep(0.01)
 
 
+@app.post("/warmup/{namespace}")
+async def warmup(namespace: str):
+    """Start prefetching a namespace once the chat knows which product it is about."""
+    resolved = await asyncio.to_thread(warm_session, namespace)
+    if not resolved:
+        raise HTTPException(status_code=404, detail=f"No namespace found for '{namespace}'.")
+    return {"namespace": resolved, "status": warm_cache.status.get(resolved, {"state": "running"})}
+
+
+@app.get("/warmup/{namespace}")
+async def warmup_status(namespace: str):
+    resolved = await asyncio.to_thread(warm_cache.resolve, namespace)
+    if not resolved or resolved not in warm_cache.status:
+        raise HTTPException(status_code=404, detail=f"No warm-up started for '{namespace}'.")
+    return {"namespace": resolved, "status": warm_cache.status[resolved]}
+
+
+@app.get("/metrics/cancellations")
+async def cancellation_metrics():
+    """Cancel-to-quiet latency of stopped responses served by this worker."""
+    return cancel_metrics.stats()
+
+
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, session: Optional[str] = None):
     await websocket.accept()
+    assistant_run = await asyncio.to_thread(open_session, session)
     response_task = None
     stop_event = asyncio.Event()
     try:
@@ -53,10 +126,10 @@ async def websocket_endpoint(websocket: WebSocket):
             data = await websocket.receive_text()
             print(f"Received message: '{data}', type: {type(data)}, len: {len(data)}")
             if data == "__STOP__":
-                print("hey sup")
-                assistant_run.cancelRun()
                 print("Stopping current response")
                 stop_event.set()
+                # Ends local streaming at once, then cancels the run without blocking the loop
+                await assistant_run.cancelRunAsync()
                 if response_task:
                     response_task.cancel()
                 # Optionally, send a confirmation message
@@ -65,9 +138,16 @@ async def websocket_endpoint(websocket: WebSocket):
                 # await websocket.close()
                 continue
 
-            assistant_run.prompt(data)
+            if data.startswith("__WARMUP__:"):
+                namespace = data[len("__WARMUP__:"):].strip()
+                await asyncio.to_thread(warm_session, namespace)
+                continue
 
-            # If there's an ongoing response task, cancel it before starting a new one
+            # If there's an ongoing response task, cancel it before starting a new one. The
+            # thread accepts the new message only once the run is no longer "cancelling"
+            if assistant_run.run.active:
+                await assistant_run.cancelRunAsync()
+                await assistant_run.waitForRunEndAsync()
             if response_task and not response_task.done():
                 response_task.cancel()
                 try:
@@ -76,7 +156,7 @@ async def websocket_endpoint(websocket: WebSocket):
                     print("Previous response task cancelled.")
 
             stop_event = asyncio.Event()
-            response_task = asyncio.create_task(send_response(websocket, data, stop_event))
+            response_task = asyncio.create_task(send_response(websocket, assistant_run, data, stop_event))
 
     except WebSocketDisconnect:
         print("Client disconnected")
@@ -88,10 +168,11 @@ async def websocket_endpoint(websocket: WebSocket):
             response_task.cancel()
 
 
-async def send_response(websocket: WebSocket, message: str, stop_event: asyncio.Event):
+async def send_response(websocket: WebSocket, assistant_run: AssistantAPI_streaming, message: str,
+                        stop_event: asyncio.Event):
     full_response = ''
     try:
-        async for chunk in generate_response_chunks(message, stop_event):
+        async for chunk in generate_response_chunks(assistant_run, message, stop_event):
             try:
                 await websocket.send_text(chunk)
                 full_response += chunk
@@ -110,9 +191,27 @@ async def send_response(websocket: WebSocket, message: str, stop_event: asyncio.
 
 def main():
     message = "tell me a long ass peom about label and sds !!"
-    for content in getIterator(message):
+    for content in AssistantAPI_streaming(client, assistant_id).user_chat(message):
         print(content, end="", flush=True)
 
 
+def serve(host: str = "0.0.0.0", port: int = 8000, workers: int = 1):
+    """
+    Runs the chat server. With several workers each one is a separate process, so sessions
+    must be in the shared session store and any worker can serve any request.
+    """
+    uvicorn.run("server_assistantsAPI_v2:app", host=host, port=port, workers=workers)
+
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Chat server for the Label and SDS assistant.")
+    parser.add_argument("--serve", action="store_true", help="Run the websocket server instead of a test chat.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes. Sessions are shared through SESSION_STORE (sqlite or redis).")
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.host, args.port, args.workers)
+    else:
+        main()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Modules import each other from the repository root; the OAuth2 server modules import
+# their siblings directly, as they do when the server is run from OAuth2/
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (REPO_DIR, os.path.join(REPO_DIR, "OAuth2")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
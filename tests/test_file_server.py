@@ -0,0 +1,51 @@
+import pytest
+
+pytest.importorskip("aiofiles")
+fastapi = pytest.importorskip("fastapi")
+
+from file_server import FileServer, SmallFileCache
+
+
+class FakeRequest:
+    def __init__(self, **headers):
+        self.headers = {name.replace("_", "-"): value for name, value in headers.items()}
+
+
+def byte_range(size=1000, **headers):
+    return FileServer._byte_range(FakeRequest(**headers), '"etag"', "last-modified", size)
+
+
+def test_no_range_sends_whole_file():
+    assert byte_range() is None
+
+
+@pytest.mark.parametrize("header,expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=900-", (900, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=500-5000", (500, 999)),
+])
+def test_ranges(header, expected):
+    assert byte_range(range=header) == expected
+
+
+def test_range_against_other_version_sends_whole_file():
+    assert byte_range(range="bytes=0-99", if_range='"stale"') is None
+    assert byte_range(range="bytes=0-99", if_range='"etag"') == (0, 99)
+
+
+def test_multiple_ranges_send_whole_file():
+    assert byte_range(range="bytes=0-1,5-6") is None
+
+
+def test_unsatisfiable_range():
+    with pytest.raises(fastapi.HTTPException) as error:
+        byte_range(range="bytes=2000-")
+    assert error.value.status_code == 416
+
+
+def test_small_file_cache_is_keyed_by_version():
+    cache = SmallFileCache(max_file_size=10, max_total_size=20)
+    cache.put("a", (1, 5), b"aaaaa")
+    assert cache.get("a", (1, 5)) == b"aaaaa"
+    assert cache.get("a", (2, 5)) is None
@@ -0,0 +1,40 @@
+from Pinecone.ingest_checkpoints import ChunkCheckpointStore, chunk_id, content_hash
+
+
+def test_chunk_id_ignores_whitespace_but_not_case():
+    assert chunk_id("ns", "Apply  at\nDawn ") == chunk_id("ns", "Apply at Dawn")
+    assert chunk_id("ns", "2 L/ha") != chunk_id("ns", "2 l/ha")
+    assert chunk_id("ns", "apply at dawn") != chunk_id("other", "apply at dawn")
+    assert chunk_id("ns", "apply at dawn").startswith("chunk#")
+
+
+def test_content_hash_is_exact():
+    assert content_hash("a b") != content_hash("a  b")
+
+
+def test_checkpoints_record_and_forget(tmp_path):
+    store = ChunkCheckpointStore(str(tmp_path / "checkpoints.db"))
+    try:
+        store.record("ns", "chunk#1", 1, "h1")
+        store.record("ns", "chunk#2", 2, "h2")
+        store.record("other", "chunk#1", 1, "h3")
+        assert store.landed("ns") == {"chunk#1": "h1", "chunk#2": "h2"}
+
+        store.forget("ns", ["chunk#1"])
+        assert store.landed("ns") == {"chunk#2": "h2"}
+        assert store.landed("other") == {"chunk#1": "h3"}
+    finally:
+        store.close()
+
+
+def test_checkpoints_survive_reopen(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+    store = ChunkCheckpointStore(path)
+    store.record("ns", "chunk#1", 1, "h1")
+    store.close()
+
+    reopened = ChunkCheckpointStore(path)
+    try:
+        assert reopened.landed("ns") == {"chunk#1": "h1"}
+    finally:
+        reopened.close()
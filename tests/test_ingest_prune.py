@@ -0,0 +1,160 @@
+import os
+
+import pytest
+
+for module in ("dotenv", "openai", "pinecone", "langchain"):
+    pytest.importorskip(module)
+
+# The clients are created at import; no request is made with these keys
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("PINECONE_API_KEY", "test")
+
+from Pinecone import pineconeIngest_v2 as ingest
+from Pinecone.ingest_checkpoints import ChunkCheckpointStore, chunk_id, content_hash
+from Embeddings.sparse_encoder import BM25SparseEncoder
+
+
+class FakeDatabase:
+    def __init__(self, stored=(), list_error=None, failing_ids=()):
+        self.stored = set(stored)
+        self.list_error = list_error
+        self.failing_ids = set(failing_ids)
+        self.deleted = []
+        self.upserted = []
+        self.resparsed = []
+
+    def list_ids(self, **kwargs):
+        if self.list_error:
+            raise self.list_error
+        return list(self.stored)
+
+    def upsert(self, **kwargs):
+        if kwargs["id_"] in self.failing_ids:
+            return False
+        self.stored.add(kwargs["id_"])
+        self.upserted.append(kwargs["id_"])
+        return True
+
+    def update_sparse(self, **kwargs):
+        self.resparsed.append(kwargs["id_"])
+        return True
+
+    def delete(self, ids, **kwargs):
+        self.deleted.extend(ids)
+        self.stored.difference_update(ids)
+        return True
+
+
+class FakeEmbeddings:
+    def __init__(self, error=None):
+        self.error = error
+        self.texts = []
+
+    def embedding_batch(self, texts):
+        self.texts.extend(texts)
+        if self.error:
+            raise self.error
+        return [{"Embedding": [0.0]} for _ in texts]
+
+
+SPARSE = {"indices": [1], "values": [1.0], "tokens": ["t"]}
+
+
+@pytest.fixture
+def checkpoints(tmp_path):
+    store = ChunkCheckpointStore(str(tmp_path / "checkpoints.db"))
+    yield store
+    store.close()
+
+
+@pytest.fixture(autouse=True)
+def local_sparse(monkeypatch):
+    # Skip the Pinecone inference call for sparse vectors
+    original = ingest.build_vector
+    monkeypatch.setattr(ingest, "build_vector", lambda *args, **kwargs: original(
+        *args, **{**kwargs, "sparse_vector": SPARSE}))
+
+
+def run(chunks, database, checkpoints, embeddings=None, **kwargs):
+    return ingest.ingest_chunks(chunks, "ns", checkpoints, database, embeddings or FakeEmbeddings(), **kwargs)
+
+
+def test_vanished_chunks_are_pruned(checkpoints):
+    database = FakeDatabase(stored={"chunk#old"})
+    stats = run(["alpha", "beta"], database, checkpoints)
+    assert stats["embedded"] == 2
+    assert database.deleted == ["chunk#old"]
+
+
+def test_unchanged_chunks_are_skipped(checkpoints):
+    database = FakeDatabase(stored={chunk_id("ns", "alpha")})
+    stats = run(["alpha", "beta"], database, checkpoints)
+    assert stats["skipped"] == 1 and stats["embedded"] == 1
+
+
+def test_case_only_edit_is_reupserted(checkpoints):
+    database = FakeDatabase(stored={chunk_id("ns", "apply 2 l/ha")})
+    stats = run(["apply 2 L/ha"], database, checkpoints)
+    assert stats["embedded"] == 1
+    assert database.deleted == [chunk_id("ns", "apply 2 l/ha")]
+
+
+def test_whitespace_edit_is_reupserted(checkpoints):
+    id_ = chunk_id("ns", "apply  at dawn")
+    checkpoints.record("ns", id_, 1, content_hash("apply  at dawn"))
+    database = FakeDatabase(stored={id_})
+    stats = run(["apply at dawn"], database, checkpoints)
+    assert stats["embedded"] == 1 and database.upserted == [id_]
+    assert checkpoints.landed("ns") == {id_: content_hash("apply at dawn")}
+
+
+def test_listing_is_trusted_over_checkpoints(checkpoints):
+    # Checkpointed, but deleted from the index since
+    checkpoints.record("ns", chunk_id("ns", "alpha"), 1, content_hash("alpha"))
+    checkpoints.record("ns", "chunk#gone", 2, "h")
+    database = FakeDatabase()
+    stats = run(["alpha"], database, checkpoints)
+    assert stats["embedded"] == 1 and database.deleted == []
+    assert set(checkpoints.landed("ns")) == {chunk_id("ns", "alpha")}
+
+
+def test_no_prune_when_listing_fails(checkpoints):
+    checkpoints.record("ns", "chunk#old", 1, "h")
+    database = FakeDatabase(list_error=RuntimeError("unavailable"))
+    stats = run(["alpha"], database, checkpoints)
+    assert stats["embedded"] == 1
+    assert database.deleted == []
+
+
+def test_no_prune_when_stream_is_incomplete(checkpoints):
+    database = FakeDatabase(stored={"chunk#later_page"})
+    run(["alpha"], database, checkpoints, complete=lambda: False)
+    assert database.deleted == []
+
+
+def test_no_prune_after_a_failed_upsert(checkpoints):
+    database = FakeDatabase(stored={"chunk#old"}, failing_ids={chunk_id("ns", "beta")})
+    stats = run(["alpha", "beta"], database, checkpoints)
+    assert stats["failed"] == 1
+    assert database.deleted == []
+
+
+def test_failed_embedding_batch_is_counted(checkpoints):
+    database = FakeDatabase(stored={"chunk#old"})
+    stats = run(["alpha", "beta"], database, checkpoints, embeddings=FakeEmbeddings(RuntimeError("400")))
+    assert stats["failed"] == 2 and stats["embedded"] == 0
+    assert database.deleted == []
+
+
+def test_new_sparse_stats_only_rewrite_sparse_values(checkpoints, tmp_path):
+    chunks = ["alpha crop rate", "beta crop rate", "gamma crop rate", "1 2 3"]
+    database = FakeDatabase(stored={chunk_id("ns", chunk) for chunk in chunks[:2] + chunks[3:]})
+    embeddings = FakeEmbeddings()
+    encoder = BM25SparseEncoder(str(tmp_path))
+    stats = run(chunks, database, checkpoints, embeddings=embeddings, resparse=True,
+                sparse_encoder=encoder, sparse_stats=encoder.fit(chunks))
+
+    # Only the new chunk and the one without sparse terms are embedded
+    assert sorted(database.resparsed) == sorted(chunk_id("ns", chunk) for chunk in chunks[:2])
+    assert embeddings.texts == ["gamma crop rate", ""]
+    assert stats["resparsed"] == 2 and stats["embedded"] == 2
@@ -0,0 +1,36 @@
+import time
+
+import pytest
+
+for module in ("dotenv", "openai", "pinecone"):
+    pytest.importorskip(module)
+
+from Pinecone.ingest_scheduler import IngestProgress, RateLimiter
+
+
+def test_rate_limiter_allows_a_burst_then_throttles():
+    limiter = RateLimiter(rate=50, capacity=5)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+    assert time.monotonic() - start < 0.05
+
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.08
+
+
+def test_rate_limiter_caps_amount_at_capacity():
+    limiter = RateLimiter(rate=1000, capacity=10)
+    start = time.monotonic()
+    limiter.acquire(50)
+    assert time.monotonic() - start < 0.05
+
+
+def test_progress_counts():
+    progress = IngestProgress(total_documents=1)
+    progress.add_chunks(4)
+    progress.chunk_done()
+    progress.chunk_done(2)
+    assert progress.chunks_done == 3
@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+
+from PDF_Extraction.AWS_Textract.page_stream import PageStreamWriter, StreamIncomplete, iter_pages
+
+
+def test_pages_round_trip_and_finish(tmp_path):
+    with PageStreamWriter("doc", output_dir=str(tmp_path)) as writer:
+        writer.append_page(0, "first")
+        writer.append_page(1, "second")
+        combined = writer.finish(2)
+
+    assert list(iter_pages(writer.path)) == [(0, "first"), (1, "second")]
+    with open(combined, encoding="utf-8") as f:
+        assert f.read() == "first\nsecond"
+
+
+def test_resume_truncates_torn_line(tmp_path):
+    with PageStreamWriter("doc", output_dir=str(tmp_path)) as writer:
+        writer.append_page(0, "first")
+    with open(writer.path, "a", encoding="utf-8") as f:
+        f.write('{"page": 1, "offs')  # Crash mid-write
+
+    with PageStreamWriter("doc", output_dir=str(tmp_path)) as resumed:
+        assert resumed.has_page(0)
+        assert not resumed.has_page(1)
+        resumed.append_page(1, "second")
+        assert resumed.pages[1]["offset"] == len("first") + 1
+
+    assert list(iter_pages(writer.path)) == [(0, "first"), (1, "second")]
+
+
+def test_restart_discards_saved_pages(tmp_path):
+    with PageStreamWriter("doc", output_dir=str(tmp_path)) as writer:
+        writer.append_page(0, "first")
+    with PageStreamWriter("doc", output_dir=str(tmp_path), restart=True) as restarted:
+        assert not restarted.pages
+
+
+def test_follow_raises_when_stream_never_finishes(tmp_path):
+    with PageStreamWriter("doc", output_dir=str(tmp_path)) as writer:
+        writer.append_page(0, "first")
+
+    pages = []
+    with pytest.raises(StreamIncomplete):
+        for page in iter_pages(writer.path, follow=True, poll_interval=0.01, timeout=0.05):
+            pages.append(page)
+    assert pages == [(0, "first")]
+
+
+def test_follow_picks_up_pages_until_done(tmp_path):
+    writer = PageStreamWriter("doc", output_dir=str(tmp_path))
+    writer.append_page(0, "first")
+
+    def finish_later():
+        time.sleep(0.05)
+        writer.append_page(1, "second")
+        writer.finish(2)
+        writer.close()
+
+    thread = threading.Thread(target=finish_later)
+    thread.start()
+    pages = list(iter_pages(writer.path, follow=True, poll_interval=0.01, timeout=5))
+    thread.join()
+    assert pages == [(0, "first"), (1, "second")]
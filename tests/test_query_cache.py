@@ -0,0 +1,56 @@
+import json
+
+from OpenAI_API.query_cache import NamespaceVersions, SemanticQueryCache
+
+
+def results(id_):
+    return [{"id": id_, "score": 0.9, "metadata": {"text": id_}}]
+
+
+def make_cache(tmp_path, **kwargs):
+    path = tmp_path / "pinecone.json"
+    path.write_text(json.dumps({"files": [], "namespace_versions": {}}))
+    return SemanticQueryCache(versions=NamespaceVersions(str(path)), **kwargs), path
+
+
+def test_exact_and_similar_hits(tmp_path):
+    cache, _ = make_cache(tmp_path, threshold=0.9)
+    cache.store("ns", "How to mix?", [1.0, 0.0], results("a"))
+
+    assert cache.lookup("ns", "how to  mix?", [0.0, 1.0]) == results("a")
+    assert cache.lookup("ns", "mixing steps", [0.99, 0.05]) == results("a")
+    assert cache.lookup("ns", "storage", [0.0, 1.0]) is None
+    assert cache.cached_embedding("ns", "HOW TO MIX?") == [1.0, 0.0]
+    assert cache.stats()["exact_hits"] == 1
+
+
+def test_reingest_invalidates_namespace(tmp_path):
+    cache, path = make_cache(tmp_path)
+    cache.store("ns", "q", [1.0, 0.0], results("a"))
+    path.write_text(json.dumps({"files": [], "namespace_versions": {"ns": 1}}))
+    # Make sure the mtime moves even on coarse filesystems
+    import os
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert cache.lookup("ns", "q", [1.0, 0.0]) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_entries_expire(tmp_path):
+    cache, _ = make_cache(tmp_path, ttl=-1)
+    cache.store("ns", "q", [1.0, 0.0], results("a"))
+    assert cache.lookup("ns", "q", [1.0, 0.0]) is None
+
+
+def test_oldest_entry_is_evicted_at_capacity(tmp_path):
+    cache, _ = make_cache(tmp_path, threshold=0.9, max_entries_per_namespace=2)
+    cache.store("ns", "a", [1.0, 0.0, 0.0], results("a"))
+    cache.store("ns", "b", [0.0, 1.0, 0.0], results("b"))
+    cache.store("ns", "b", [0.0, 1.0, 0.0], results("b2"))
+    cache.store("ns", "c", [0.0, 0.0, 1.0], results("c"))
+
+    assert cache.lookup("ns", "near a", [0.98, 0.1, 0.0]) is None
+    assert cache.lookup("ns", "near b", [0.1, 0.98, 0.0]) == results("b2")
+    assert cache.lookup("ns", "near c", [0.0, 0.1, 0.98]) == results("c")
+    assert cache.stats()["entries"] == 2
@@ -0,0 +1,37 @@
+from OpenAI_API.reranker import BM25Reranker, contains_product, product_terms, tokenize
+
+
+def match(id_, score, text):
+    return {"id": id_, "score": score, "metadata": {"text": text}}
+
+
+def test_product_terms_drop_document_type():
+    assert product_terms("DuPontMatrixLabel") == ["du", "pont", "matrix"]
+
+
+def test_contains_product_matches_whole_words_only():
+    product = product_terms("DuPontMatrixLabel")
+    assert contains_product(product, set(tokenize("DuPont Matrix herbicide")))
+    assert contains_product(product, set(tokenize("du pont matrix")))
+    assert not contains_product(product, set(tokenize("dust matrix pont")))
+
+
+def test_lexical_match_breaks_vector_tie():
+    reranked = BM25Reranker().rerank("mixing order", [
+        match("a", 0.5, "Storage and disposal"),
+        match("b", 0.5, "<HEADING>Mixing order<HEADING/> Add the product first"),
+    ])
+    assert [m["id"] for m in reranked] == ["b", "a"]
+    assert reranked[0]["vector_score"] == 0.5
+
+
+def test_cas_number_boost():
+    reranked = BM25Reranker().rerank("what is 1912-24-9", [
+        match("a", 0.6, "Composition: atrazine"),
+        match("b", 0.55, "Atrazine CAS 1912-24-9"),
+    ])
+    assert reranked[0]["id"] == "b"
+
+
+def test_empty_matches():
+    assert BM25Reranker().rerank("anything", []) == []
@@ -0,0 +1,62 @@
+import pytest
+
+from OpenAI_API.search import HybridSearch, InvalidCursor, _query_key, decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    key = _query_key("ns", "Mixing order")
+    assert decode_cursor(encode_cursor(key, 20), key) == 20
+
+
+def test_cursor_of_another_query_is_rejected():
+    cursor = encode_cursor(_query_key("ns", "mixing"), 10)
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, _query_key("ns", "storage"))
+
+
+@pytest.mark.parametrize("cursor", ["", "not-base64!", "e30"])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, _query_key("ns", "q"))
+
+
+class FakeDatabase:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def query(self, **kwargs):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+class FakeEmbeddings:
+    def embedding(self, text):
+        return {"Embedding": [0.0]}
+
+
+def hit(id_):
+    return {"id": id_, "score": 0.5, "metadata": {"text": f"text {id_}"}}
+
+
+def search_over(responses):
+    database = FakeDatabase(responses)
+    return HybridSearch(database, FakeEmbeddings(), lambda query: {"indices": [], "values": []}), database
+
+
+def test_pages_come_from_the_cached_pool():
+    search, database = search_over([[hit(str(i)) for i in range(5)]])
+    page, cursor, total, timings = search.search("ns", "q", limit=2)
+    assert [h["id"] for h in page] == ["0", "1"] and total == 5 and not timings["cached"]
+
+    page, cursor, _, timings = search.search("ns", "q", cursor=cursor, limit=2)
+    page, cursor, _, _ = search.search("ns", "q", cursor=cursor, limit=2)
+    assert len(page) == 1 and cursor is None and timings["cached"]
+    assert database.calls == 1
+
+
+def test_empty_pool_is_not_cached():
+    search, database = search_over([[], [hit("a")]])
+    assert search.search("ns", "q")[2] == 0
+    assert search.search("ns", "q")[2] == 1
+    assert database.calls == 2
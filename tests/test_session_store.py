@@ -0,0 +1,59 @@
+import sys
+import types
+
+from OpenAI_API.session_store import RedisSessionStore, SQLiteSessionStore
+
+
+class FakeRedis:
+    """Hashes in a dict, with the set_run script applied the way Redis would run it."""
+
+    def __init__(self):
+        self.hashes = {}
+
+    @classmethod
+    def from_url(cls, url, decode_responses=False):
+        return cls()
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def register_script(self, script):
+        def set_run(keys, args):
+            session = self.hashes.get(keys[0])
+            if not session or "thread_id" not in session:
+                return 0
+            session["run_id"] = args[0]
+            return 1
+        return set_run
+
+
+def redis_store(monkeypatch):
+    monkeypatch.setitem(sys.modules, "redis", types.SimpleNamespace(Redis=FakeRedis))
+    return RedisSessionStore()
+
+
+def test_sqlite_set_run_ignores_unknown_sessions(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    try:
+        store.set_run("gone", "run_1")
+        assert store.get("gone") is None
+
+        store.set_thread("s1", "thread_1")
+        store.set_run("s1", "run_1")
+        assert store.get("s1") == {"thread_id": "thread_1", "run_id": "run_1"}
+    finally:
+        store.close()
+
+
+def test_redis_set_run_does_not_recreate_an_expired_session(monkeypatch):
+    store = redis_store(monkeypatch)
+    store.set_run("gone", "run_1")
+    assert store.get("gone") is None
+    assert store._redis.hashes == {}
+
+
+def test_redis_session_without_thread_is_missing(monkeypatch):
+    store = redis_store(monkeypatch)
+    # Left behind by a set_run racing the expiry before the guard
+    store._redis.hashes[store._key("s1")] = {"run_id": "run_1"}
+    assert store.get("s1") is None
@@ -0,0 +1,77 @@
+import time
+
+import pytest
+
+from signed_tokens import RevocationList, TokenError, issue_token, verify_token
+
+SECRET = b"s" * 32
+USER = {"name": "Ada", "oid": "1", "email": "ada@example.com", "roles": ["ignored"]}
+
+
+def test_issue_and_verify():
+    claims = verify_token(issue_token(USER, 60, SECRET, "oid:1"), SECRET)
+    assert claims["sub"] == "oid:1"
+    assert claims["user"] == {"name": "Ada", "oid": "1", "email": "ada@example.com"}
+
+
+def test_tampered_token_is_rejected():
+    token = issue_token(USER, 60, SECRET, "oid:1")
+    with pytest.raises(TokenError):
+        verify_token(token, b"x" * 32)
+    header, payload, signature = token.split(".")
+    with pytest.raises(TokenError):
+        verify_token(f"{header}.{payload}x.{signature}", SECRET)
+    with pytest.raises(TokenError):
+        verify_token("not-a-token", SECRET)
+
+
+def test_expired_token_is_rejected():
+    token = issue_token(USER, 60, SECRET, "oid:1")
+    with pytest.raises(TokenError):
+        verify_token(token, SECRET, now=time.time() + 120)
+    assert verify_token(token, SECRET, now=time.time() + 120, leeway=120)
+
+
+def test_revoke_token(tmp_path):
+    revocations = RevocationList(str(tmp_path / "revoked.json"))
+    claims = verify_token(issue_token(USER, 60, SECRET, "oid:1"), SECRET)
+    other = verify_token(issue_token(USER, 60, SECRET, "oid:1"), SECRET)
+    revocations.revoke_token(claims)
+    assert revocations.is_revoked(claims)
+    assert not revocations.is_revoked(other)
+
+
+def test_revoke_user_spares_later_logins(tmp_path):
+    revocations = RevocationList(str(tmp_path / "revoked.json"))
+    before = verify_token(issue_token(USER, 60, SECRET, "oid:1"), SECRET)
+    revocations.revoke_user("oid:1")
+    time.sleep(0.002)
+    after = verify_token(issue_token(USER, 60, SECRET, "oid:1"), SECRET)
+    assert revocations.is_revoked(before)
+    assert not revocations.is_revoked(after)
+
+
+def test_concurrent_workers_keep_each_others_revocations(tmp_path):
+    path = str(tmp_path / "revoked.json")
+    worker_a, worker_b = RevocationList(path), RevocationList(path)
+    worker_a.revoke_token({"jti": "a", "exp": time.time() + 60})
+    worker_b.revoke_token({"jti": "b", "exp": time.time() + 60})
+    worker_b.revoke_user("oid:1")
+
+    worker_c = RevocationList(path)
+    worker_c.reload()
+    assert set(worker_c.tokens) == {"a", "b"}
+    assert "oid:1" in worker_c.users
+
+
+def test_purge_drops_expired_entries(tmp_path):
+    path = str(tmp_path / "revoked.json")
+    revocations = RevocationList(path, max_token_lifetime=60)
+    revocations.revoke_token({"jti": "old", "exp": time.time() - 1})
+    revocations.revoke_token({"jti": "new", "exp": time.time() + 60})
+    assert revocations.purge() == 1
+    assert revocations.purge() == 0
+
+    reloaded = RevocationList(path)
+    reloaded.reload()
+    assert set(reloaded.tokens) == {"new"}
@@ -0,0 +1,47 @@
+import pytest
+
+pytest.importorskip("langchain")
+
+from LangChain.HeaderTableTextSplitter_AWS_v2 import HeaderTableTextSplitter
+
+TABLE = "\n".join(
+    ["<TABLE EXTRACT (TABLE NUMBER = 1, PAGE NUMBER = 2)>", "['Crop', 'Rate']"]
+    + [f"['crop {i}', '{i} oz/acre']" for i in range(60)]
+    + ["<TABLE EXTRACT />"]
+)
+
+
+def document():
+    sections = []
+    for i in range(8):
+        sections.append(f"<HEADING>Section {i}<HEADING/>\n" + "Some label text here. " * 20)
+        sections.append(f"<BOLD>Note {i}<BOLD/> short")
+    sections.insert(3, TABLE)
+    return "\n".join(sections)
+
+
+def test_chunks_stay_under_max_size():
+    splitter = HeaderTableTextSplitter(target_chunk_size=400)
+    chunks = splitter.split_text(document())
+    assert chunks
+    assert all(len(chunk) <= splitter.max_chunk_size for chunk in chunks)
+
+
+def test_oversize_table_is_split_into_complete_tables():
+    splitter = HeaderTableTextSplitter(target_chunk_size=400)
+    pieces = splitter.split_text(TABLE)
+    assert len(pieces) > 1
+    for piece in pieces:
+        lines = piece.split("\n")
+        assert lines[0].startswith("<TABLE EXTRACT (TABLE NUMBER = 1")
+        assert lines[1] == "['Crop', 'Rate']"
+        assert lines[-1] == "<TABLE EXTRACT />"
+        assert len(piece) <= splitter.max_chunk_size
+
+
+def test_split_pages_matches_split_text():
+    splitter = HeaderTableTextSplitter(target_chunk_size=400)
+    text = document()
+    lines = text.split("\n")
+    pages = ["\n".join(lines[i:i + 5]) for i in range(0, len(lines), 5)]
+    assert list(splitter.split_pages(iter(pages))) == splitter.split_text("\n".join(pages))
@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+import pytest
+
+from token_store import create_token_store, user_key
+
+ADA = {"name": "Ada", "oid": "1"}
+BOB = {"name": "Bob", "oid": "2"}
+
+
+def info(user, expires_in=60):
+    return {"expiration": time.time() + expires_in, "user": user}
+
+
+def test_user_key_prefers_stable_claims():
+    assert user_key({"oid": "1", "email": "a@example.com"}) == "oid:1"
+    assert user_key({"email": "a@example.com"}) == "email:a@example.com"
+
+
+def test_add_get_remove_user(tmp_path):
+    async def scenario():
+        store = create_token_store(str(tmp_path / "tokens.json"))
+        await store.start()
+        store.add("t1", info(ADA))
+        store.add("t2", info(ADA))
+        store.add("t3", info(BOB))
+        assert store.get("t1")["user"] == ADA
+        assert store.tokens_for_user(ADA) == {"t1", "t2"}
+
+        assert sorted(store.remove_user(ADA)) == ["t1", "t2"]
+        assert store.get("t1") is None and store.get("t3") is not None
+        assert store.user_count() == 1
+        await store.stop()
+
+    asyncio.run(scenario())
+
+
+def test_expired_tokens_are_rejected_and_removed(tmp_path):
+    async def scenario():
+        store = create_token_store(str(tmp_path / "tokens.json"))
+        await store.start()
+        store.add("old", info(ADA, expires_in=-1))
+        store.add("new", info(ADA))
+        assert store.get("old") is None and store.contains("old")
+        assert store.remove_expired() == ["old"]
+        assert not store.contains("old") and store.get("new")
+        await store.stop()
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_tokens_persist_across_restarts(tmp_path, backend):
+    async def scenario():
+        store = create_token_store(str(tmp_path / "tokens.json"), backend=backend)
+        await store.start()
+        store.add("t1", info(ADA))
+        await store.stop()
+
+        reopened = create_token_store(str(tmp_path / "tokens.json"), backend=backend)
+        await reopened.start()
+        assert reopened.get("t1")["user"] == ADA
+        await reopened.stop()
+
+    asyncio.run(scenario())
+
+
+def test_json_backend_is_single_process(tmp_path):
+    pytest.importorskip("fcntl")
+
+    async def scenario():
+        first = create_token_store(str(tmp_path / "tokens.json"))
+        await first.start()
+        with pytest.raises(RuntimeError):
+            await create_token_store(str(tmp_path / "tokens.json")).start()
+        await first.stop()
+
+    asyncio.run(scenario())
+
+
+def test_sqlite_workers_share_tokens(tmp_path):
+    async def scenario():
+        worker_a = create_token_store(str(tmp_path / "tokens.json"), backend="sqlite")
+        worker_b = create_token_store(str(tmp_path / "tokens.json"), backend="sqlite")
+        await worker_a.start()
+        await worker_b.start()
+
+        await worker_a.issue("t1", info(ADA))
+        assert (await worker_b.fetch("t1"))["user"] == ADA
+        assert await worker_b.fetch("unknown") is None
+
+        # A logout on one worker reaches the other at its next sync
+        worker_b.remove("t1")
+        await worker_b.flush()
+        await worker_a.sync()
+        assert worker_a.get("t1") is None
+
+        await worker_a.stop()
+        await worker_b.stop()
+
+    asyncio.run(scenario())
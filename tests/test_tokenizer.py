@@ -0,0 +1,33 @@
+from Embeddings.tokenizer import MAX_INPUT_TOKENS, count_tokens, pack_by_tokens, truncate_to_tokens
+
+
+def test_pack_respects_input_count():
+    batches = list(pack_by_tokens(["alpha"] * 5, max_batch_inputs=2))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+
+
+def test_pack_respects_token_limit():
+    texts = ["word " * 50] * 4
+    per_text = count_tokens(texts[0])
+    batches = list(pack_by_tokens(texts, max_batch_tokens=per_text * 2))
+    assert [len(batch) for batch in batches] == [2, 2]
+
+
+def test_pack_keeps_order_and_lazy_input():
+    items = iter([("a", 1), ("b", 2), ("c", 3)])
+    batches = list(pack_by_tokens(items, text_of=lambda item: item[0]))
+    assert batches == [[("a", 1), ("b", 2), ("c", 3)]]
+
+
+def test_oversize_input_is_sent_alone():
+    big = "word " * (MAX_INPUT_TOKENS * 5)
+    batches = list(pack_by_tokens(["a", "b", big, "c"]))
+    assert batches == [["a", "b"], [big], ["c"]]
+
+
+def test_truncate_to_tokens():
+    big = "word " * (MAX_INPUT_TOKENS * 5)
+    truncated = truncate_to_tokens(big)
+    assert count_tokens(truncated) <= MAX_INPUT_TOKENS
+    assert big.startswith(truncated)
+    assert truncate_to_tokens("short text") == "short text"
@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+for module in ("dotenv", "fitz", "langchain_core", "langchain_openai", "openai", "pinecone", "rapidfuzz",
+               "textractcaller", "textractoverlayer"):
+    pytest.importorskip(module)
+
+# The clients are created at import; no request is made with these keys
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("PINECONE_API_KEY", "test")
+
+from OpenAI_API import tool_calling
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.requests = []
+
+    def embedding_batch(self, texts):
+        self.requests.append(list(texts))
+        return [{"Embedding": [float(len(text))]} for text in texts]
+
+
+def test_fan_out_queries_each_namespace_like_vectorDB_tool(monkeypatch):
+    embeddings = FakeEmbeddings()
+    searched = {}
+
+    def retrieve(question, query_text, namespace, embedding):
+        searched[namespace] = (query_text, embedding)
+        return []
+
+    monkeypatch.setattr(tool_calling, "QUERY_CACHE", False)
+    monkeypatch.setattr(tool_calling, "embedding_llm", embeddings)
+    monkeypatch.setattr(tool_calling, "checkNamespace", lambda namespace: namespace)
+    monkeypatch.setattr(tool_calling, "retrieve", retrieve)
+    monkeypatch.setattr(tool_calling, "save_vector_results", lambda entries: None)
+
+    tool_calling.multiNamespace_tool("What is the REI?", ["Alpha Label", "Alpha SDS"])
+
+    assert searched["Alpha Label"][0] == "what is the rei?. Product Name is Alpha Label"
+    assert searched["Alpha SDS"][0] == tool_calling.product_query("What is the REI?", "Alpha SDS")
+    # Both query texts go out in one embedding request
+    assert embeddings.requests == [[searched["Alpha Label"][0], searched["Alpha SDS"][0]]]
+    assert searched["Alpha Label"][1] == [float(len(searched["Alpha Label"][0]))]